@@ -18,52 +18,947 @@ Loong 的 AI Translator - 四层架构实现
 - 可读性很重要
 """
 
+import time
+
+# 进程启动时刻，用于统计启动耗时
+STARTUP_BEGIN = time.perf_counter()
+
 import sys
 import os
+import argparse
+import collections
+import csv
+import queue
+import random
 import json
-import requests
-import keyboard
-import pyttsx3
-import darkdetect
+import re
+import asyncio
 import base64
+import bisect
+import functools
+import gzip
+import hashlib
+import itertools
+import threading
+import unicodedata
+import contextlib
+import difflib
+import importlib
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote, urlsplit
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QSplitter, QTextEdit, QPushButton, 
                             QComboBox, QDialog, QFormLayout, QLineEdit, 
-                            QLabel, QMessageBox, QGroupBox)
+                            QLabel, QMessageBox, QGroupBox, QTabWidget,
+                            QToolButton, QMenu, QTextBrowser, QSystemTrayIcon,
+                            QStyle, QListWidget, QListWidgetItem)
 from PyQt6.QtCore import (Qt, QSettings, QUrl, QThread, pyqtSignal, QTimer,
-                         QSize)
+                         QSize, QObject)
 from PyQt6.QtGui import (QTextDocument, QTextCursor, QFontDatabase, QFont, 
                         QPalette, QColor, QIcon)
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.fernet import Fernet
+
+try:
+    import winsound
+except ImportError:
+    # 非Windows平台无法直接播放缓存的音频文件，朗读时直接合成
+    winsound = None
 
 # 常量定义
 APP_NAME = "Loong 的 AI Translator"
 CONFIG_FILE = "config.enc"
 SECRET_SALT = b'win11_translator_salt_2024'
 FLOMO_BASE_URL = "https://flomoapp.com/iwh/OTQ5NQ/"
+CACHE_FILE = "translation_cache.db"
+MEMORY_FILE = "translation_memory.db"
+VOCABULARY_FILE = "vocabulary.json.gz"
+HISTORY_FILE = "translation_history.db"
+GLOSSARY_FILE = "glossary.csv"
+FLOMO_QUEUE_FILE = "flomo_queue.jsonl"
+AUDIO_CACHE_DIR = "tts_cache"
+# 单实例本地套接字名称（按用户区分）
+SINGLE_INSTANCE_NAME = "loong_ai_translator_" + hashlib.sha1(
+    os.path.expanduser("~").encode("utf-8")).hexdigest()[:8]
+# 划词翻译时等待复制选中文本完成的时间（毫秒）
+CAPTURE_DELAY_MS = 150
+# 常驻模式下两次连接预热之间的最短间隔（秒）
+WARM_UP_INTERVAL = 60
+# Flomo同步失败后的重试间隔（秒），按指数退避增长
+FLOMO_RETRY_BASE = 5
+FLOMO_RETRY_MAX = 300
+# 单条笔记的最大发送次数，超过后暂停该笔记
+FLOMO_MAX_ATTEMPTS = 8
+# Flomo请求超时（连接超时, 读取超时）（秒）
+FLOMO_TIMEOUT = (10, 30)
+# 提示词模板版本，修改提示词后需要递增以使旧的缓存失效
+PROMPT_VERSION = 2
+
+
+class StartupProfiler:
+    """启动耗时统计，记录模块导入和各初始化阶段的耗时"""
+    
+    def __init__(self, origin):
+        """初始化统计器，origin 为进程启动时刻"""
+        self.origin = origin
+        self.records = []
+    
+    def record(self, name, start, end=None):
+        """记录一个阶段 (名称, 开始时刻, 结束时刻)"""
+        end = time.perf_counter() if end is None else end
+        self.records.append((name, start - self.origin, end - start))
+    
+    @contextlib.contextmanager
+    def phase(self, name):
+        """统计 with 块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+    
+    def mark(self, name):
+        """记录一个时间点"""
+        now = time.perf_counter()
+        self.record(name, now, now)
+    
+    def elapsed_ms(self, name):
+        """返回从启动到某阶段结束的毫秒数，未记录时返回 None"""
+        for record_name, offset, duration in self.records:
+            if record_name == name:
+                return (offset + duration) * 1000
+        return None
+    
+    def report(self):
+        """返回按开始时间排序的耗时报告"""
+        lines = [f"{'开始(ms)':>10}{'耗时(ms)':>10}  阶段"]
+        for name, offset, duration in sorted(self.records, key=lambda record: record[1]):
+            lines.append(f"{offset * 1000:12.1f}{duration * 1000:12.1f}  {name}")
+        return "\n".join(lines)
+
+
+STARTUP_PROFILER = StartupProfiler(STARTUP_BEGIN)
+STARTUP_PROFILER.record("import 基础模块与PyQt6", STARTUP_BEGIN)
+
+
+def lazy_import(module_name):
+    """首次使用时才导入模块，并记录导入耗时
+    
+    requests、cryptography、pyttsx3、keyboard 等依赖导入较慢，推迟到首次使用时
+    导入可以让窗口更快显示；http.server、sqlite3、QtNetwork 等只在部分功能中用到的模块也同样推迟。
+    """
+    module = sys.modules.get(module_name)
+    if module is None:
+        with STARTUP_PROFILER.phase(f"import {module_name}"):
+            module = importlib.import_module(module_name)
+    return module
+
 
 # ========================================
 # 1. 数据接口层 (API Layer)
 # ========================================
 
+class HTTPSessionPool:
+    """HTTP连接池，按 (协议+主机, SSL校验) 复用长连接会话
+    
+    会话在配置重新加载后依然保留，只有端点主机或SSL设置变化时才会使用新的会话。
+    """
+    
+    _sessions = {}
+    _lock = threading.Lock()
+    
+    @staticmethod
+    def _origin(url):
+        """提取URL的协议和主机部分"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+    
+    @classmethod
+    def get_session(cls, url, verify=True, config=None):
+        """获取指定端点的共享会话"""
+        config = config or {}
+        key = (cls._origin(url), bool(verify))
+        with cls._lock:
+            session = cls._sessions.get(key)
+            if session is None:
+                session = cls._create_session(verify, config)
+                cls._sessions[key] = session
+            return session
+    
+    @classmethod
+    def warm_up(cls, url, verify=True, config=None, timeout=5):
+        """预先建立到端点的长连接（完成DNS解析和TLS握手），失败时返回 False"""
+        session = cls.get_session(url, verify, config)
+        try:
+            session.head(cls._origin(url), timeout=timeout).close()
+            return True
+        except lazy_import("requests").RequestException:
+            return False
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _adapter_class():
+        """可取消的HTTP适配器
+        
+        连接发送请求前登记到当前线程的取消令牌（见 CancelToken.sending），取消时关闭其套接字，
+        因此等待响应头的非流式请求也能立即中断。
+        """
+        HTTPAdapter = lazy_import("requests.adapters").HTTPAdapter
+        connectionpool = lazy_import("urllib3.connectionpool")
+        
+        def cancellable(connection_class):
+            class CancellableConnection(connection_class):
+                def request(self, *args, **kwargs):
+                    # 先建立连接，使登记时已有可关闭的套接字
+                    if self.sock is None:
+                        self.connect()
+                    CancelToken.track_connection(self)
+                    return super().request(*args, **kwargs)
+            return CancellableConnection
+        
+        class HTTPPool(connectionpool.HTTPConnectionPool):
+            ConnectionCls = cancellable(connectionpool.HTTPConnectionPool.ConnectionCls)
+        
+        class HTTPSPool(connectionpool.HTTPSConnectionPool):
+            ConnectionCls = cancellable(connectionpool.HTTPSConnectionPool.ConnectionCls)
+        
+        class CancellableAdapter(HTTPAdapter):
+            def init_poolmanager(self, *args, **kwargs):
+                super().init_poolmanager(*args, **kwargs)
+                self.poolmanager.pool_classes_by_scheme = {"http": HTTPPool, "https": HTTPSPool}
+        
+        return CancellableAdapter
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _retry_class():
+        """只在服务端明确要求稍后重试时重发请求的重试策略
+        
+        POST 请求不是幂等的：502/504 时请求可能已经到达模型并开始生成（并计费），
+        因此只有带 Retry-After 的 429/503 才重发。
+        """
+        Retry = lazy_import("urllib3.util.retry").Retry
+        
+        class RetryAfterOnly(Retry):
+            def is_retry(self, method, status_code, has_retry_after=False):
+                return has_retry_after and super().is_retry(method, status_code, has_retry_after)
+        
+        return RetryAfterOnly
+    
+    @staticmethod
+    def _create_session(verify, config):
+        """创建带连接池和重试策略的会话"""
+        requests = lazy_import("requests")
+        HTTPAdapter = HTTPSessionPool._adapter_class()
+        Retry = HTTPSessionPool._retry_class()
+        
+        pool_size = int(config.get("http_pool_size", 10))
+        # 只重试连接失败和带 Retry-After 的 429/503；请求已发出后的读取超时不重试，
+        # 否则一次较慢的翻译请求可能被模型重复生成（并重复计费）
+        retry = Retry(
+            total=int(config.get("http_max_retries", 2)),
+            read=0,
+            other=0,
+            backoff_factor=float(config.get("http_backoff_factor", 0.5)),
+            status_forcelist=(429, 503),
+            allowed_methods=None,  # 允许对POST重试
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.verify = verify
+        return session
+    
+    @classmethod
+    def close_all(cls):
+        """关闭所有会话"""
+        with cls._lock:
+            sessions = list(cls._sessions.values())
+            cls._sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+class RateLimiter:
+    """按端点主机共享的令牌桶限流器"""
+    
+    _limiters = {}
+    _lock = threading.Lock()
+    
+    def __init__(self, per_minute):
+        """初始化限流器，per_minute 为每分钟允许的请求数"""
+        self.per_minute = per_minute
+        self.tokens = min(per_minute, 10)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def for_endpoint(cls, url, per_minute):
+        """获取端点对应的限流器"""
+        key = HTTPSessionPool._origin(url)
+        with cls._lock:
+            limiter = cls._limiters.get(key)
+            if limiter is None or limiter.per_minute != per_minute:
+                limiter = cls(per_minute)
+                cls._limiters[key] = limiter
+            return limiter
+    
+    def acquire(self, cancel_token=None):
+        """获取一个请求配额，配额不足时等待"""
+        rate = self.per_minute / 60.0
+        capacity = min(self.per_minute, 10)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / rate
+            
+            if cancel_token is not None:
+                if cancel_token.wait(delay):
+                    cancel_token.raise_if_cancelled()
+            else:
+                time.sleep(delay)
+
+
+class ConfigurationError(ValueError):
+    """缺少必要配置（如 API Key）"""
+
+
+class TranslationCancelled(Exception):
+    """翻译请求已被取消"""
+
+
+class CancelToken:
+    """请求取消令牌，取消时中断正在发送的请求和绑定的HTTP响应"""
+    
+    # 当前线程正在发送请求的令牌及其登记的连接
+    _local = threading.local()
+    
+    def __init__(self):
+        """初始化取消令牌"""
+        self._event = threading.Event()
+        self._responses = set()
+        self._connections = set()
+        self._callbacks = []
+        self._lock = threading.Lock()
+    
+    @property
+    def cancelled(self):
+        """是否已取消"""
+        return self._event.is_set()
+    
+    def raise_if_cancelled(self):
+        """已取消时抛出 TranslationCancelled"""
+        if self._event.is_set():
+            raise TranslationCancelled("翻译已取消")
+    
+    def wait(self, timeout):
+        """等待至多 timeout 秒，返回期间是否被取消"""
+        return self._event.wait(timeout)
+    
+    def bind(self, response):
+        """绑定正在接收的响应，取消时关闭其连接"""
+        with self._lock:
+            self._responses.add(response)
+        if self.cancelled:
+            self._abort(response)
+    
+    def unbind(self, response):
+        """解除响应绑定"""
+        with self._lock:
+            self._responses.discard(response)
+    
+    @contextlib.contextmanager
+    def sending(self):
+        """在当前线程发送请求期间，把建立的连接登记到本令牌，取消时关闭连接"""
+        previous = getattr(self._local, "token", None), getattr(self._local, "connections", None)
+        self._local.token, self._local.connections = self, []
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._connections.difference_update(self._local.connections)
+            self._local.token, self._local.connections = previous
+    
+    @classmethod
+    def track_connection(cls, connection):
+        """登记当前线程即将发送请求的连接，未在 sending() 中时忽略"""
+        token = getattr(cls._local, "token", None)
+        if token is None:
+            return
+        with token._lock:
+            token._connections.add(connection)
+        cls._local.connections.append(connection)
+        if token.cancelled:
+            cls._shutdown(getattr(connection, "sock", None))
+    
+    def add_callback(self, callback):
+        """注册取消时调用的回调，已取消时立即调用"""
+        with self._lock:
+            self._callbacks.append(callback)
+        if self.cancelled:
+            callback()
+    
+    def remove_callback(self, callback):
+        """移除取消回调"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+    
+    def cancel(self):
+        """取消请求并立即中断所有正在接收的响应"""
+        self._event.set()
+        with self._lock:
+            responses = list(self._responses)
+            connections = list(self._connections)
+            callbacks = list(self._callbacks)
+        for connection in connections:
+            self._shutdown(getattr(connection, "sock", None))
+        for response in responses:
+            self._abort(response)
+        for callback in callbacks:
+            callback()
+    
+    @staticmethod
+    def _shutdown(sock):
+        """关闭套接字的读写，使阻塞中的发送或读取立即返回"""
+        if sock is None:
+            return
+        try:
+            sock.shutdown(lazy_import("socket").SHUT_RDWR)
+        except OSError:
+            pass
+    
+    @classmethod
+    def _abort(cls, response):
+        """关闭响应的底层套接字，使阻塞中的读取立即返回"""
+        try:
+            raw = response.raw
+            connection = getattr(raw, "_connection", None) or getattr(raw, "connection", None)
+            cls._shutdown(getattr(connection, "sock", None))
+        except AttributeError:
+            pass
+        try:
+            response.close()
+        except Exception:
+            pass
+
+
+class TranslationPayloadParser:
+    """翻译结果的增量容错解析器
+    
+    按 {"translation": ..., "vocabulary": [...]} 结构逐段解析模型输出：
+    translation 字段在接收过程中即可取得部分内容，vocabulary 中的条目每完整接收一个就产出一个；
+    输出被截断或局部损坏时，close() 会尽量保留已解析出的有效前缀。
+    """
+    
+    def __init__(self):
+        """初始化解析器"""
+        self.buffer = ""
+        self.pos = 0
+        self.state = "start"
+        self.key = None
+        self.value_start = 0
+        self.translation = None
+        self.partial_translation = ""
+        self.vocabulary = []
+        self.extra = {}
+        self.recovered = False
+        self.decoder = json.JSONDecoder(strict=False)
+    
+    def feed(self, chunk):
+        """追加一段输出，返回新产生的事件列表 [(事件类型, 值), ...]
+        
+        事件类型: translation_partial / translation / vocabulary
+        """
+        self.buffer += chunk
+        events = []
+        while self._step(events):
+            pass
+        return events
+    
+    def _skip(self, chars):
+        """跳过指定字符，返回当前位置的字符，数据不足时返回 None"""
+        buffer = self.buffer
+        while self.pos < len(buffer) and buffer[self.pos] in chars:
+            self.pos += 1
+        return buffer[self.pos] if self.pos < len(buffer) else None
+    
+    def _step(self, events):
+        """推进一步解析，返回是否可以继续"""
+        if self.state == "start":
+            index = self.buffer.find("{", self.pos)
+            if index < 0:
+                self.pos = len(self.buffer)
+                return False
+            self.pos = index + 1
+            self.state = "key"
+            return True
+        
+        if self.state == "key":
+            char = self._skip(" \t\r\n,")
+            if char is None:
+                return False
+            if char == "}":
+                self.pos += 1
+                self.state = "done"
+                return False
+            if char != '"':
+                # 跳过无法识别的字符
+                self.pos += 1
+                self.recovered = True
+                return True
+            try:
+                self.key, self.pos = json.decoder.scanstring(self.buffer, self.pos + 1, False)
+            except json.JSONDecodeError:
+                return False
+            self.state = "colon"
+            return True
+        
+        if self.state == "colon":
+            char = self._skip(" \t\r\n")
+            if char is None:
+                return False
+            self.pos += 1
+            if char == ":":
+                self.state = "value"
+            else:
+                self.recovered = True
+            return True
+        
+        if self.state == "value":
+            char = self._skip(" \t\r\n")
+            if char is None:
+                return False
+            if self.key == "translation" and char == '"':
+                self.value_start = self.pos + 1
+                self.state = "string"
+                return True
+            if self.key == "vocabulary" and char == "[":
+                self.pos += 1
+                self.state = "array"
+                return True
+            try:
+                value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                return False
+            self.extra[self.key] = value
+            self.state = "key"
+            return True
+        
+        if self.state == "string":
+            try:
+                value, self.pos = json.decoder.scanstring(self.buffer, self.value_start, False)
+            except json.JSONDecodeError:
+                partial = self._decode_partial(self.buffer[self.value_start:])
+                if partial != self.partial_translation:
+                    self.partial_translation = partial
+                    events.append(("translation_partial", partial))
+                return False
+            self.translation = self.partial_translation = value
+            events.append(("translation", value))
+            self.state = "key"
+            return True
+        
+        if self.state == "array":
+            char = self._skip(" \t\r\n,")
+            if char is None:
+                return False
+            if char == "]":
+                self.pos += 1
+                self.state = "key"
+                return True
+            if char != "{":
+                self.pos += 1
+                self.recovered = True
+                return True
+            try:
+                entry, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                return False
+            self.vocabulary.append(entry)
+            events.append(("vocabulary", entry))
+            return True
+        
+        return False
+    
+    @staticmethod
+    def _decode_partial(raw):
+        """解码未结束的JSON字符串片段"""
+        # 去掉末尾不完整的转义序列
+        raw = re.sub(r"\\u[0-9a-fA-F]{0,3}$", "", raw)
+        trailing = len(raw) - len(raw.rstrip("\\"))
+        if trailing % 2:
+            raw = raw[:-1]
+        try:
+            return json.loads(f'"{raw}"', strict=False)
+        except json.JSONDecodeError:
+            return raw
+    
+    def _recover_vocabulary(self):
+        """跳过损坏的词汇条目，继续提取其后完整的条目"""
+        index = self.buffer.find("{", self.pos + 1)
+        while index >= 0:
+            try:
+                entry, end = self.decoder.raw_decode(self.buffer, index)
+            except json.JSONDecodeError:
+                index = self.buffer.find("{", index + 1)
+                continue
+            if isinstance(entry, dict):
+                self.vocabulary.append(entry)
+            index = self.buffer.find("{", end)
+    
+    def close(self):
+        """结束解析并返回结果，尽量保留截断或损坏输出中的有效部分"""
+        if self.state == "start":
+            raise ValueError(f"JSON解析失败: 未找到JSON对象\n返回内容: {self.buffer}")
+        
+        if self.state != "done":
+            self.recovered = True
+            if self.state == "string":
+                self.translation = self._decode_partial(self.buffer[self.value_start:])
+            elif self.state == "array":
+                self._recover_vocabulary()
+        
+        translation = self.translation
+        if translation is None:
+            translation = self.extra.get("translation", "")
+        vocabulary = [entry for entry in self.vocabulary if isinstance(entry, dict)]
+        
+        if not translation and not vocabulary and not self.extra:
+            raise ValueError(f"JSON解析失败: 未找到翻译内容\n返回内容: {self.buffer}")
+        
+        translation_data = dict(self.extra)
+        # 保留原始值，非字符串的译文由 TranslationSchema.validate 拒绝并触发修复请求
+        translation_data["translation"] = translation
+        translation_data["vocabulary"] = vocabulary
+        if self.recovered:
+            translation_data["recovered"] = True
+        return translation_data
+
+
+class TranslationSchema:
+    """翻译结果的类型约束：生成供服务端JSON模式使用的 JSON Schema，并校验模型输出
+    
+    单语言结果为 {"translation": str, "vocabulary": [词汇条目]}，
+    多语言结果为 {"translations": {语言: str}, "vocabulary": [词汇条目]}，
+    词汇条目为 {"word": str, "phonetic": str, "meanings": [{"definition": str, "example": str}]}。
+    """
+    
+    @staticmethod
+    def _object(properties):
+        """所有字段都必填且不允许额外字段的对象类型"""
+        return {
+            "type": "object",
+            "properties": properties,
+            "required": list(properties),
+            "additionalProperties": False
+        }
+    
+    @classmethod
+    def json_schema(cls, plan, languages=None, segments=None):
+        """按词汇分析规格生成结果的 JSON Schema
+        
+        languages 非空时为多语言结果，segments 非空时为逐句翻译结果 {"translations": [译文]}。
+        """
+        count, meanings, examples = plan
+        string = {"type": "string"}
+        
+        if segments:
+            properties = {"translations": {"type": "array", "items": string}}
+        elif languages:
+            properties = {"translations": cls._object({language: string for language in languages})}
+        else:
+            properties = {"translation": string}
+        
+        if count:
+            meaning = {"definition": string}
+            if examples:
+                meaning["example"] = string
+            entry = cls._object({
+                "word": string,
+                "phonetic": string,
+                "meanings": {"type": "array", "items": cls._object(meaning)}
+            })
+            properties["vocabulary"] = {"type": "array", "items": entry}
+        return cls._object(properties)
+    
+    @staticmethod
+    def _clean_entry(entry):
+        """规范化词汇条目，无法使用时返回 None"""
+        if not isinstance(entry, dict) or not isinstance(entry.get("word"), str) or not entry["word"].strip():
+            return None
+        
+        meanings = []
+        raw_meanings = entry.get("meanings")
+        for meaning in raw_meanings if isinstance(raw_meanings, list) else []:
+            if isinstance(meaning, dict) and meaning.get("definition") not in (None, ""):
+                meanings.append({
+                    "definition": str(meaning["definition"]),
+                    "example": str(meaning.get("example") or "")
+                })
+        
+        phonetic = entry.get("phonetic")
+        return {
+            "word": entry["word"].strip(),
+            "phonetic": phonetic if isinstance(phonetic, str) else "",
+            "meanings": meanings
+        }
+    
+    @classmethod
+    def validate(cls, data, languages=None, segments=None):
+        """校验并规范化解析后的结果，返回 (结果, 是否做过本地修复)
+        
+        译文缺失或类型错误时抛出 ValueError；类型不符的词汇条目和字段会被修正或丢弃。
+        segments 为逐句翻译时的句子数，译文条数必须与之相同。
+        """
+        if segments:
+            translations = data.get("translations")
+            if not isinstance(translations, list):
+                raise ValueError("缺少 translations 数组")
+            if len(translations) != segments:
+                raise ValueError(f"translations 应有 {segments} 条译文，实际为 {len(translations)} 条")
+            if not all(isinstance(item, str) and item.strip() for item in translations):
+                raise ValueError("translations 中有空的译文")
+        elif languages:
+            translations = data.get("translations")
+            if not isinstance(translations, dict):
+                raise ValueError("缺少 translations 字段")
+            missing = [language for language in languages
+                       if not isinstance(translations.get(language), str) or not translations[language].strip()]
+            if missing:
+                raise ValueError(f"缺少以下语言的译文: {'、'.join(missing)}")
+        else:
+            translation = data.get("translation")
+            if not isinstance(translation, str) or not translation.strip():
+                raise ValueError("translation 字段缺失或为空")
+        
+        raw_vocabulary = data.get("vocabulary", [])
+        if not isinstance(raw_vocabulary, list):
+            raw_vocabulary = []
+        vocabulary = [entry for entry in map(cls._clean_entry, raw_vocabulary) if entry is not None]
+        repaired = len(vocabulary) != len(raw_vocabulary) or not isinstance(data.get("vocabulary", []), list)
+        
+        result = dict(data)
+        result["vocabulary"] = vocabulary
+        return result, repaired
+
+
+def estimate_tokens(text):
+    """粗略估算文本的token数：中日韩字符按1个计，其余字符按4个计1个"""
+    cjk = len(re.findall(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff]", text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class PromptBuilder:
+    """提示词构建器，生成紧凑的翻译提示词并估算请求的token用量
+    
+    词汇分析的数量和详细程度由配置项 vocabulary_mode 决定：
+    auto - 按原文长度自动调整；full - 较多单词，多个释义并附例句；
+    brief - 少量单词，单个释义；none - 只翻译，输出最短、速度最快。
+    """
+    
+    VOCABULARY_MODES = ("auto", "full", "brief", "none")
+    # 自动模式的词汇分析规格：(原文token上限, 词汇数量, 每词释义数, 是否附例句)
+    AUTO_LEVELS = (
+        (8, 2, 3, True),
+        (80, 5, 2, True),
+        (400, 8, 1, True),
+        (None, 10, 1, False),
+    )
+    # 固定模式的词汇分析规格：(词汇数量, 每词释义数, 是否附例句)
+    FIXED_PLANS = {
+        "full": (12, 2, True),
+        "brief": (5, 1, False),
+        "none": (0, 0, False),
+    }
+    # 估算输出token时每个词汇条目、释义和例句的平均token数
+    ENTRY_TOKENS = 15
+    DEFINITION_TOKENS = 12
+    EXAMPLE_TOKENS = 20
+    
+    def __init__(self, config):
+        """初始化提示词构建器"""
+        self.config = config
+    
+    def vocabulary_plan(self, input_text, mode=None):
+        """返回词汇分析规格 (词汇数量, 每词释义数, 是否附例句)"""
+        mode = mode or self.config.get("vocabulary_mode", "auto")
+        if mode in self.FIXED_PLANS:
+            return self.FIXED_PLANS[mode]
+        
+        tokens = estimate_tokens(input_text)
+        for limit, count, meanings, examples in self.AUTO_LEVELS:
+            if limit is None or tokens <= limit:
+                return count, meanings, examples
+    
+    @staticmethod
+    def _vocabulary_schema(plan):
+        """返回 (vocabulary 字段示例, 词汇要求说明)，不需要词汇分析时返回 (None, "")"""
+        count, meanings, examples = plan
+        if count == 0:
+            return None, ""
+        
+        meaning = '{"definition":"释义","example":"例句"}' if examples else '{"definition":"释义"}'
+        schema = f'"vocabulary":[{{"word":"单词或词组","phonetic":"音标","meanings":[{meaning}]}}]'
+        instruction = f"vocabulary选出最值得学习的至多{count}个单词或词组，每个至多{meanings}个释义"
+        instruction += "并附例句。" if examples else "，不要例句。"
+        return schema, instruction
+    
+    def _build(self, input_text, fields, description, plan, languages, context="", reference=None,
+               known_words=None, glossary=None):
+        """组装提示词并估算token用量，返回 (提示词, 估算用量)
+        
+        context 为仅供理解语境、不需要翻译的上下文；reference 为相似原文的已有翻译 (原文, 译文)；
+        known_words 为用户已掌握、词汇分析中不需要再解释的单词；glossary 为原文中出现的术语表条目。
+        """
+        vocabulary, instruction = self._vocabulary_schema(plan)
+        if vocabulary:
+            fields.append(vocabulary)
+            if known_words:
+                instruction += f"用户已掌握这些单词，vocabulary中不要包含：{', '.join(known_words)}。"
+        lines = [f"{description}，只返回如下格式的JSON，不要其他内容：", f"{{{','.join(fields)}}}"]
+        if instruction:
+            lines.append(instruction)
+        if context:
+            lines += ["上下文（仅供理解语境，不要翻译）：", context]
+        if reference:
+            lines += ["相似原文的已有翻译（可参考其用词）：", f"原文：{reference[0]}", f"译文：{reference[1]}"]
+        if glossary:
+            lines.append("术语表（必须使用以下译法）：")
+            lines += [f"{entry['source']} → {entry['target']}"
+                      + (f"（{entry['language']}）" if languages > 1 and entry["language"] else "")
+                      for entry in glossary]
+        prompt = "\n".join(lines + ["原文：", input_text])
+        return prompt, self.estimate(prompt, input_text, plan, languages)
+    
+    def translation_prompt(self, input_text, target_language, mode=None, reference=None,
+                           known_words=None, glossary=None):
+        """单语言翻译提示词，reference 为相似原文的已有翻译 (原文, 译文)，返回 (提示词, 估算用量)"""
+        plan = self.vocabulary_plan(input_text, mode)
+        return self._build(input_text, ['"translation":"译文"'],
+                           f"将原文翻译成{target_language}", plan, 1, reference=reference,
+                           known_words=known_words, glossary=glossary)
+    
+    def multi_translation_prompt(self, input_text, target_languages, mode=None, known_words=None,
+                                 glossary=None):
+        """多语言合并翻译提示词，返回 (提示词, 估算用量)"""
+        plan = self.vocabulary_plan(input_text, mode)
+        example = ",".join(f'"{language}":"{language}译文"' for language in target_languages)
+        return self._build(input_text, [f'"translations":{{{example}}}'],
+                           f"将原文分别翻译成{'、'.join(target_languages)}", plan,
+                           len(target_languages), known_words=known_words, glossary=glossary)
+    
+    def segment_translation_prompt(self, segments, context, target_language, mode=None,
+                                   known_words=None, glossary=None):
+        """逐句翻译提示词，context 为相邻的未改动句子，返回 (提示词, 估算用量)"""
+        plan = self.vocabulary_plan(" ".join(segments), mode)
+        input_text = "\n".join(f"{index}. {segment}" for index, segment in enumerate(segments, 1))
+        return self._build(input_text, ['"translations":["第1句译文","第2句译文"]'],
+                           f"将原文中编号的{len(segments)}个句子分别翻译成{target_language}，"
+                           f"translations按编号顺序与句子一一对应", plan, 1, "\n".join(context),
+                           known_words=known_words, glossary=glossary)
+    
+    def response_schema(self, input_text, mode=None, languages=None, segments=None):
+        """与提示词对应的结果 JSON Schema"""
+        return TranslationSchema.json_schema(self.vocabulary_plan(input_text, mode), languages,
+                                             segments)
+    
+    def estimate(self, prompt, input_text, plan, languages=1):
+        """估算输入和输出token数"""
+        count, meanings, examples = plan
+        per_entry = self.ENTRY_TOKENS + meanings * (
+            self.DEFINITION_TOKENS + (self.EXAMPLE_TOKENS if examples else 0))
+        translation = int(estimate_tokens(input_text) * 1.3) + 10
+        return {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": translation * languages + count * per_entry
+        }
+
+
 class TranslationAPI:
-    """翻译API接口类，负责与外部翻译服务通信"""
+    """翻译API接口类，负责与外部翻译服务通信
+    
+    模型输出按 TranslationSchema 校验，无效时发送修复请求（至多 json_max_retries 次）；
+    配置项 response_format 为 json_object 或 json_schema 时启用服务端的JSON模式。
+    """
+    
+    # 进程内累计的结构化输出统计
+    _stats = {
+        "responses": 0,
+        "invalid": 0,
+        "locally_repaired": 0,
+        "retries": 0,
+        "retry_prompt_tokens": 0,
+        "retry_completion_tokens": 0,
+        "failures": 0,
+        "response_format_unsupported": 0
+    }
+    _stats_lock = threading.Lock()
+    # 端点不支持的可选参数 (端点, 参数名)
+    _unsupported_parameters = set()
+    # 400 错误信息中指向各可选参数的关键词
+    OPTIONAL_PARAMETERS = {
+        "response_format": ("response_format", "json_object", "json_schema"),
+        "stream_options": ("stream_options", "include_usage"),
+    }
     
     def __init__(self, config):
         """初始化翻译API"""
         self.config = config
+        self.prompt_builder = PromptBuilder(config)
+    
+    @classmethod
+    def _record(cls, **counts):
+        """累加结构化输出统计"""
+        with cls._stats_lock:
+            for name, value in counts.items():
+                cls._stats[name] += value
     
-    def translate(self, input_text, target_language):
-        """执行翻译请求"""
+    @classmethod
+    def validation_stats(cls):
+        """返回结构化输出统计，包含无效率和最终失败率"""
+        with cls._stats_lock:
+            stats = dict(cls._stats)
+        responses = stats["responses"]
+        stats["invalid_rate"] = stats["invalid"] / responses if responses else 0.0
+        requests = responses - stats["retries"]
+        stats["failure_rate"] = stats["failures"] / requests if requests > 0 else 0.0
+        return stats
+    
+    def _response_format(self, api_endpoint, response_schema):
+        """按配置生成 response_format 参数，未启用或端点不支持时返回 None"""
+        mode = self.config.get("response_format", "off")
+        if mode not in ("json_object", "json_schema") or response_schema is None:
+            return None
+        if (api_endpoint, "response_format") in self._unsupported_parameters:
+            return None
+        if mode == "json_schema":
+            return {
+                "type": "json_schema",
+                "json_schema": {"name": "translation_result", "strict": True, "schema": response_schema}
+            }
+        return {"type": "json_object"}
+    
+    def _build_request(self, prompt, response_schema=None, repair=None):
+        """构建聊天补全请求，返回 (端点, 请求头, 请求数据)
+        
+        response_schema 为结果的 JSON Schema，用于服务端JSON模式；
+        repair 为 (上次的输出, 错误说明)，要求模型修正上次的输出。
+        """
         api_key = self.config.get("api_key", "")
         api_endpoint = self.config.get("api_endpoint", "https://api.example.com/v1/chat/completions")
         model = self.config.get("model", "gpt-3.5-turbo")
-        skip_ssl_check = self.config.get("skip_ssl_check", False)
         
         if not api_key:
-            raise ValueError("请先在设置中配置AI API Key")
+            raise ConfigurationError("请先在设置中配置AI API Key")
         
         # 构建请求数据
         headers = {
@@ -76,61 +971,320 @@ class TranslationAPI:
         else:
             headers["Authorization"] = f"Bearer {api_key}"
         
-        # 构建提示词，明确要求返回JSON格式
-        prompt = f"""
-        请将以下文本从源语言翻译成{target_language}。请严格按照以下JSON格式返回结果，不要添加任何额外的文本或解释：
-        
-        {{
-          "translation": "翻译后的文本", 
-          "vocabulary": [
-            {{"word": "单词或词组", "phonetic": "音标", "meanings": [
-              {{"definition": "含义1", "example": "例句1"}},
-              {{"definition": "含义2", "example": "例句2"}}
-            ]}}
-          ]
-        }}
-        
-        原文: {input_text}
-        """
+        messages = [{"role": "user", "content": prompt}]
+        if repair is not None:
+            content, error = repair
+            messages.append({"role": "assistant", "content": content})
+            messages.append({"role": "user", "content": f"上面的输出无效（{error}），请只返回符合要求格式的JSON。"})
         
         data = {
             "model": model,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": messages,
             "temperature": 0.7
         }
         
-        # 发送请求
-        if skip_ssl_check:
-            response = requests.post(api_endpoint, headers=headers, json=data, verify=False)
+        response_format = self._response_format(api_endpoint, response_schema)
+        if response_format:
+            data["response_format"] = response_format
+        
+        return api_endpoint, headers, data
+    
+    @staticmethod
+    def _usage(result, prompt, content, estimate=None):
+        """返回本次请求的token用量，服务端未返回时按文本长度估算
+        
+        estimate 为发送前的估算用量，记录为 estimated_prompt_tokens / estimated_completion_tokens。
+        """
+        usage = result.get("usage") if isinstance(result, dict) else None
+        if usage and "prompt_tokens" in usage:
+            actual = {
+                "prompt_tokens": usage.get("prompt_tokens", 0),
+                "completion_tokens": usage.get("completion_tokens", 0)
+            }
         else:
-            response = requests.post(api_endpoint, headers=headers, json=data)
+            actual = {
+                "prompt_tokens": estimate_tokens(prompt),
+                "completion_tokens": estimate_tokens(content),
+                "estimated": True
+            }
+        if estimate:
+            actual["estimated_prompt_tokens"] = estimate["prompt_tokens"]
+            actual["estimated_completion_tokens"] = estimate["completion_tokens"]
+        return actual
+    
+    def _timeout(self):
+        """请求超时设置 (连接超时, 读取超时)"""
+        return (10, float(self.config.get("request_timeout", 120)))
+    
+    def _get_session(self, api_endpoint):
+        """获取端点对应的共享会话"""
+        skip_ssl_check = self.config.get("skip_ssl_check", False)
+        return HTTPSessionPool.get_session(api_endpoint, verify=not skip_ssl_check, config=self.config)
+    
+    def warm_up(self):
+        """预热到API端点的连接，未配置API Key时跳过"""
+        if not self.config.get("api_key"):
+            return False
+        api_endpoint = self.config.get("api_endpoint", "https://api.example.com/v1/chat/completions")
+        skip_ssl_check = self.config.get("skip_ssl_check", False)
+        return HTTPSessionPool.warm_up(api_endpoint, verify=not skip_ssl_check,
+                                       config=self.config, timeout=self._timeout()[0])
+    
+    def _parse_content(self, content):
+        """解析模型返回的翻译内容"""
+        parser = TranslationPayloadParser()
+        parser.feed(content)
+        return parser.close()
+    
+    def _post(self, api_endpoint, headers, data, cancel_token):
+        """发送请求并绑定取消令牌"""
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         
-        response.raise_for_status()
+        # 按端点限流
+        per_minute = int(self.config.get("rate_limit_per_minute", 60))
+        if per_minute > 0:
+            RateLimiter.for_endpoint(api_endpoint, per_minute).acquire(cancel_token)
+        
+        # 发送请求（复用连接池中的长连接）
+        # 等待响应头期间也可取消：连接在发送前登记到取消令牌
+        session = self._get_session(api_endpoint)
+        try:
+            with cancel_token.sending() if cancel_token is not None else contextlib.nullcontext():
+                response = session.post(api_endpoint, headers=headers, json=data, stream=True,
+                                        timeout=self._timeout())
+        except lazy_import("requests").RequestException:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            raise
+        
+        if cancel_token is not None:
+            cancel_token.bind(response)
+            cancel_token.raise_if_cancelled()
+        
+        # 端点不支持 response_format 或 stream_options 时去掉该参数重试，之后不再发送；
+        # 其他原因的 400（如提示词过长、模型名错误）照常返回错误
+        parameter = self._rejected_parameter(response, data) if response.status_code == 400 else None
+        if parameter is not None:
+            response.close()
+            if cancel_token is not None:
+                cancel_token.unbind(response)
+            self._unsupported_parameters.add((api_endpoint, parameter))
+            if parameter == "response_format":
+                self._record(response_format_unsupported=1)
+            data = {key: value for key, value in data.items() if key != parameter}
+            return self._post(api_endpoint, headers, data, cancel_token)
+        return response
+    
+    @classmethod
+    def _rejected_parameter(cls, response, data):
+        """400 响应的错误信息指向的、请求中带有的可选参数，不是可选参数导致的错误时返回 None"""
+        try:
+            body = response.text.lower()
+        except Exception:
+            return None
+        for parameter, markers in cls.OPTIONAL_PARAMETERS.items():
+            if parameter in data and any(marker in body for marker in markers):
+                return parameter
+        return None
+    
+    def _complete(self, prompt, cancel_token=None, estimate=None, response_schema=None, repair=None):
+        """发送非流式请求，返回 (模型输出内容, token用量)"""
+        api_endpoint, headers, data = self._build_request(prompt, response_schema, repair)
+        
+        response = self._post(api_endpoint, headers, data, cancel_token)
+        try:
+            response.raise_for_status()
+            
+            # 解析响应
+            result = response.json()
+            content = result["choices"][0]["message"]["content"]
+        except Exception:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            raise
+        finally:
+            response.close()
+            if cancel_token is not None:
+                cancel_token.unbind(response)
+        
+        return content, self._usage(result, prompt, content, estimate)
+    
+    def _validated(self, content, usage, prompt, cancel_token, response_schema, languages=None,
+                   segments=None):
+        """解析并校验模型输出，无效时发送修复请求，返回附带 usage 的结果
+        
+        修复请求至多 json_max_retries 次（默认 1），仍然无效时抛出 ValueError。
+        """
+        max_retries = max(0, int(self.config.get("json_max_retries", 1)))
+        for attempt in range(max_retries + 1):
+            try:
+                translation_data, repaired = TranslationSchema.validate(
+                    self._parse_content(content), languages, segments
+                )
+            except ValueError as e:
+                self._record(responses=1, invalid=1)
+                if attempt == max_retries:
+                    self._record(failures=1)
+                    raise
+                
+                # 错误说明只取第一行，不重复附带原始输出
+                error = str(e).splitlines()[0]
+                content, retry_usage = self._complete(prompt, cancel_token,
+                                                      response_schema=response_schema,
+                                                      repair=(content, error))
+                self._record(retries=1,
+                             retry_prompt_tokens=retry_usage["prompt_tokens"],
+                             retry_completion_tokens=retry_usage["completion_tokens"])
+                usage = dict(usage,
+                             prompt_tokens=usage["prompt_tokens"] + retry_usage["prompt_tokens"],
+                             completion_tokens=usage["completion_tokens"] + retry_usage["completion_tokens"],
+                             retries=attempt + 1)
+                continue
+            
+            self._record(responses=1, locally_repaired=1 if repaired else 0)
+            translation_data["usage"] = usage
+            return translation_data
+    
+    def translate(self, input_text, target_language, cancel_token=None, vocabulary_mode=None,
+                  reference=None, known_words=None, glossary=None):
+        """执行翻译请求，返回的数据中 usage 为本次请求的token用量
+        
+        vocabulary_mode 为空时使用配置项 vocabulary_mode；reference 为供模型参考的相似原文的已有翻译；
+        known_words 为词汇分析中不需要再解释的单词；glossary 为必须使用的术语译法。
+        """
+        prompt, estimate = self.prompt_builder.translation_prompt(input_text, target_language,
+                                                                  vocabulary_mode, reference,
+                                                                  known_words, glossary)
+        response_schema = self.prompt_builder.response_schema(input_text, vocabulary_mode)
+        content, usage = self._complete(prompt, cancel_token, estimate, response_schema)
+        return self._validated(content, usage, prompt, cancel_token, response_schema)
+    
+    def translate_multi(self, input_text, target_languages, cancel_token=None, vocabulary_mode=None,
+                        known_words=None, glossary=None):
+        """在一次请求中翻译为多个目标语言
+        
+        返回 {"translations": {语言: 译文}, "vocabulary": [...], "usage": {...}}
+        """
+        prompt, estimate = self.prompt_builder.multi_translation_prompt(input_text, target_languages,
+                                                                        vocabulary_mode, known_words,
+                                                                        glossary)
+        response_schema = self.prompt_builder.response_schema(input_text, vocabulary_mode,
+                                                               target_languages)
+        content, usage = self._complete(prompt, cancel_token, estimate, response_schema)
+        translation_data = self._validated(content, usage, prompt, cancel_token, response_schema,
+                                           target_languages)
+        translations = translation_data["translations"]
+        
+        return {
+            "translations": {language: translations[language] for language in target_languages},
+            "vocabulary": translation_data["vocabulary"],
+            "usage": translation_data["usage"]
+        }
+    
+    def translate_segments(self, segments, context, target_language, cancel_token=None,
+                           vocabulary_mode=None, known_words=None, glossary=None):
+        """逐句翻译 segments，context 为仅供参考的相邻句子
+        
+        返回 {"translations": [与 segments 一一对应的译文], "vocabulary": [...], "usage": {...}}
+        """
+        prompt, estimate = self.prompt_builder.segment_translation_prompt(segments, context,
+                                                                          target_language,
+                                                                          vocabulary_mode,
+                                                                          known_words, glossary)
+        response_schema = self.prompt_builder.response_schema(" ".join(segments), vocabulary_mode,
+                                                               segments=len(segments))
+        content, usage = self._complete(prompt, cancel_token, estimate, response_schema)
+        translation_data = self._validated(content, usage, prompt, cancel_token, response_schema,
+                                           segments=len(segments))
+        return {
+            "translations": translation_data["translations"],
+            "vocabulary": translation_data["vocabulary"],
+            "usage": translation_data["usage"]
+        }
+    
+    def translate_stream(self, input_text, target_language, on_event=None, cancel_token=None,
+                         vocabulary_mode=None, reference=None, known_words=None, glossary=None):
+        """以流式方式执行翻译请求
         
-        # 解析响应
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
+        每收到一段内容调用 on_event("delta", 文本)，随后对解析出的结果调用
+        on_event("translation_partial" / "translation" / "vocabulary", 值)。
+        """
+        prompt, estimate = self.prompt_builder.translation_prompt(input_text, target_language,
+                                                                  vocabulary_mode, reference,
+                                                                  known_words, glossary)
+        response_schema = self.prompt_builder.response_schema(input_text, vocabulary_mode)
+        api_endpoint, headers, data = self._build_request(prompt, response_schema)
+        data["stream"] = True
+        # 要求在最后一个数据块中返回实际的token用量，端点不支持时按文本长度估算
+        if (api_endpoint, "stream_options") not in self._unsupported_parameters:
+            data["stream_options"] = {"include_usage": True}
+        
+        parser = TranslationPayloadParser()
         
-        # 清理返回内容，移除可能的markdown代码块标记
-        content = content.strip()
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.endswith("```"):
-            content = content[:-3]
+        def receive(delta):
+            events = parser.feed(delta)
+            if on_event:
+                on_event("delta", delta)
+                for kind, value in events:
+                    on_event(kind, value)
+        
+        response = self._post(api_endpoint, headers, data, cancel_token)
         
-        # 解析JSON
         try:
-            translation_data = json.loads(content)
-        except json.JSONDecodeError as e:
-            # 如果JSON解析失败，抛出异常
-            raise ValueError(f"JSON解析失败: {str(e)}\n返回内容: {content}")
+            response.raise_for_status()
+            
+            # 服务端不支持流式时会直接返回完整JSON
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                result = response.json()
+                receive(result["choices"][0]["message"]["content"])
+                usage = self._usage(result, prompt, parser.buffer, estimate)
+                return self._validated_stream(parser.buffer, usage, prompt, cancel_token,
+                                              response_schema, on_event)
+            
+            # 解析SSE数据流
+            response.encoding = "utf-8"
+            result = None
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                
+                chunk = json.loads(payload)
+                # 用量在最后一个 choices 为空的数据块中返回
+                if chunk.get("usage"):
+                    result = chunk
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                
+                delta = (choices[0].get("delta") or {}).get("content") or ""
+                if delta:
+                    receive(delta)
+        except Exception:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            raise
+        finally:
+            response.close()
+            if cancel_token is not None:
+                cancel_token.unbind(response)
         
-        # 确保返回的数据结构完整
-        if "translation" not in translation_data:
-            translation_data["translation"] = ""
-        if "vocabulary" not in translation_data:
-            translation_data["vocabulary"] = []
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         
+        usage = self._usage(result, prompt, parser.buffer, estimate)
+        return self._validated_stream(parser.buffer, usage, prompt, cancel_token, response_schema,
+                                      on_event)
+    
+    def _validated_stream(self, content, usage, prompt, cancel_token, response_schema, on_event):
+        """校验流式输出，经过修复请求时以修复后的译文再次调用 on_event("translation", 译文)"""
+        translation_data = self._validated(content, usage, prompt, cancel_token, response_schema)
+        if on_event and translation_data["usage"].get("retries"):
+            on_event("translation", translation_data["translation"])
         return translation_data
 
 
@@ -160,14 +1314,25 @@ class FlomoAPI:
         
         # 发送到Flomo
         skip_ssl_check = self.config.get("skip_ssl_check", False)
-        response = requests.post(flomo_url, data={"content": content}, verify=not skip_ssl_check)
+        session = HTTPSessionPool.get_session(flomo_url, verify=not skip_ssl_check, config=self.config)
+        response = session.post(flomo_url, data={"content": content}, timeout=FLOMO_TIMEOUT)
         response.raise_for_status()
         
         return True
 
 
 class ConfigManager:
-    """配置管理器，负责配置的加密存储和读取"""
+    """配置管理器，负责配置的加密存储和读取
+    
+    解密后的配置在进程内缓存，密钥每个进程只派生一次；
+    配置文件的修改时间或大小变化时自动重新加载，并通知已注册的监听器。
+    """
+    
+    # 进程级缓存，所有实例共享
+    _fernet_cache = {}
+    _config_cache = {}
+    _listeners = {}
+    _lock = threading.RLock()
     
     def __init__(self):
         """初始化配置管理器"""
@@ -175,18 +1340,91 @@ class ConfigManager:
         self.secret_salt = SECRET_SALT
     
     def generate_key(self, password):
-        """生成加密密钥"""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=self.secret_salt,
-            iterations=100000,
-        )
-        key = kdf.derive(password.encode())
-        return Fernet(base64.urlsafe_b64encode(key))
+        """生成加密密钥（同一密码和盐只派生一次）"""
+        cache_key = (password, self.secret_salt)
+        with self._lock:
+            fernet = self._fernet_cache.get(cache_key)
+            if fernet is None:
+                hashes = lazy_import("cryptography.hazmat.primitives.hashes")
+                PBKDF2HMAC = lazy_import("cryptography.hazmat.primitives.kdf.pbkdf2").PBKDF2HMAC
+                Fernet = lazy_import("cryptography.fernet").Fernet
+                
+                kdf = PBKDF2HMAC(
+                    algorithm=hashes.SHA256(),
+                    length=32,
+                    salt=self.secret_salt,
+                    iterations=100000,
+                )
+                key = kdf.derive(password.encode())
+                fernet = Fernet(base64.urlsafe_b64encode(key))
+                self._fernet_cache[cache_key] = fernet
+            return fernet
+    
+    def _cache_path(self):
+        """缓存使用的配置文件绝对路径"""
+        return os.path.abspath(self.config_file)
+    
+    def _file_signature(self):
+        """配置文件签名 (修改时间, 大小)，文件不存在时返回 None"""
+        try:
+            stat = os.stat(self.config_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def add_listener(self, callback):
+        """注册配置变更监听器，配置内容变化时以新配置调用 callback(config)"""
+        with self._lock:
+            listeners = self._listeners.setdefault(self._cache_path(), [])
+            if callback not in listeners:
+                listeners.append(callback)
+    
+    def remove_listener(self, callback):
+        """移除配置变更监听器"""
+        with self._lock:
+            listeners = self._listeners.get(self._cache_path(), [])
+            if callback in listeners:
+                listeners.remove(callback)
+    
+    def _notify(self, config):
+        """通知监听器配置已变更"""
+        with self._lock:
+            listeners = list(self._listeners.get(self._cache_path(), []))
+        for callback in listeners:
+            try:
+                callback(dict(config))
+            except Exception as e:
+                print(f"配置变更通知失败: {str(e)}")
+    
+    def _store(self, signature, config):
+        """写入缓存，返回配置内容是否发生变化"""
+        path = self._cache_path()
+        with self._lock:
+            cached = self._config_cache.get(path)
+            changed = cached is None or cached[1] != config
+            self._config_cache[path] = (signature, config)
+        return changed
+    
+    def invalidate(self):
+        """清除当前配置文件的缓存，下次读取时重新解密"""
+        with self._lock:
+            self._config_cache.pop(self._cache_path(), None)
     
     def load_config(self):
-        """加载配置文件"""
+        """加载配置文件（文件未变化时直接返回缓存）"""
+        signature = self._file_signature()
+        with self._lock:
+            cached = self._config_cache.get(self._cache_path())
+        if cached is not None and cached[0] == signature:
+            return dict(cached[1])
+        
+        config = self._read_config()
+        if self._store(signature, config) and cached is not None:
+            self._notify(config)
+        return dict(config)
+    
+    def _read_config(self):
+        """从磁盘读取并解密配置文件"""
         try:
             if not os.path.exists(self.config_file):
                 return {}
@@ -214,38 +1452,1456 @@ class ConfigManager:
             with open(self.config_file, 'wb') as f:
                 f.write(encrypted_data)
             
+            # 刷新缓存并通知监听器
+            config = dict(config)
+            if self._store(self._file_signature(), config):
+                self._notify(config)
+            
             return True
         except Exception as e:
             print(f"保存配置失败: {str(e)}")
             raise
 
 
-# ========================================
-# 2. 功能服务层 (Service Layer)
-# ========================================
-
-class TranslationService:
-    """翻译服务类，负责翻译功能的实现"""
+class TranslationCache:
+    """翻译结果缓存，使用SQLite持久化到本地
     
-    def __init__(self, config_manager):
-        """初始化翻译服务"""
-        self.config_manager = config_manager
-        self.config = config_manager.load_config()
+    以 (规范化原文, 目标语言, 模型, 提示词版本) 的哈希为键，按最近访问时间淘汰超出容量的条目，
+    超过有效期的条目视为未命中。
+    """
+    
+    def __init__(self, db_file=CACHE_FILE, max_entries=2000, ttl_seconds=30 * 86400):
+        """初始化翻译缓存"""
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        """打开数据库连接（首次使用时创建表）"""
+        if self._conn is None:
+            self._conn = lazy_import("sqlite3").connect(self.db_file, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "key TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_translations_accessed ON translations (accessed)"
+            )
+        return self._conn
+    
+    @staticmethod
+    def normalize(text):
+        """规范化原文：统一Unicode形式，合并行内空白和多余空行"""
+        text = unicodedata.normalize("NFC", text)
+        lines = [re.sub(r"\s+", " ", line).strip() for line in text.splitlines()]
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+    
+    def make_key(self, text, target_language, model, variant=""):
+        """生成缓存键，variant 区分同一原文的不同输出形式（如词汇分析模式）"""
+        raw = json.dumps([PROMPT_VERSION, model, variant, target_language, self.normalize(text)],
+                         ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """读取缓存，未命中或已过期时返回 None"""
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT payload, created FROM translations WHERE key = ?", (key,)
+                ).fetchone()
+                
+                if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                    conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+                    conn.commit()
+                    row = None
+                
+                if row is None:
+                    self.misses += 1
+                    return None
+                
+                conn.execute("UPDATE translations SET accessed = ? WHERE key = ?", (now, key))
+                conn.commit()
+                self.hits += 1
+                return json.loads(row[0])
+        except lazy_import("sqlite3").Error as e:
+            print(f"读取翻译缓存失败: {str(e)}")
+            self.misses += 1
+            return None
+    
+    def put(self, key, translation_data):
+        """写入缓存，并淘汰超出容量的最久未访问条目"""
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO translations (key, payload, created, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(translation_data, ensure_ascii=False), now, now)
+                )
+                
+                count = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+                overflow = count - self.max_entries
+                if overflow > 0:
+                    conn.execute(
+                        "DELETE FROM translations WHERE key IN ("
+                        "SELECT key FROM translations ORDER BY accessed LIMIT ?)",
+                        (overflow,)
+                    )
+                    self.evictions += overflow
+                conn.commit()
+        except lazy_import("sqlite3").Error as e:
+            print(f"写入翻译缓存失败: {str(e)}")
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM translations")
+            conn.commit()
+    
+    def stats(self):
+        """返回缓存统计信息"""
+        lookups = self.hits + self.misses
+        with self._lock:
+            try:
+                entries = self._connect().execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            except lazy_import("sqlite3").Error:
+                entries = 0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class TranslationMemory:
+    """翻译记忆库，保存历史翻译并按相似度查找近似原文的已有译文
+    
+    原文规范化并把数字替换为占位符后切分为词（中日韩文字按单字），以词和相邻词对为特征计算
+    单次排列 MinHash 签名，分段建立 LSH 分桶索引；查找时只比较同桶的少量候选条目，按特征集合的
+    Dice 相似度排序。只有数字不同的原文可直接套用已有译文。索引在首次使用时由数据库构建，只保存在内存中。
+    """
+    
+    SIGNATURE_SIZE = 24
+    BANDS = 8
+    # 单个分桶最多保留的条目数（保留最新的），避免模板化文本使候选过多
+    BUCKET_LIMIT = 32
+    # 计算编辑距离相似度的候选数上限
+    MAX_CANDIDATES = 8
+    # 超过此长度的原文不写入记忆库
+    MAX_SOURCE_CHARS = 2000
+    NUMBER_PATTERN = re.compile(r"\d+(?:[.,:]\d+)*")
+    TOKEN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff]"
+                               r"|[^\W\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff]+|#")
+    HASH_MASK = (1 << 64) - 1
+    
+    def __init__(self, db_file=MEMORY_FILE, max_entries=50000):
+        """初始化翻译记忆库"""
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.entries = {}
+        self.exact = {}
+        self.buckets = {}
+        self.loaded = False
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        """打开数据库连接（首次使用时创建表）"""
+        if self._conn is None:
+            self._conn = lazy_import("sqlite3").connect(self.db_file, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS memory ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, target_language TEXT NOT NULL, "
+                "source TEXT NOT NULL, translation TEXT NOT NULL, vocabulary TEXT NOT NULL, "
+                "created REAL NOT NULL)"
+            )
+            # 旧版本的数据库没有 variant 列
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(memory)")}
+            if "variant" not in columns:
+                self._conn.execute("ALTER TABLE memory ADD COLUMN variant TEXT NOT NULL DEFAULT ''")
+        return self._conn
+    
+    @classmethod
+    def mask(cls, text):
+        """规范化原文并把数字替换为占位符"""
+        return cls.NUMBER_PATTERN.sub("#", TranslationCache.normalize(text))
+    
+    @classmethod
+    def features(cls, masked):
+        """原文的特征集合：词和相邻词对"""
+        tokens = cls.TOKEN_PATTERN.findall(masked.lower())
+        if not tokens:
+            return {masked}
+        return set(tokens).union(zip(tokens, tokens[1:]))
+    
+    @staticmethod
+    def similarity(features, other):
+        """两个特征集合的 Dice 相似度"""
+        return 2 * len(features & other) / (len(features) + len(other))
+    
+    @classmethod
+    def signature(cls, features):
+        """计算单次排列 MinHash 签名：每个特征只哈希一次，按哈希值分箱取最小值"""
+        size = cls.SIGNATURE_SIZE
+        empty = cls.HASH_MASK + 1
+        signature = [empty] * size
+        for value in map(hash, features):
+            value &= cls.HASH_MASK
+            index = value % size
+            if value < signature[index]:
+                signature[index] = value
+        
+        # 特征较少时的空箱借用其后第一个非空箱的值（旋转填充），保持签名可比较
+        for index in range(size):
+            if signature[index] == empty:
+                offset = 1
+                while signature[(index + offset) % size] >= empty:
+                    offset += 1
+                signature[index] = signature[(index + offset) % size] + offset * empty
+        return signature
+    
+    @classmethod
+    def band_keys(cls, features, target_language):
+        """LSH 分段键，同一分段签名完全相同的条目落入同一个桶"""
+        signature = cls.signature(features)
+        rows = cls.SIGNATURE_SIZE // cls.BANDS
+        return [hash((target_language, band, tuple(signature[band * rows:(band + 1) * rows])))
+                for band in range(cls.BANDS)]
+    
+    def _index(self, entry_id, target_language, masked):
+        """将条目加入内存索引（调用时需持有锁）"""
+        previous = self.exact.get((target_language, masked))
+        if previous is not None:
+            self.entries.pop(previous, None)
+        self.entries[entry_id] = (target_language, masked)
+        self.exact[(target_language, masked)] = entry_id
+        for key in self.band_keys(self.features(masked), target_language):
+            bucket = self.buckets.setdefault(key, [])
+            bucket.append(entry_id)
+            if len(bucket) > self.BUCKET_LIMIT:
+                del bucket[0]
+    
+    def load(self):
+        """由数据库构建内存索引，已构建时直接返回"""
+        with self._lock:
+            if self.loaded:
+                return
+            try:
+                rows = self._connect().execute(
+                    "SELECT id, target_language, source FROM memory ORDER BY id"
+                ).fetchall()
+            except lazy_import("sqlite3").Error as e:
+                print(f"读取翻译记忆库失败: {str(e)}")
+                rows = []
+            for entry_id, target_language, source in rows:
+                self._index(entry_id, target_language, self.mask(source))
+            self.loaded = True
+    
+    def add(self, source, target_language, translation, vocabulary=None, variant=""):
+        """写入一条翻译，相同（只有数字不同的）原文只保留最新的译文
+        
+        variant 记录生成译文时的输出条件（模型、词汇分析模式和术语译法），套用译文时须一致。
+        """
+        self.add_many([(source, target_language, translation, vocabulary or [], variant)])
+    
+    def add_many(self, records):
+        """批量写入 (原文, 目标语言, 译文, 词汇[, variant]) 记录，并淘汰超出容量的最早条目"""
+        self.load()
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                for source, target_language, translation, vocabulary, *variant in records:
+                    if not source.strip() or not translation or len(source) > self.MAX_SOURCE_CHARS:
+                        continue
+                    
+                    masked = self.mask(source)
+                    previous = self.exact.get((target_language, masked))
+                    if previous is not None:
+                        conn.execute("DELETE FROM memory WHERE id = ?", (previous,))
+                    cursor = conn.execute(
+                        "INSERT INTO memory (target_language, source, translation, vocabulary, created, "
+                        "variant) VALUES (?, ?, ?, ?, ?, ?)",
+                        (target_language, source, translation,
+                         json.dumps(vocabulary, ensure_ascii=False), now, variant[0] if variant else "")
+                    )
+                    self._index(cursor.lastrowid, target_language, masked)
+                
+                overflow = len(self.entries) - self.max_entries
+                if overflow > 0:
+                    expired = sorted(self.entries)[:overflow]
+                    conn.executemany("DELETE FROM memory WHERE id = ?", [(i,) for i in expired])
+                    for entry_id in expired:
+                        target_language, masked = self.entries.pop(entry_id)
+                        if self.exact.get((target_language, masked)) == entry_id:
+                            del self.exact[(target_language, masked)]
+                conn.commit()
+        except lazy_import("sqlite3").Error as e:
+            print(f"写入翻译记忆库失败: {str(e)}")
+    
+    @classmethod
+    def fill_numbers(cls, source, translation, text):
+        """把已有译文中的数字替换为新原文中对应的数字，无法一一对应时返回 None"""
+        old_numbers = cls.NUMBER_PATTERN.findall(source)
+        new_numbers = cls.NUMBER_PATTERN.findall(text)
+        if len(old_numbers) != len(new_numbers):
+            return None
+        
+        # 原文中的每个数字在译文中出现的次数必须相同，译文中其他的数字（如月份）保持不变
+        translation_counts = collections.Counter(cls.NUMBER_PATTERN.findall(translation))
+        if any(translation_counts[number] != count
+               for number, count in collections.Counter(old_numbers).items()):
+            return None
+        
+        mapping = {}
+        for old, new in zip(old_numbers, new_numbers):
+            if mapping.setdefault(old, new) != new:
+                return None
+        return cls.NUMBER_PATTERN.sub(lambda match: mapping.get(match.group(), match.group()),
+                                      translation)
+    
+    def lookup(self, text, target_language, threshold=0.7):
+        """查找最相似的已有翻译
+        
+        返回 {"source", "translation", "vocabulary", "similarity", "template", "variant"}，
+        template 为 True 时表示把数字替换为占位符后原文完全相同（区分大小写和标点）且含有数字，
+        translation 已替换为新原文的数字；其余相似的条目只作为参考，不能直接套用；
+        没有相似度不低于 threshold 的条目时返回 None。
+        """
+        self.load()
+        masked = self.mask(text)
+        with self._lock:
+            best_id = self.exact.get((target_language, masked))
+            exact_hit = best_id is not None
+            if exact_hit:
+                candidates = []
+            else:
+                features = self.features(masked)
+                hits = collections.Counter()
+                for key in self.band_keys(features, target_language):
+                    hits.update(self.buckets.get(key, ()))
+                candidates = [(entry_id, self.entries[entry_id][1])
+                              for entry_id, _ in hits.most_common(self.MAX_CANDIDATES)
+                              if entry_id in self.entries]
+        
+        best_similarity = 1.0 if best_id is not None else threshold
+        for entry_id, candidate in candidates:
+            similarity = self.similarity(features, self.features(candidate))
+            if similarity >= best_similarity:
+                best_id, best_similarity = entry_id, similarity
+        if best_id is None:
+            return None
+        
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT source, translation, vocabulary, variant FROM memory WHERE id = ?", (best_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        
+        source, translation, vocabulary, variant = row
+        match = {
+            "source": source,
+            "translation": translation,
+            "vocabulary": json.loads(vocabulary),
+            "similarity": best_similarity,
+            "template": False,
+            "variant": variant
+        }
+        # 特征集合忽略大小写和标点，相似度为 1 不代表原文相同，只有精确命中才可套用
+        if exact_hit and self.NUMBER_PATTERN.search(text):
+            filled = self.fill_numbers(source, translation, text)
+            if filled is not None:
+                match["translation"] = filled
+                match["template"] = True
+        return match
+    
+    def stats(self):
+        """返回记忆库统计信息"""
+        with self._lock:
+            return {"entries": len(self.entries), "buckets": len(self.buckets)}
+
+
+class TranslationHistory:
+    """翻译历史记录，使用SQLite持久化，原文和译文建立 FTS5 全文索引
+    
+    使用 trigram 分词，中日韩文本也可以按任意子串搜索；少于三个字符的搜索词和不支持 FTS5 的
+    SQLite 退回 LIKE 查询。列表按 id 倒序分页读取，只返回摘要，完整记录按需读取。
+    """
+    
+    # 列表中原文和译文摘要的长度
+    PREVIEW_CHARS = 80
+    
+    def __init__(self, db_file=HISTORY_FILE, max_entries=20000):
+        """初始化翻译历史记录"""
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.fts_enabled = False
+        self._conn = None
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        """打开数据库连接（首次使用时创建表、全文索引和同步触发器）"""
+        if self._conn is None:
+            conn = lazy_import("sqlite3").connect(self.db_file, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, "
+                "input_text TEXT NOT NULL, target_language TEXT NOT NULL, translation TEXT NOT NULL, "
+                "vocabulary TEXT NOT NULL, latency REAL, model TEXT)"
+            )
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5("
+                    "input_text, translation, content='history', content_rowid='id', tokenize='trigram')"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN "
+                    "INSERT INTO history_fts (rowid, input_text, translation) "
+                    "VALUES (new.id, new.input_text, new.translation); END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN "
+                    "INSERT INTO history_fts (history_fts, rowid, input_text, translation) "
+                    "VALUES ('delete', old.id, old.input_text, old.translation); END"
+                )
+                self.fts_enabled = True
+            except lazy_import("sqlite3").OperationalError:
+                # SQLite 未编译 FTS5 或 trigram 分词器
+                self.fts_enabled = False
+            conn.commit()
+            self._conn = conn
+        return self._conn
+    
+    def add(self, input_text, target_language, translation, vocabulary, latency=None, model=""):
+        """追加一条记录，与最近一条记录完全相同时不重复记录；返回记录 id"""
+        try:
+            with self._lock:
+                conn = self._connect()
+                last = conn.execute(
+                    "SELECT id, input_text, target_language, translation FROM history "
+                    "ORDER BY id DESC LIMIT 1"
+                ).fetchone()
+                if last is not None and last[1:] == (input_text, target_language, translation):
+                    return last[0]
+                
+                cursor = conn.execute(
+                    "INSERT INTO history (created, input_text, target_language, translation, vocabulary, "
+                    "latency, model) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), input_text, target_language, translation,
+                     json.dumps(vocabulary, ensure_ascii=False), latency, model)
+                )
+                if self.max_entries:
+                    conn.execute("DELETE FROM history WHERE id <= ?",
+                                 (cursor.lastrowid - self.max_entries,))
+                conn.commit()
+                return cursor.lastrowid
+        except lazy_import("sqlite3").Error as e:
+            print(f"写入翻译历史失败: {str(e)}")
+            return None
+    
+    def _filter(self, query):
+        """生成搜索条件，返回 (WHERE 子句, 参数)"""
+        terms = query.split()
+        if not terms:
+            return "", []
+        if self.fts_enabled and all(len(term) >= 3 for term in terms):
+            match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+            return "WHERE id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)", [match]
+        
+        clauses, params = [], []
+        for term in terms:
+            pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            clauses.append("(input_text LIKE ? ESCAPE '\\' OR translation LIKE ? ESCAPE '\\')")
+            params += [pattern, pattern]
+        return "WHERE " + " AND ".join(clauses), params
+    
+    def page(self, query="", before_id=None, limit=50):
+        """按时间倒序读取一页摘要，before_id 为上一页最后一条记录的 id
+        
+        返回 [{"id", "created", "target_language", "input_preview", "translation_preview"}, ...]
+        """
+        where, params = self._filter(query)
+        if before_id is not None:
+            where += (" AND " if where else "WHERE ") + "id < ?"
+            params.append(before_id)
+        try:
+            with self._lock:
+                rows = self._connect().execute(
+                    f"SELECT id, created, target_language, substr(input_text, 1, {self.PREVIEW_CHARS}), "
+                    f"substr(translation, 1, {self.PREVIEW_CHARS}) FROM history {where} "
+                    f"ORDER BY id DESC LIMIT ?",
+                    params + [limit]
+                ).fetchall()
+        except lazy_import("sqlite3").Error as e:
+            print(f"读取翻译历史失败: {str(e)}")
+            return []
+        return [{"id": row[0], "created": row[1], "target_language": row[2],
+                 "input_preview": row[3], "translation_preview": row[4]} for row in rows]
+    
+    def count(self, query=""):
+        """符合搜索条件的记录数"""
+        where, params = self._filter(query)
+        try:
+            with self._lock:
+                return self._connect().execute(f"SELECT COUNT(*) FROM history {where}",
+                                               params).fetchone()[0]
+        except lazy_import("sqlite3").Error:
+            return 0
+    
+    def get(self, entry_id):
+        """读取完整记录，不存在时返回 None"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT id, created, input_text, target_language, translation, vocabulary, latency, model "
+                "FROM history WHERE id = ?", (entry_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "created": row[1], "input_text": row[2], "target_language": row[3],
+                "translation": row[4], "vocabulary": json.loads(row[5]), "latency": row[6],
+                "model": row[7]}
+    
+    def delete(self, entry_id):
+        """删除一条记录"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM history WHERE id = ?", (entry_id,))
+            conn.commit()
+
+
+class VocabularyStore:
+    """生词本，合并保存每次翻译的词汇分析
+    
+    以规范化的单词为键去重，合并释义、例句和音标并累计出现次数；用户标记为已掌握的单词
+    会在翻译时告知模型不再解释。以 gzip 压缩的紧凑 JSON 保存到本地，内存中维护有序键（前缀搜索）
+    和倒排索引（全文搜索）。
+    """
+    
+    FORMAT_VERSION = 1
+    # 每个单词最多保留的释义数
+    MAX_MEANINGS = 8
+    # 两次写入磁盘之间的最短间隔（秒），其余修改由 flush() 写入
+    SAVE_INTERVAL = 5.0
+    # 界面中修改后延迟写入的时间（秒），期间的多次修改合并为一次写入
+    SAVE_DELAY = 1.0
+    
+    def __init__(self, path=VOCABULARY_FILE):
+        """初始化生词本"""
+        self.path = path
+        self.entries = {}
+        self.sorted_keys = []
+        self.postings = collections.defaultdict(set)
+        self.loaded = False
+        self.dirty = False
+        self.last_save = 0.0
+        self._save_timer = None
+        self._lock = threading.RLock()
+        # 保存时先取得此锁再取 _lock，保证快照按顺序写入文件
+        self._save_lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(word):
+        """规范化单词：统一Unicode形式、忽略大小写、合并空白并去掉首尾标点"""
+        word = unicodedata.normalize("NFC", str(word)).casefold()
+        word = re.sub(r"\s+", " ", word)
+        return word.strip(" \t\"'“”‘’.,;:!?()[]{}<>，。；：！？（）【】《》")
+    
+    @staticmethod
+    def tokens(text):
+        """全文索引的词元：单词，中日韩文字按单字"""
+        return set(TranslationMemory.TOKEN_PATTERN.findall(text.casefold())) - {"#"}
+    
+    @staticmethod
+    def _searchable(entry):
+        """条目中参与全文搜索的文本"""
+        parts = [entry["word"], entry["phonetic"]]
+        for meaning in entry["meanings"]:
+            parts += [meaning["definition"], meaning["example"]]
+        return " ".join(parts)
+    
+    def _index(self, key, entry):
+        """将条目加入有序键和倒排索引（调用时需持有锁）"""
+        if key not in self.entries:
+            bisect.insort(self.sorted_keys, key)
+        self.entries[key] = entry
+        for token in self.tokens(self._searchable(entry)):
+            self.postings[token].add(key)
+    
+    def load(self):
+        """从磁盘读取生词本，已读取时直接返回"""
+        with self._lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            if not os.path.exists(self.path):
+                return
+            try:
+                with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"读取生词本失败: {str(e)}")
+                return
+            
+            for word, phonetic, count, first_seen, last_seen, known, meanings in data.get("entries", []):
+                self._index(self.normalize(word), {
+                    "word": word,
+                    "phonetic": phonetic,
+                    "meanings": [{"definition": definition, "example": example}
+                                 for definition, example in meanings],
+                    "count": count,
+                    "first_seen": first_seen,
+                    "last_seen": last_seen,
+                    "known": bool(known)
+                })
+    
+    def save(self):
+        """以紧凑格式写入磁盘：每个条目为一个数组，先写临时文件再替换
+        
+        取快照和写文件都在 _save_lock 中完成，并发的保存按顺序执行，较旧的快照不会覆盖较新的。
+        """
+        with self._save_lock:
+            with self._lock:
+                rows = [[entry["word"], entry["phonetic"], entry["count"], entry["first_seen"],
+                         entry["last_seen"], int(entry["known"]),
+                         [[meaning["definition"], meaning["example"]] for meaning in entry["meanings"]]]
+                        for entry in self.entries.values()]
+                payload = json.dumps({"version": self.FORMAT_VERSION, "entries": rows},
+                                     ensure_ascii=False, separators=(",", ":"))
+                self.dirty = False
+                self.last_save = time.monotonic()
+            
+            try:
+                temp_path = self.path + ".tmp"
+                with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+                    f.write(payload)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                # 写入失败时保留未保存状态，下次保存时重试
+                with self._lock:
+                    self.dirty = True
+                print(f"保存生词本失败: {str(e)}")
+    
+    def save_later(self):
+        """在后台线程中延迟写入，不阻塞调用方"""
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.SAVE_DELAY, self._deferred_save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+    
+    def _deferred_save(self):
+        """延迟写入的定时器回调"""
+        with self._lock:
+            self._save_timer = None
+        self.flush()
+    
+    def flush(self):
+        """写入尚未保存的修改"""
+        if self.dirty:
+            self.save()
+    
+    def add(self, vocabulary):
+        """合并一次翻译的词汇分析，返回新增的单词数"""
+        self.load()
+        now = int(time.time())
+        added = 0
+        with self._lock:
+            for item in vocabulary:
+                key = self.normalize(item.get("word", ""))
+                if not key:
+                    continue
+                
+                entry = self.entries.get(key)
+                if entry is None:
+                    entry = {"word": str(item["word"]).strip(), "phonetic": "", "meanings": [],
+                             "count": 0, "first_seen": now, "last_seen": now, "known": False}
+                    added += 1
+                entry["count"] += 1
+                entry["last_seen"] = now
+                if not entry["phonetic"] and item.get("phonetic"):
+                    entry["phonetic"] = str(item["phonetic"])
+                
+                definitions = {self.normalize(m["definition"]): m for m in entry["meanings"]}
+                for meaning in item.get("meanings") or []:
+                    definition = str(meaning.get("definition") or "").strip()
+                    example = str(meaning.get("example") or "").strip()
+                    existing = definitions.get(self.normalize(definition))
+                    if existing is not None:
+                        existing["example"] = existing["example"] or example
+                    elif definition and len(entry["meanings"]) < self.MAX_MEANINGS:
+                        entry["meanings"].append({"definition": definition, "example": example})
+                        definitions[self.normalize(definition)] = entry["meanings"][-1]
+                self._index(key, entry)
+            
+            if vocabulary:
+                self.dirty = True
+            save_now = self.dirty and time.monotonic() - self.last_save >= self.SAVE_INTERVAL
+        
+        if save_now:
+            self.save()
+        return added
+    
+    def get(self, word):
+        """按单词查找条目，不存在时返回 None"""
+        self.load()
+        with self._lock:
+            return self.entries.get(self.normalize(word))
+    
+    def set_known(self, word, known=True):
+        """标记或取消标记单词为已掌握"""
+        self.load()
+        with self._lock:
+            entry = self.entries.get(self.normalize(word))
+            if entry is None:
+                return False
+            entry["known"] = known
+            self.dirty = True
+        self.save_later()
+        return True
+    
+    def search(self, query, limit=50):
+        """搜索单词，前缀匹配的在前，其后为释义和例句的全文匹配；查询为空时按出现次数排列"""
+        self.load()
+        key = self.normalize(query)
+        with self._lock:
+            if not key:
+                entries = sorted(self.entries.values(), key=lambda entry: -entry["count"])
+                return entries[:limit]
+            
+            results = []
+            start = bisect.bisect_left(self.sorted_keys, key)
+            for candidate in itertools.islice(self.sorted_keys, start, None):
+                if not candidate.startswith(key) or len(results) >= limit:
+                    break
+                results.append(candidate)
+            
+            # 所有词元都出现的条目再确认包含完整的查询文本
+            tokens = self.tokens(key)
+            if tokens and len(results) < limit:
+                candidates = set.intersection(*(self.postings.get(token, set()) for token in tokens))
+                matched = sorted((candidate for candidate in candidates - set(results)
+                                  if key in self._searchable(self.entries[candidate]).casefold()),
+                                 key=lambda candidate: -self.entries[candidate]["count"])
+                results += matched[:limit - len(results)]
+            return [self.entries[candidate] for candidate in results]
+    
+    def known_in(self, text, limit=30):
+        """原文中出现的已掌握单词"""
+        self.load()
+        normalized = " ".join(self.normalize(text).split())
+        tokens = self.tokens(normalized)
+        with self._lock:
+            known = [entry["word"] for key, entry in self.entries.items()
+                     if entry["known"] and (key in tokens or (not (key.isascii() and key.isalnum())
+                                                               and key in normalized))]
+        return known[:limit]
+    
+    def filter_known(self, vocabulary):
+        """去掉词汇分析中已掌握的单词"""
+        if not self.loaded:
+            return vocabulary
+        with self._lock:
+            return [item for item in vocabulary
+                    if not self.entries.get(self.normalize(item.get("word", "")), {}).get("known")]
+    
+    def stats(self):
+        """返回生词本统计信息"""
+        self.load()
+        with self._lock:
+            return {"entries": len(self.entries),
+                    "known": sum(1 for entry in self.entries.values() if entry["known"])}
+
+
+class Glossary:
+    """术语表，规定领域术语的固定译法
+    
+    从 CSV/TSV 文件读取，每行为：原文术语, 译法[, 目标语言]，目标语言为空的条目适用于所有语言。
+    全部术语构建为 Aho–Corasick 自动机，一次线性扫描即可找出原文中出现的术语，
+    只把这些条目放入提示词；翻译完成后检查译文是否使用了规定的译法。
+    """
+    
+    # 表头行第一列的常见写法
+    HEADER_NAMES = {"source", "term", "原文", "术语"}
+    
+    def __init__(self, path=GLOSSARY_FILE):
+        """初始化术语表"""
+        self.path = path
+        # 规范化的术语 -> {目标语言: (原文术语, 译法)}
+        self.terms = {}
+        self.keys = []
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        self.signature = None
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(text):
+        """规范化文本：统一Unicode形式、忽略大小写并合并空白"""
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", str(text)).casefold())
+    
+    @staticmethod
+    def _is_word_char(char):
+        """拉丁字母和数字，术语两端是这类字符时要求在单词边界上匹配"""
+        return char.isascii() and char.isalnum()
+    
+    def load(self):
+        """读取术语表文件，文件未变化时不重复读取，返回条目数"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            stat = None
+        signature = (self.path, stat.st_mtime_ns, stat.st_size) if stat else (self.path, None, None)
+        
+        with self._lock:
+            if signature == self.signature:
+                return len(self.keys)
+            
+            rows = []
+            if stat is not None:
+                try:
+                    with open(self.path, "r", encoding="utf-8-sig", newline="") as f:
+                        sample = f.read(4096)
+                        f.seek(0)
+                        if self.path.lower().endswith(".tsv") or "\t" in sample.split("\n", 1)[0]:
+                            delimiter = "\t"
+                        else:
+                            delimiter = ","
+                        rows = list(csv.reader(f, delimiter=delimiter))
+                except (OSError, UnicodeDecodeError, csv.Error) as e:
+                    print(f"读取术语表失败: {e}")
+            
+            if rows and rows[0] and rows[0][0].strip().casefold() in self.HEADER_NAMES:
+                rows = rows[1:]
+            self.build(rows)
+            self.signature = signature
+            return len(self.keys)
+    
+    def build(self, rows):
+        """由 (原文术语, 译法[, 目标语言]) 行构建术语表和自动机，重复的术语以后出现的为准"""
+        terms = {}
+        for row in rows:
+            if len(row) < 2 or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            source, target = row[0].strip(), row[1].strip()
+            language = row[2].strip() if len(row) > 2 else ""
+            key = self.normalize(source)
+            if target and key.strip():
+                terms.setdefault(key, {})[language] = (source, target)
+        
+        keys = list(terms)
+        goto, fail, output = [{}], [0], [()]
+        for index, key in enumerate(keys):
+            node = 0
+            for char in key:
+                child = goto[node].get(char)
+                if child is None:
+                    child = len(goto)
+                    goto[node][char] = child
+                    goto.append({})
+                    fail.append(0)
+                    output.append(())
+                node = child
+            # 输出项：(术语长度, 术语序号, 是否要求左边界, 是否要求右边界)
+            output[node] = ((len(key), index, self._is_word_char(key[0]),
+                             self._is_word_char(key[-1])),)
+        
+        # 按广度优先计算失配指针，并把后缀节点的输出合并到当前节点
+        pending = collections.deque(goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for char, child in goto[node].items():
+                pending.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                output[child] = output[child] + output[fail[child]]
+        
+        self.terms, self.keys = terms, keys
+        self.goto, self.fail, self.output = goto, fail, output
+    
+    def scan(self, text):
+        """扫描规范化的文本，返回所有术语出现位置 [(起始, 结束, 术语序号)]"""
+        goto, fail, output = self.goto, self.fail, self.output
+        is_word_char = self._is_word_char
+        size = len(text)
+        matches = []
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, index, left, right in output[node]:
+                start = end - length
+                if left and start > 0 and is_word_char(text[start - 1]):
+                    continue
+                if right and end < size and is_word_char(text[end]):
+                    continue
+                matches.append((start, end, index))
+        return matches
+    
+    def match(self, text, target_languages):
+        """原文中出现的、适用于目标语言的术语条目
+        
+        重叠的术语取最左最长的一个；返回 [{"source", "target", "language"}]，按首次出现排序。
+        """
+        if not self.keys:
+            return []
+        
+        def applicable(index):
+            languages = self.terms[self.keys[index]]
+            return "" in languages or any(language in languages for language in target_languages)
+        
+        matches = sorted((match for match in self.scan(self.normalize(text)) if applicable(match[2])),
+                         key=lambda match: (match[0], match[0] - match[1]))
+        entries = []
+        seen = set()
+        covered = 0
+        for start, end, index in matches:
+            if start < covered:
+                continue
+            covered = end
+            if index in seen:
+                continue
+            seen.add(index)
+            # 多个目标语言共用通用译法时只保留一条
+            languages = self.terms[self.keys[index]]
+            scopes = dict.fromkeys(language if language in languages else ""
+                                   for language in target_languages)
+            for language in scopes:
+                if language in languages:
+                    source, target = languages[language]
+                    entries.append({"source": source, "target": target, "language": language})
+        return entries
+    
+    def check(self, entries, translation, target_language=None):
+        """检查译文是否使用了规定的译法，返回未遵循的条目"""
+        translation = self.normalize(translation)
+        if target_language is not None:
+            entries = [entry for entry in entries if entry["language"] in ("", target_language)]
+        return [entry for entry in entries if self.normalize(entry["target"]) not in translation]
+    
+    def stats(self):
+        """术语表统计"""
+        return {"entries": sum(len(languages) for languages in self.terms.values()),
+                "terms": len(self.keys), "states": len(self.goto)}
+
+
+class AudioCache:
+    """朗读音频缓存，将合成的WAV文件保存在本地目录
+    
+    以 (文本, 音色, 语速) 的哈希为文件名，总大小超出上限时删除最久未使用的文件。
+    """
+    
+    def __init__(self, cache_dir=AUDIO_CACHE_DIR, max_bytes=50 * 1024 * 1024):
+        """初始化音频缓存"""
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+    
+    def path_for(self, text, voice, rate):
+        """返回缓存文件路径"""
+        raw = json.dumps([text.strip(), voice, rate], ensure_ascii=False)
+        name = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}.wav")
+    
+    def get(self, text, voice, rate):
+        """返回已缓存的音频文件路径，未缓存时返回 None"""
+        path = self.path_for(text, voice, rate)
+        try:
+            # 更新修改时间作为最近使用时间
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+    
+    def put(self, text, voice, rate, synthesize):
+        """调用 synthesize(路径) 生成音频并加入缓存，返回文件路径"""
+        path = self.path_for(text, voice, rate)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = path[:-4] + ".tmp.wav"
+        synthesize(temp_path)
+        if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
+            raise ValueError("音频合成失败")
+        os.replace(temp_path, path)
+        self.evict()
+        return path
+    
+    def evict(self):
+        """删除最久未使用的文件直到总大小不超过上限"""
+        with self._lock:
+            try:
+                entries = [entry for entry in os.scandir(self.cache_dir)
+                           if entry.is_file() and entry.name.endswith(".wav")]
+            except OSError:
+                return
+            
+            files = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                           for entry in entries)
+            total = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+# ========================================
+# 2. 功能服务层 (Service Layer)
+# ========================================
+
+class AsyncEngine:
+    """异步执行引擎，在单个后台事件循环上调度所有翻译和同步任务
+    
+    阻塞的HTTP调用在共享的有界线程池中执行，复用连接池；
+    协程被取消时通过 on_cancel 回调中断正在进行的请求。
+    """
+    
+    _instance = None
+    _lock = threading.Lock()
+    
+    def __init__(self, max_workers=8):
+        """初始化并启动后台事件循环"""
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="engine")
+        self.loop.set_default_executor(self.executor)
+        self.thread = threading.Thread(target=self._run_loop, name="async-engine", daemon=True)
+        self.thread.start()
+    
+    @classmethod
+    def instance(cls, max_workers=8):
+        """获取进程内共享的引擎，max_workers 只在首次创建时生效"""
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls(max_workers)
+            return cls._instance
+    
+    @classmethod
+    def shutdown(cls):
+        """停止共享引擎"""
+        with cls._lock:
+            engine, cls._instance = cls._instance, None
+        if engine is not None:
+            engine.loop.call_soon_threadsafe(engine.loop.stop)
+            engine.thread.join(timeout=1)
+            engine.executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _run_loop(self):
+        """后台线程入口"""
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+    
+    def submit(self, coroutine):
+        """提交协程到事件循环，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+    
+    def run(self, coroutine, timeout=None):
+        """同步执行协程并返回结果（不可在事件循环线程中调用）"""
+        return self.submit(coroutine).result(timeout)
+    
+    async def run_blocking(self, func, *args, on_cancel=None, **kwargs):
+        """在共享线程池中执行阻塞函数，协程被取消时调用 on_cancel()"""
+        future = self.loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if on_cancel is not None:
+                on_cancel()
+            raise
+
+
+def split_sentences(text):
+    """按句末标点将文本切分为句子，保留句末标点和空白"""
+    pieces = re.split(r"(?<=[。！？!?；;])|(?<=[.…])(?=\s)", text)
+    return [piece for piece in pieces if piece]
+
+
+def split_segments(text):
+    """将文本切分为句子，返回 [(句子, 其后的换行), ...]
+    
+    换行为空字符串时表示与下一句在同一段落内，用于逐句比较和按原文结构拼接译文。
+    """
+    segments = []
+    parts = re.split(r"([ \t]*\n\s*)", text.strip())
+    for index, part in enumerate(parts):
+        if index % 2:
+            if segments:
+                segments[-1] = (segments[-1][0], "\n\n" if part.count("\n") > 1 else "\n")
+            continue
+        for sentence in split_sentences(part):
+            if sentence.strip():
+                segments.append((sentence.strip(), ""))
+    return segments
+
+
+def align_segments(source_segments, translation_segments):
+    """将整段译文的句子与原文句子对齐，返回与原文一一对应的译文，无法对齐时返回 None
+    
+    要求段落数相同且每个段落的句子数相同。
+    """
+    def paragraphs(segments):
+        result = [[]]
+        for sentence, newline in segments:
+            result[-1].append(sentence)
+            if newline:
+                result.append([])
+        return [paragraph for paragraph in result if paragraph]
+    
+    source_paragraphs = paragraphs(source_segments)
+    translation_paragraphs = paragraphs(translation_segments)
+    if len(source_paragraphs) != len(translation_paragraphs):
+        return None
+    if any(len(source) != len(translation)
+           for source, translation in zip(source_paragraphs, translation_paragraphs)):
+        return None
+    return [sentence for paragraph in translation_paragraphs for sentence in paragraph]
+
+
+def split_into_chunks(text, token_budget):
+    """将长文本按段落和句子切分为不超过 token_budget 的块
+    
+    返回 [{"text": 块文本, "paragraph_end": 是否在段落结尾}, ...]
+    """
+    chunks = []
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    
+    for paragraph in paragraphs:
+        # 段落过长时按句子切分，句子仍过长时按字符硬切
+        sentences = [paragraph]
+        if estimate_tokens(paragraph) > token_budget:
+            sentences = split_sentences(paragraph)
+        
+        pieces = []
+        for sentence in sentences:
+            while estimate_tokens(sentence) > token_budget:
+                cut = max(1, len(sentence) * token_budget // estimate_tokens(sentence))
+                pieces.append(sentence[:cut])
+                sentence = sentence[cut:]
+            if sentence.strip():
+                pieces.append(sentence)
+        
+        # 将相邻的片段合并到预算以内
+        current = ""
+        for piece in pieces:
+            if current and estimate_tokens(current + piece) > token_budget:
+                chunks.append({"text": current.strip(), "paragraph_end": False})
+                current = ""
+            current += piece
+        if current.strip():
+            chunks.append({"text": current.strip(), "paragraph_end": True})
+    
+    return chunks
+
+
+def merge_vocabulary(vocabulary_lists):
+    """合并多个词汇列表，按单词（忽略大小写）去重并合并含义"""
+    merged = {}
+    for vocabulary in vocabulary_lists:
+        for item in vocabulary:
+            word = str(item.get("word", "")).strip()
+            if not word:
+                continue
+            
+            key = word.lower()
+            if key not in merged:
+                merged[key] = {
+                    "word": word,
+                    "phonetic": item.get("phonetic", ""),
+                    "meanings": list(item.get("meanings", []))
+                }
+                continue
+            
+            existing = merged[key]
+            if not existing.get("phonetic") and item.get("phonetic"):
+                existing["phonetic"] = item["phonetic"]
+            definitions = {m.get("definition") for m in existing["meanings"]}
+            for meaning in item.get("meanings", []):
+                if meaning.get("definition") not in definitions:
+                    existing["meanings"].append(meaning)
+                    definitions.add(meaning.get("definition"))
+    
+    return list(merged.values())
+
+
+class SingleFlight:
+    """合并相同键的并发调用：同一时刻只执行一次，其余调用等待并共享结果
+    
+    调用在独立的线程池中执行，每个等待者都可以单独取消：取消只让该等待者立即返回，
+    所有等待者都取消后才会取消正在执行的调用。执行过程中通过 emit(类型, 值) 发出的
+    事件会转发给所有等待者，后加入的等待者会先收到每种事件的最新值。
+    """
+    
+    def __init__(self, max_workers=32):
+        """初始化"""
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executor = None
+        self.max_workers = max_workers
+        self.coalesced = 0
+    
+    def _submit(self, func):
+        """在独立线程池中执行调用，避免占用调用者所在线程池而互相等待"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix="single-flight")
+        return self._executor.submit(func)
+    
+    def pending(self, key):
+        """是否有相同键的调用正在执行"""
+        with self._lock:
+            return key in self._calls
+    
+    def do(self, key, func, cancel_token=None, on_event=None):
+        """执行 func(cancel_token, emit)，已有相同键的调用在进行时等待其结果
+        
+        返回 (结果, 是否为共享的结果)；执行中的调用抛出异常时所有等待者都会收到该异常，
+        cancel_token 被取消时抛出 TranslationCancelled。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"token": CancelToken(), "waiters": 0, "listeners": [], "latest": {}}
+                self._calls[key] = call
+                call["future"] = self._submit(lambda: self._run(key, call, func))
+            else:
+                self.coalesced += 1
+            call["waiters"] += 1
+            if on_event is not None:
+                call["listeners"].append(on_event)
+            latest = list(call["latest"].items())
+        
+        for kind, value in latest:
+            on_event(kind, value)
+        
+        wake = threading.Event()
+        call["future"].add_done_callback(lambda _: wake.set())
+        if cancel_token is not None:
+            cancel_token.add_callback(wake.set)
+        try:
+            wake.wait()
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            return call["future"].result(), not leader
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(wake.set)
+            self._detach(key, call, on_event)
+    
+    def _run(self, key, call, func):
+        """执行调用并转发事件"""
+        def emit(kind, value):
+            with self._lock:
+                call["latest"][kind] = value
+                listeners = list(call["listeners"])
+            for listener in listeners:
+                listener(kind, value)
+        
+        try:
+            return func(call["token"], emit)
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+    
+    def _detach(self, key, call, on_event):
+        """等待者离开，最后一个等待者离开时取消仍在执行的调用"""
+        with self._lock:
+            call["waiters"] -= 1
+            if on_event is not None:
+                call["listeners"].remove(on_event)
+            abandoned = call["waiters"] == 0 and not call["future"].done()
+            if abandoned and self._calls.get(key) is call:
+                # 之后的相同请求重新发起，不再等待已取消的调用
+                del self._calls[key]
+        if abandoned:
+            call["token"].cancel()
+
+
+class TranslationService:
+    """翻译服务类，负责翻译功能的实现"""
+    
+    def __init__(self, config_manager):
+        """初始化翻译服务"""
+        self.config_manager = config_manager
+        self.config = config_manager.load_config()
         self.translation_api = TranslationAPI(self.config)
+        self.cache = TranslationCache()
+        # 翻译记忆库，用于近似原文的查找
+        self.memory = TranslationMemory()
+        # 生词本，收集每次翻译的词汇分析
+        self.vocabulary_store = VocabularyStore()
+        # 术语表，规定领域术语的译法
+        self.glossary = Glossary()
+        self.apply_cache_config()
+        self.last_metrics = {}
+        # 词汇分析模式，为空时使用配置项 vocabulary_mode
+        self.vocabulary_mode = None
+        # 相同的请求同时进行时只调用一次API
+        self.single_flight = SingleFlight()
+        self.config_manager.add_listener(self.on_config_changed)
     
-    def update_config(self):
-        """更新配置"""
-        self.config = self.config_manager.load_config()
+    def on_config_changed(self, config):
+        """配置变更时重建翻译API"""
+        self.config = config
         self.translation_api = TranslationAPI(self.config)
+        self.apply_cache_config()
+    
+    def apply_cache_config(self):
+        """应用缓存容量和有效期配置"""
+        self.cache.max_entries = int(self.config.get("cache_max_entries", 2000))
+        self.cache.ttl_seconds = float(self.config.get("cache_ttl_days", 30)) * 86400
+        self.memory.max_entries = int(self.config.get("memory_max_entries", 50000))
+        self.glossary.path = self.config.get("glossary_file", GLOSSARY_FILE)
+    
+    def _vocabulary_mode(self):
+        """当前的词汇分析模式"""
+        return self.vocabulary_mode or self.config.get("vocabulary_mode", "auto")
+    
+    def _cache_key(self, input_text, target_language):
+        """生成当前配置下的缓存键，原文中出现的术语译法变化后不再命中旧的结果"""
+        model = self.config.get("model", "gpt-3.5-turbo")
+        variant = self._vocabulary_mode()
+        terms = self.glossary_terms(input_text, [target_language])
+        if terms:
+            variant += "|" + json.dumps(terms, ensure_ascii=False, sort_keys=True)
+        return self.cache.make_key(input_text, target_language, model, variant)
+    
+    @staticmethod
+    def _usage_metrics(usage):
+        """从API返回的用量中提取指标：实际和发送前估算的token数"""
+        return {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "estimated_prompt_tokens": usage.get("estimated_prompt_tokens", 0),
+            "estimated_completion_tokens": usage.get("estimated_completion_tokens", 0)
+        }
+    
+    def _memory_variant(self, input_text, target_language):
+        """记忆库条目的输出条件：模型、词汇分析模式和原文中出现的术语译法"""
+        return json.dumps([self.config.get("model", "gpt-3.5-turbo"), self._vocabulary_mode(),
+                           self.glossary_terms(input_text, [target_language])],
+                          ensure_ascii=False, sort_keys=True)
     
-    def format_vocabulary(self, vocabulary):
-        """格式化词汇信息为Markdown格式"""
+    def lookup_cache(self, input_text, target_language):
+        """查询翻译缓存，命中时返回与 translate 相同结构的结果，否则返回 None"""
+        self.update_config()
+        if not self.config.get("cache_enabled", True):
+            return None
+        
+        translation_data = self.cache.get(self._cache_key(input_text, target_language))
+        if translation_data is None:
+            return None
+        
+        self.last_metrics = {"time_to_first_token": 0.0, "total_time": 0.0, "cached": True}
+        return self._build_result(translation_data, self.last_metrics)
+    
+    def lookup_memory(self, input_text, target_language):
+        """查询翻译记忆库，原文与已有翻译只有数字不同时返回套用后的结果，否则返回 None
+        
+        已有翻译须在相同的模型、词汇分析模式和术语译法下生成，术语表修改后不会再套用旧译文。
+        """
+        if not self.config.get("memory_enabled", True):
+            return None
+        
+        match = self.memory.lookup(input_text, target_language, threshold=1.0)
+        if (match is None or not match["template"]
+                or match["variant"] != self._memory_variant(input_text, target_language)):
+            return None
+        
+        self.last_metrics = {"time_to_first_token": 0.0, "total_time": 0.0, "memory": "template",
+                             "memory_similarity": 1.0}
+        return self._build_result({"translation": match["translation"],
+                                   "vocabulary": match["vocabulary"]}, self.last_metrics)
+    
+    def memory_reference(self, input_text, target_language):
+        """查找相似原文的已有翻译供模型参考，没有足够相似的条目时返回 None"""
+        if not self.config.get("memory_enabled", True):
+            return None
+        return self.memory.lookup(input_text, target_language,
+                                  float(self.config.get("memory_reference_threshold", 0.7)))
+    
+    def remember(self, input_text, target_language, translation_data):
+        """将翻译结果写入翻译记忆库，词汇分析合并到生词本"""
+        if self.config.get("memory_enabled", True) and translation_data.get("translation"):
+            self.memory.add(input_text, target_language, translation_data["translation"],
+                            translation_data.get("vocabulary", []),
+                            self._memory_variant(input_text, target_language))
+        if self.config.get("vocabulary_store_enabled", True):
+            self.vocabulary_store.add(translation_data.get("vocabulary", []))
+    
+    def known_words(self, input_text):
+        """原文中用户已掌握的单词，告知模型不再解释"""
+        if not self.config.get("vocabulary_store_enabled", True):
+            return []
+        return self.vocabulary_store.known_in(input_text)
+    
+    def glossary_terms(self, input_text, target_languages):
+        """原文中出现的、适用于目标语言的术语表条目"""
+        if not self.config.get("glossary_enabled", True):
+            return []
+        self.glossary.load()
+        return self.glossary.match(input_text, target_languages)
+    
+    def glossary_metrics(self, terms, translation, target_language):
+        """检查译文是否遵循术语表，返回 glossary_terms / glossary_violations 指标"""
+        if not terms:
+            return {}
+        violations = self.glossary.check(terms, translation, target_language)
+        return {"glossary_terms": len(terms),
+                "glossary_violations": [entry["source"] for entry in violations]}
+    
+    def _build_result(self, translation_data, metrics):
+        """由翻译数据构建返回给界面的结果，不显示已掌握的单词"""
+        vocabulary = self.vocabulary_store.filter_known(translation_data.get("vocabulary", []))
+        
+        return {
+            "translation": translation_data.get("translation", ""),
+            "analysis": self.format_vocabulary(vocabulary),
+            "vocabulary": vocabulary,
+            "metrics": dict(metrics)
+        }
+    
+    def update_config(self):
+        """更新配置（配置未变化时不会重建API）"""
+        self.config_manager.load_config()
+    
+    def warm_up(self):
+        """预热到翻译API的连接"""
+        return self.translation_api.warm_up()
+    
+    def format_vocabulary(self, vocabulary, link_words=False):
+        """格式化词汇信息为Markdown格式，link_words 为 True 时单词显示为可点击朗读的链接"""
         analysis_text = ""
         
         if vocabulary:
             for item in vocabulary:
                 word = item.get("word", "")
                 phonetic = item.get("phonetic", "")
+                if link_words and word:
+                    word = f"[{word}](tts:{quote(word)})"
                 
                 # 显示单词/词组和音标
                 if phonetic:
@@ -267,23 +2923,728 @@ class TranslationService:
                 
                 analysis_text += "\n"  # 在每个词汇后添加空行
         
-        return analysis_text
+        return analysis_text
+    
+    def translate(self, input_text, target_language, on_partial=None, on_vocabulary=None,
+                  use_cache=True, cancel_token=None):
+        """执行翻译并返回结果
+        
+        传入 on_partial 且启用流式输出时，会随着内容到达以当前已翻译的文本调用 on_partial(text)，
+        每解析出一个完整的词汇条目以当前的词汇分析文本调用 on_vocabulary(analysis)。
+        use_cache 为 True 时先查询本地缓存；cancel_token 被取消时抛出 TranslationCancelled。
+        相同的请求正在进行时共享同一次API调用，取消只影响当前调用者。
+        """
+        if use_cache:
+            cached = (self.lookup_cache(input_text, target_language)
+                      or self.lookup_memory(input_text, target_language))
+            if cached is not None:
+                return cached
+        
+        # 更新配置
+        self.update_config()
+        
+        stream = on_partial is not None and self.config.get("stream_mode", True)
+        
+        def on_event(kind, value):
+            if kind == "partial" and on_partial is not None:
+                on_partial(value)
+            elif kind == "vocabulary" and on_vocabulary is not None:
+                on_vocabulary(value)
+        
+        # 相同的请求正在进行时共享其结果，不再重复调用API
+        result, shared = self.single_flight.do(
+            self._cache_key(input_text, target_language),
+            lambda token, emit: self._translate_uncached(input_text, target_language, stream,
+                                                         token, emit),
+            cancel_token=cancel_token,
+            on_event=on_event
+        )
+        if shared:
+            result = dict(result, metrics=dict(result["metrics"], coalesced=True))
+        return result
+    
+    def _translate_uncached(self, input_text, target_language, stream, cancel_token, emit):
+        """调用API翻译并写入缓存，stream 为 True 时通过 emit 发出 partial 和 vocabulary 事件"""
+        start_time = time.perf_counter()
+        first_token_time = None
+        
+        # 相似原文的已有翻译作为参考，原文中出现的术语规定译法
+        match = self.memory_reference(input_text, target_language)
+        reference = (match["source"], match["translation"]) if match else None
+        terms = self.glossary_terms(input_text, [target_language])
+        
+        # 调用API执行翻译
+        if stream:
+            vocabulary = []
+            
+            def on_event(kind, value):
+                nonlocal first_token_time
+                if kind == "delta":
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter() - start_time
+                elif kind in ("translation_partial", "translation"):
+                    emit("partial", value)
+                elif kind == "vocabulary":
+                    vocabulary.append(value)
+                    emit("vocabulary", self.format_vocabulary(vocabulary))
+            
+            translation_data = self.translation_api.translate_stream(
+                input_text, target_language, on_event, cancel_token=cancel_token,
+                vocabulary_mode=self._vocabulary_mode(), reference=reference,
+                known_words=self.known_words(input_text), glossary=terms
+            )
+        else:
+            translation_data = self.translation_api.translate(
+                input_text, target_language, cancel_token=cancel_token,
+                vocabulary_mode=self._vocabulary_mode(), reference=reference,
+                known_words=self.known_words(input_text), glossary=terms
+            )
+        
+        total_time = time.perf_counter() - start_time
+        usage = translation_data.pop("usage", {})
+        metrics = {
+            "time_to_first_token": first_token_time if first_token_time is not None else total_time,
+            "total_time": total_time
+        }
+        metrics.update(self._usage_metrics(usage))
+        if match:
+            metrics["memory_similarity"] = match["similarity"]
+        metrics.update(self.glossary_metrics(terms, translation_data.get("translation", ""),
+                                             target_language))
+        self.last_metrics = metrics
+        
+        # 截断修复的结果不写入缓存和记忆库
+        if not translation_data.get("recovered"):
+            if self.config.get("cache_enabled", True):
+                self.cache.put(self._cache_key(input_text, target_language), translation_data)
+            self.remember(input_text, target_language, translation_data)
+        
+        return self._build_result(translation_data, metrics)
+    
+    def translate_multi(self, input_text, target_languages, cancel_token=None):
+        """在一次请求中翻译为多个目标语言，返回 {语言: 结果}"""
+        self.update_config()
+        
+        start_time = time.perf_counter()
+        terms = self.glossary_terms(input_text, target_languages)
+        translation_data = self.translation_api.translate_multi(
+            input_text, target_languages, cancel_token=cancel_token,
+            vocabulary_mode=self._vocabulary_mode(), known_words=self.known_words(input_text),
+            glossary=terms
+        )
+        total_time = time.perf_counter() - start_time
+        
+        metrics = {
+            "time_to_first_token": total_time,
+            "total_time": total_time
+        }
+        metrics.update(self._usage_metrics(translation_data["usage"]))
+        self.last_metrics = metrics
+        
+        results = {}
+        for language, translation in translation_data["translations"].items():
+            language_data = {"translation": translation, "vocabulary": translation_data["vocabulary"]}
+            if self.config.get("cache_enabled", True) and translation:
+                self.cache.put(self._cache_key(input_text, language), language_data)
+            if self.config.get("memory_enabled", True) and translation:
+                self.memory.add(input_text, language, translation, language_data["vocabulary"],
+                                self._memory_variant(input_text, language))
+            results[language] = self._build_result(
+                language_data, dict(metrics, **self.glossary_metrics(terms, translation, language))
+            )
+        if self.config.get("vocabulary_store_enabled", True):
+            self.vocabulary_store.add(translation_data["vocabulary"])
+        return results
+    
+    async def translate_async(self, input_text, target_language, on_partial=None,
+                              on_vocabulary=None, use_cache=True, cancel_token=None):
+        """translate 的异步版本，在异步引擎中执行，协程被取消时中断请求"""
+        cancel_token = cancel_token or CancelToken()
+        return await AsyncEngine.instance().run_blocking(
+            self.translate,
+            input_text,
+            target_language,
+            on_partial=on_partial,
+            on_vocabulary=on_vocabulary,
+            use_cache=use_cache,
+            cancel_token=cancel_token,
+            on_cancel=cancel_token.cancel
+        )
+
+
+class DocumentTranslationService:
+    """长文档翻译服务，将文本分块后并发翻译并按顺序重组"""
+    
+    # 译文中句子之间不加空格的目标语言
+    NO_SPACE_LANGUAGES = ("中文", "日语")
+    
+    def __init__(self, translation_service):
+        """初始化长文档翻译服务"""
+        self.translation_service = translation_service
+    
+    @property
+    def config(self):
+        """当前配置"""
+        return self.translation_service.config
+    
+    def token_budget(self):
+        """每个分块的token预算"""
+        return int(self.config.get("chunk_token_budget", 1200))
+    
+    def needs_chunking(self, input_text):
+        """判断文本是否需要按长文档方式翻译"""
+        self.translation_service.update_config()
+        if not self.config.get("document_mode", True):
+            return False
+        return estimate_tokens(input_text) > self.token_budget()
+    
+    def assemble(self, chunks, translations, target_language):
+        """按原顺序拼接各分块译文，遇到未完成的分块时停止"""
+        inline_separator = "" if target_language in self.NO_SPACE_LANGUAGES else " "
+        text = ""
+        for chunk, translation in zip(chunks, translations):
+            if translation is None:
+                break
+            text += translation
+            text += "\n\n" if chunk["paragraph_end"] else inline_separator
+        return text.strip()
+    
+    def translate(self, input_text, target_language, on_progress=None, on_partial=None,
+                  cancel_token=None):
+        """分块并发翻译长文档（同步接口）"""
+        return AsyncEngine.instance().run(self.translate_async(
+            input_text, target_language, on_progress, on_partial, cancel_token
+        ))
+    
+    async def translate_async(self, input_text, target_language, on_progress=None,
+                              on_partial=None, cancel_token=None):
+        """分块并发翻译长文档
+        
+        每完成一个分块调用 on_progress(已完成数, 总数)，并以按顺序拼接的已完成译文调用 on_partial(text)。
+        """
+        start_time = time.perf_counter()
+        cancel_token = cancel_token or CancelToken()
+        chunks = split_into_chunks(input_text, self.token_budget())
+        results = [None] * len(chunks)
+        translations = [None] * len(chunks)
+        first_chunk_time = None
+        
+        semaphore = asyncio.Semaphore(max(1, int(self.config.get("document_workers", 4))))
+        
+        async def translate_chunk(index, chunk):
+            async with semaphore:
+                result = await self.translation_service.translate_async(
+                    chunk["text"], target_language, cancel_token=cancel_token
+                )
+            return index, result
+        
+        tasks = [asyncio.ensure_future(translate_chunk(index, chunk))
+                 for index, chunk in enumerate(chunks)]
+        try:
+            for done, next_done in enumerate(asyncio.as_completed(tasks), 1):
+                index, result = await next_done
+                results[index] = result
+                translations[index] = result["translation"]
+                if first_chunk_time is None:
+                    first_chunk_time = time.perf_counter() - start_time
+                
+                if on_progress:
+                    on_progress(done, len(chunks))
+                partial = self.assemble(chunks, translations, target_language)
+                if on_partial and partial:
+                    on_partial(partial)
+        except BaseException:
+            # 任一分块失败或整体被取消时，取消其余分块并中断其请求
+            cancel_token.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        vocabulary = merge_vocabulary(result.get("vocabulary", []) for result in results)
+        total_time = time.perf_counter() - start_time
+        chunk_metrics = [result.get("metrics", {}) for result in results]
+        glossary_metrics = {}
+        if any("glossary_terms" in m for m in chunk_metrics):
+            glossary_metrics = {
+                "glossary_terms": sum(m.get("glossary_terms", 0) for m in chunk_metrics),
+                "glossary_violations": list(dict.fromkeys(
+                    source for m in chunk_metrics for source in m.get("glossary_violations", [])))
+            }
+        
+        return {
+            "translation": self.assemble(chunks, translations, target_language),
+            "analysis": self.translation_service.format_vocabulary(vocabulary),
+            "vocabulary": vocabulary,
+            "metrics": {
+                "time_to_first_token": first_chunk_time if first_chunk_time is not None else total_time,
+                "total_time": total_time,
+                "chunks": len(chunks),
+                "prompt_tokens": sum(m.get("prompt_tokens", 0) for m in chunk_metrics),
+                "completion_tokens": sum(m.get("completion_tokens", 0) for m in chunk_metrics),
+                "estimated_prompt_tokens": sum(m.get("estimated_prompt_tokens", 0) for m in chunk_metrics),
+                "estimated_completion_tokens": sum(m.get("estimated_completion_tokens", 0)
+                                                   for m in chunk_metrics),
+                **glossary_metrics
+            }
+        }
+
+
+class IncrementalTranslationService:
+    """增量翻译服务，与同一目标语言上次翻译的原文逐句比较，只重新翻译改动过的句子
+    
+    未改动的句子沿用上次的译文，改动的句子连同相邻句子作为上下文一次请求翻译，再按原文结构拼接。
+    上次的整段译文无法与原文逐句对齐、或改动的句子过多时不做增量翻译。
+    """
+    
+    def __init__(self, translation_service):
+        """初始化增量翻译服务"""
+        self.translation_service = translation_service
+        # 目标语言 -> 上次翻译的逐句结果
+        self.runs = {}
+        self.lock = threading.Lock()
+    
+    @property
+    def config(self):
+        """当前配置"""
+        return self.translation_service.config
+    
+    def _run_key(self):
+        """模型或词汇分析模式变化后不沿用之前的译文"""
+        return self.config.get("model", "gpt-3.5-turbo"), self.translation_service._vocabulary_mode()
+    
+    def remember(self, input_text, target_language, result):
+        """记录一次翻译的逐句结果，供之后的增量翻译使用"""
+        segments = split_segments(input_text)
+        translations = result.get("segments")
+        if translations is None:
+            translations = align_segments(segments, split_segments(result.get("translation", "")))
+        
+        with self.lock:
+            if translations is None or len(translations) != len(segments):
+                self.runs.pop(target_language, None)
+                return
+            self.runs[target_language] = {
+                "key": self._run_key(),
+                "sources": [sentence for sentence, _ in segments],
+                "translations": list(translations),
+                "vocabulary": result.get("vocabulary", [])
+            }
+    
+    def plan(self, input_text, target_language):
+        """与上次的原文逐句比较，返回增量翻译计划，不适合增量翻译时返回 None
+        
+        计划为 {"segments": 句子, "translations": [沿用的译文或 None], "changed": [需要翻译的句子序号],
+        "vocabulary": 上次的词汇分析}。
+        """
+        self.translation_service.update_config()
+        if not self.config.get("incremental_translation", True):
+            return None
+        with self.lock:
+            run = self.runs.get(target_language)
+        if run is None or run["key"] != self._run_key():
+            return None
+        
+        segments = split_segments(input_text)
+        if len(segments) < 2:
+            return None
+        
+        sources = [sentence for sentence, _ in segments]
+        translations = [None] * len(segments)
+        matcher = difflib.SequenceMatcher(None, run["sources"], sources, autojunk=False)
+        for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+            if tag == "equal":
+                translations[new_start:new_end] = run["translations"][old_start:old_end]
+        
+        changed = [index for index, translation in enumerate(translations) if translation is None]
+        max_ratio = float(self.config.get("incremental_max_changed_ratio", 0.5))
+        if len(changed) > len(segments) * max_ratio:
+            return None
+        if estimate_tokens(" ".join(sources[index] for index in changed)) > int(
+                self.config.get("chunk_token_budget", 1200)):
+            return None
+        
+        return {
+            "segments": segments,
+            "translations": translations,
+            "changed": changed,
+            "vocabulary": run["vocabulary"]
+        }
+    
+    def context(self, sources, changed):
+        """改动句子前后的未改动句子，作为翻译的上下文"""
+        radius = int(self.config.get("incremental_context_sentences", 1))
+        changed_set = set(changed)
+        indices = sorted({neighbour for index in changed
+                          for neighbour in range(index - radius, index + radius + 1)
+                          if 0 <= neighbour < len(sources)} - changed_set)
+        return [sources[index] for index in indices]
+    
+    def assemble(self, segments, translations, target_language, pending="…"):
+        """按原文的段落结构拼接逐句译文，尚未翻译的句子显示为 pending"""
+        inline_separator = "" if target_language in DocumentTranslationService.NO_SPACE_LANGUAGES else " "
+        text = ""
+        for (_, newline), translation in zip(segments, translations):
+            text += translation if translation is not None else pending
+            text += newline or inline_separator
+        return text.strip()
+    
+    def translate(self, input_text, target_language, plan, on_partial=None, cancel_token=None):
+        """按增量翻译计划翻译，返回与 TranslationService.translate 相同结构的结果
+        
+        结果的 segments 为逐句译文，metrics 中 reused_segments / changed_segments 为沿用和重新翻译的句子数。
+        """
+        start_time = time.perf_counter()
+        segments = plan["segments"]
+        translations = list(plan["translations"])
+        changed = plan["changed"]
+        if on_partial:
+            on_partial(self.assemble(segments, translations, target_language))
+        
+        usage = {}
+        new_vocabulary = []
+        glossary_metrics = {}
+        if changed:
+            sources = [sentence for sentence, _ in segments]
+            changed_sources = [sources[index] for index in changed]
+            terms = self.translation_service.glossary_terms(" ".join(changed_sources),
+                                                            [target_language])
+            translation_data = self.translation_service.translation_api.translate_segments(
+                changed_sources,
+                self.context(sources, changed),
+                target_language,
+                cancel_token=cancel_token,
+                vocabulary_mode=self.translation_service._vocabulary_mode(),
+                known_words=self.translation_service.known_words(input_text),
+                glossary=terms
+            )
+            for index, translation in zip(changed, translation_data["translations"]):
+                translations[index] = translation
+            glossary_metrics = self.translation_service.glossary_metrics(
+                terms, " ".join(translation_data["translations"]), target_language
+            )
+            usage = translation_data["usage"]
+            new_vocabulary = translation_data["vocabulary"]
+            if self.config.get("vocabulary_store_enabled", True):
+                self.translation_service.vocabulary_store.add(new_vocabulary)
+        
+        # 沿用原文中仍然出现的单词的词汇分析
+        lowered = input_text.lower()
+        kept_vocabulary = [item for item in plan["vocabulary"]
+                           if str(item.get("word", "")).lower() in lowered]
+        translation_data = {
+            "translation": self.assemble(segments, translations, target_language),
+            "vocabulary": merge_vocabulary([kept_vocabulary, new_vocabulary])
+        }
+        
+        total_time = time.perf_counter() - start_time
+        metrics = {
+            "time_to_first_token": total_time,
+            "total_time": total_time,
+            "reused_segments": len(segments) - len(changed),
+            "changed_segments": len(changed)
+        }
+        metrics.update(self.translation_service._usage_metrics(usage))
+        metrics.update(glossary_metrics)
+        self.translation_service.last_metrics = metrics
+        
+        if self.config.get("cache_enabled", True):
+            self.translation_service.cache.put(
+                self.translation_service._cache_key(input_text, target_language), translation_data
+            )
+        
+        result = self.translation_service._build_result(translation_data, metrics)
+        result["segments"] = translations
+        return result
+    
+    async def translate_async(self, input_text, target_language, plan, on_partial=None,
+                              cancel_token=None):
+        """translate 的异步版本，协程被取消时中断请求"""
+        cancel_token = cancel_token or CancelToken()
+        return await AsyncEngine.instance().run_blocking(
+            self.translate,
+            input_text,
+            target_language,
+            plan,
+            on_partial=on_partial,
+            cancel_token=cancel_token,
+            on_cancel=cancel_token.cancel
+        )
+
+
+class MultiTranslationService:
+    """多语言翻译服务，将同一原文翻译为多个目标语言
+    
+    支持两种策略（配置项 fanout_strategy）：
+    concurrent - 每个目标语言一个请求并发执行，先完成的语言先返回；
+    combined - 一次请求返回所有目标语言的译文，共享词汇分析。
+    """
+    
+    def __init__(self, translation_service, document_service):
+        """初始化多语言翻译服务"""
+        self.translation_service = translation_service
+        self.document_service = document_service
+    
+    def translate(self, input_text, target_languages, on_result=None, cancel_token=None):
+        """多语言翻译（同步接口）"""
+        return AsyncEngine.instance().run(self.translate_async(
+            input_text, target_languages, on_result, cancel_token
+        ))
+    
+    async def translate_async(self, input_text, target_languages, on_result=None, cancel_token=None):
+        """多语言翻译，每完成一个语言调用 on_result(语言, 结果)
+        
+        返回 {"results": {语言: 结果}, "metrics": 汇总指标}
+        """
+        start_time = time.perf_counter()
+        cancel_token = cancel_token or CancelToken()
+        strategy = self.translation_service.config.get("fanout_strategy", "concurrent")
+        
+        # 长文档只能按语言分别分块翻译
+        if strategy == "combined" and not self.document_service.needs_chunking(input_text):
+            results = await AsyncEngine.instance().run_blocking(
+                self.translation_service.translate_multi,
+                input_text,
+                target_languages,
+                cancel_token=cancel_token,
+                on_cancel=cancel_token.cancel
+            )
+            if on_result:
+                for language, result in results.items():
+                    on_result(language, result)
+        else:
+            strategy = "concurrent"
+            results = await self._translate_concurrent(input_text, target_languages, on_result,
+                                                       cancel_token)
+        
+        # 合并请求只计一次token用量
+        request_metrics = [result["metrics"] for result in results.values()]
+        if strategy == "combined":
+            request_metrics = request_metrics[:1]
+        
+        return {
+            "results": results,
+            "metrics": {
+                "strategy": strategy,
+                "languages": len(target_languages),
+                "total_time": time.perf_counter() - start_time,
+                "prompt_tokens": sum(m.get("prompt_tokens", 0) for m in request_metrics),
+                "completion_tokens": sum(m.get("completion_tokens", 0) for m in request_metrics),
+                "estimated_prompt_tokens": sum(m.get("estimated_prompt_tokens", 0) for m in request_metrics),
+                "estimated_completion_tokens": sum(m.get("estimated_completion_tokens", 0)
+                                                   for m in request_metrics)
+            }
+        }
+    
+    async def _translate_concurrent(self, input_text, target_languages, on_result, cancel_token):
+        """每个目标语言单独请求并发翻译"""
+        use_document = self.document_service.needs_chunking(input_text)
+        
+        async def translate_language(language):
+            if use_document:
+                result = await self.document_service.translate_async(
+                    input_text, language, cancel_token=cancel_token
+                )
+            else:
+                result = await self.translation_service.translate_async(
+                    input_text, language, cancel_token=cancel_token
+                )
+            if on_result:
+                on_result(language, result)
+            return language, result
+        
+        tasks = [asyncio.ensure_future(translate_language(language)) for language in target_languages]
+        try:
+            results = dict(await asyncio.gather(*tasks))
+        except BaseException:
+            cancel_token.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        return {language: results[language] for language in target_languages}
+
+
+def percentile(values, fraction):
+    """返回 values 的百分位数（线性插值），values 为空时返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class BatchTranslationService:
+    """批量翻译服务，并发翻译文件或标准输入中的多条记录
     
-    def translate(self, input_text, target_language):
-        """执行翻译并返回结果"""
-        # 更新配置
-        self.update_config()
+    记录格式为 {"id": 标识, "text": 原文, "target_language": 目标语言(可选)}，
+    使用与界面相同的提示词、解析流程和本地缓存。
+    """
+    
+    def __init__(self, translation_service):
+        """初始化批量翻译服务"""
+        self.translation_service = translation_service
+    
+    @staticmethod
+    def read_records(lines, input_format="lines"):
+        """逐行解析输入记录
         
-        # 调用API执行翻译
-        translation_data = self.translation_api.translate(input_text, target_language)
+        lines 格式每个非空行为一条记录，标识为行号；
+        jsonl 格式每行一个JSON对象，包含 text 以及可选的 id 和 target_language。
+        无法解析的行产生以行号为标识、带 error 字段的记录，不中断后续记录的读取。
+        """
+        for number, line in enumerate(lines, 1):
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            
+            if input_format == "jsonl":
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    yield {"id": number, "text": "", "error": f"第 {number} 行不是有效的JSON: {str(e)}"}
+                    continue
+                if isinstance(item, str):
+                    item = {"text": item}
+                if not isinstance(item, dict):
+                    yield {"id": number, "text": "", "error": f"第 {number} 行不是JSON对象或字符串"}
+                    continue
+                record = {"id": item.get("id", number), "text": item.get("text", "")}
+                if item.get("target_language"):
+                    record["target_language"] = item["target_language"]
+            else:
+                record = {"id": number, "text": line}
+            yield record
+    
+    @staticmethod
+    def completed_ids(lines):
+        """从已有的输出中找出已成功翻译的记录标识，用于断点续传"""
+        done = set()
+        for line in lines:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # 中断时可能留下写了一半的行
+                continue
+            if isinstance(item, dict) and "translation" in item and "error" not in item:
+                done.add(str(item.get("id")))
+        return done
+    
+    def translate(self, records, target_language, concurrency=4, on_result=None, cancel_token=None):
+        """批量翻译（同步接口）"""
+        return AsyncEngine.instance().run(self.translate_async(
+            records, target_language, concurrency, on_result, cancel_token
+        ))
+    
+    async def translate_async(self, records, target_language, concurrency=4, on_result=None,
+                              cancel_token=None):
+        """以 concurrency 个并发任务翻译记录，每完成一条调用 on_result(输出记录)
         
-        # 格式化词汇信息
-        analysis_text = self.format_vocabulary(translation_data.get("vocabulary", []))
+        records 可以是生成器（如逐行读取标准输入），在独立的读取线程中按需读取，
+        经队列交给并发任务，读取输入时不阻塞事件循环；返回吞吐量统计。
+        """
+        cancel_token = cancel_token or CancelToken()
+        loop = asyncio.get_running_loop()
+        workers_count = max(1, concurrency)
+        pending = asyncio.Queue()
+        # 队列中至多有 2 倍并发数的未处理记录，读取快于翻译时读取线程等待
+        slots = threading.Semaphore(workers_count * 2)
+        latencies = []
+        stats = {"succeeded": 0, "failed": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        start_time = time.perf_counter()
         
-        return {
-            "translation": translation_data.get("translation", ""),
-            "analysis": analysis_text
-        }
+        def read():
+            """读取线程：逐条放入队列，结束时为每个任务放入 None，读取出错时放入异常"""
+            end = None
+            try:
+                for record in records:
+                    while not slots.acquire(timeout=0.1):
+                        if cancel_token.cancelled:
+                            return
+                    loop.call_soon_threadsafe(pending.put_nowait, record)
+            except Exception as e:
+                end = e
+            for _ in range(workers_count):
+                loop.call_soon_threadsafe(pending.put_nowait, end)
+        
+        async def worker():
+            while True:
+                record = await pending.get()
+                if record is None:
+                    return
+                if isinstance(record, Exception):
+                    raise record
+                slots.release()
+                language = record.get("target_language") or target_language
+                output = {"id": record["id"], "text": record["text"], "target_language": language}
+                if record.get("error"):
+                    # 无法解析的输入行记为失败，继续处理其后的记录
+                    stats["failed"] += 1
+                    output["error"] = record["error"]
+                    if on_result:
+                        on_result(output)
+                    continue
+                record_start = time.perf_counter()
+                try:
+                    result = await self.translation_service.translate_async(
+                        record["text"], language, cancel_token=cancel_token
+                    )
+                except TranslationCancelled:
+                    raise
+                except Exception as e:
+                    stats["failed"] += 1
+                    output["error"] = str(e)
+                else:
+                    latency = time.perf_counter() - record_start
+                    metrics = result["metrics"]
+                    latencies.append(latency)
+                    stats["succeeded"] += 1
+                    stats["cached"] += 1 if metrics.get("cached") else 0
+                    stats["prompt_tokens"] += metrics.get("prompt_tokens", 0)
+                    stats["completion_tokens"] += metrics.get("completion_tokens", 0)
+                    output.update({
+                        "translation": result["translation"],
+                        "vocabulary": result["vocabulary"],
+                        "cached": bool(metrics.get("cached")),
+                        "latency": round(latency, 3),
+                        "usage": {
+                            "prompt_tokens": metrics.get("prompt_tokens", 0),
+                            "completion_tokens": metrics.get("completion_tokens", 0),
+                            "estimated_prompt_tokens": metrics.get("estimated_prompt_tokens", 0),
+                            "estimated_completion_tokens": metrics.get("estimated_completion_tokens", 0)
+                        }
+                    })
+                    if metrics.get("glossary_violations"):
+                        output["glossary_violations"] = metrics["glossary_violations"]
+                if on_result:
+                    on_result(output)
+        
+        # 守护线程：中断时即使仍阻塞在读取标准输入也不妨碍进程退出
+        threading.Thread(target=read, name="batch-reader", daemon=True).start()
+        workers = [asyncio.ensure_future(worker()) for _ in range(workers_count)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            cancel_token.cancel()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+        
+        elapsed = time.perf_counter() - start_time
+        tokens = stats["prompt_tokens"] + stats["completion_tokens"]
+        stats.update({
+            "records": stats["succeeded"] + stats["failed"],
+            "elapsed": elapsed,
+            "records_per_second": (stats["succeeded"] + stats["failed"]) / elapsed if elapsed else 0.0,
+            "tokens_per_second": tokens / elapsed if elapsed else 0.0,
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p95": percentile(latencies, 0.95)
+        })
+        return stats
 
 
 class FlomoService:
@@ -294,12 +3655,17 @@ class FlomoService:
         self.config_manager = config_manager
         self.config = config_manager.load_config()
         self.flomo_api = FlomoAPI(self.config)
+        self.config_manager.add_listener(self.on_config_changed)
     
-    def update_config(self):
-        """更新配置"""
-        self.config = self.config_manager.load_config()
+    def on_config_changed(self, config):
+        """配置变更时重建Flomo API"""
+        self.config = config
         self.flomo_api = FlomoAPI(self.config)
     
+    def update_config(self):
+        """更新配置（配置未变化时不会重建API）"""
+        self.config_manager.load_config()
+    
     def save_to_flomo(self, input_text, translation_text, analysis_text):
         """保存到Flomo"""
         # 更新配置
@@ -307,56 +3673,318 @@ class FlomoService:
         
         # 调用API保存到Flomo
         return self.flomo_api.save_note(input_text, translation_text, analysis_text)
+    
+    async def save_to_flomo_async(self, input_text, translation_text, analysis_text):
+        """save_to_flomo 的异步版本，在异步引擎中执行"""
+        return await AsyncEngine.instance().run_blocking(
+            self.save_to_flomo, input_text, translation_text, analysis_text
+        )
+
+
+class FlomoSyncQueue:
+    """Flomo后台同步队列
+    
+    笔记先追加写入本地日志文件后立即返回，由异步引擎中的后台任务逐条发送；
+    网络错误等暂时性失败按指数退避重试，相同笔记在队列中只保留一份，重启后继续同步未完成的笔记。
+    未配置Flomo Key、4xx 响应等重试也不会成功的错误，以及重试 FLOMO_MAX_ATTEMPTS 次仍失败的笔记
+    会被暂停，不再阻塞其后的笔记；再次保存同一笔记时重新加入队列。
+    """
+    
+    def __init__(self, flomo_service, journal_file=FLOMO_QUEUE_FILE, on_status=None):
+        """初始化同步队列并从日志恢复未完成的笔记"""
+        self.flomo_service = flomo_service
+        self.journal_file = journal_file
+        self.on_status = on_status
+        self.pending = {}
+        self.parked = {}
+        self.attempts = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wake = None
+        self._future = None
+        self._load()
+    
+    @staticmethod
+    def note_id(input_text, translation_text, analysis_text):
+        """笔记的去重标识"""
+        raw = json.dumps([input_text, translation_text, analysis_text], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def _load(self):
+        """重放日志，恢复未同步的笔记并压缩日志"""
+        if not os.path.exists(self.journal_file):
+            return
+        
+        compact = False
+        try:
+            with open(self.journal_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 忽略写入中断造成的残缺行
+                        compact = True
+                        continue
+                    if record.get("op") == "add":
+                        self.pending[record["id"]] = record["note"]
+                        self.parked.pop(record["id"], None)
+                    elif record.get("op") == "park":
+                        self.parked[record["id"]] = self.pending.pop(record["id"], record.get("note"))
+                        compact = True
+                    elif record.get("op") == "done":
+                        self.pending.pop(record["id"], None)
+                        compact = True
+            
+            if compact:
+                temp_file = self.journal_file + ".tmp"
+                with open(temp_file, "w", encoding="utf-8") as f:
+                    for note_id, note in self.pending.items():
+                        f.write(json.dumps({"op": "add", "id": note_id, "note": note},
+                                           ensure_ascii=False) + "\n")
+                    for note_id, note in self.parked.items():
+                        f.write(json.dumps({"op": "park", "id": note_id, "note": note},
+                                           ensure_ascii=False) + "\n")
+                os.replace(temp_file, self.journal_file)
+        except OSError as e:
+            print(f"加载Flomo同步队列失败: {str(e)}")
+    
+    def _append(self, record):
+        """追加一条日志记录并落盘"""
+        try:
+            with open(self.journal_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            print(f"写入Flomo同步队列失败: {str(e)}")
+    
+    @staticmethod
+    def is_permanent(error):
+        """重试也不会成功的错误：未配置Flomo Key，或除 408/429 以外的 4xx 响应"""
+        if isinstance(error, ValueError):
+            return True
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        return status is not None and 400 <= status < 500 and status not in (408, 429)
+    
+    def _report(self, message):
+        """报告队列状态"""
+        if self.on_status:
+            self.on_status(len(self.pending), message)
+    
+    def start(self):
+        """在异步引擎中启动后台同步任务"""
+        if self._future is None or self._future.done():
+            self._future = AsyncEngine.instance().submit(self._run())
+    
+    def stop(self):
+        """停止后台同步任务，未同步的笔记保留在日志中"""
+        if self._future is not None:
+            self._future.cancel()
+    
+    def enqueue(self, input_text, translation_text, analysis_text):
+        """加入同步队列，相同笔记已在队列中时返回 False"""
+        note_id = self.note_id(input_text, translation_text, analysis_text)
+        note = {
+            "input_text": input_text,
+            "translation_text": translation_text,
+            "analysis_text": analysis_text
+        }
+        
+        with self._lock:
+            if note_id in self.pending:
+                return False
+            self.parked.pop(note_id, None)
+            self.pending[note_id] = note
+            self._append({"op": "add", "id": note_id, "note": note})
+        
+        self._report("已加入Flomo同步队列")
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        return True
+    
+    async def _run(self):
+        """后台同步循环"""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        
+        while True:
+            self._wake.clear()
+            with self._lock:
+                next_note = next(iter(self.pending.items()), None)
+            if next_note is None:
+                await self._wake.wait()
+                continue
+            
+            note_id, note = next_note
+            try:
+                await self.flomo_service.save_to_flomo_async(
+                    note["input_text"], note["translation_text"], note["analysis_text"]
+                )
+            except Exception as e:
+                self.attempts += 1
+                if self.is_permanent(e) or self.attempts >= FLOMO_MAX_ATTEMPTS:
+                    # 暂停该笔记，继续同步其后的笔记
+                    self.attempts = 0
+                    with self._lock:
+                        self.pending.pop(note_id, None)
+                        self.parked[note_id] = note
+                        self._append({"op": "park", "id": note_id, "note": note})
+                    self._report(f"Flomo同步失败，已暂停该笔记（修正后再次保存即可重新同步）: {str(e)}")
+                    continue
+                delay = min(FLOMO_RETRY_BASE * 2 ** (self.attempts - 1), FLOMO_RETRY_MAX)
+                self._report(f"Flomo同步失败，{delay}秒后重试: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+            
+            self.attempts = 0
+            with self._lock:
+                self.pending.pop(note_id, None)
+                self._append({"op": "done", "id": note_id})
+            self._report("已保存到Flomo")
 
 
 class TTSService:
-    """TTS服务类，负责文本朗读功能的实现"""
+    """TTS服务类，负责文本朗读功能的实现
+    
+    引擎只初始化一次；pyttsx3 引擎需要在创建它的线程中使用，其他线程通过 read_text 的
+    should_stop 请求中断，由引擎线程在朗读下一个单词前自行停止。
+    """
+    
+    # 朗读分段的最大长度（字符）
+    MAX_SEGMENT_LENGTH = 200
     
     def __init__(self):
         """初始化TTS服务"""
-        self.tts_engine = pyttsx3.init()
-    
-    def read_text(self, text):
-        """朗读文本"""
-        if not text.strip():
-            raise ValueError("没有可朗读的文本")
+        self.tts_engine = lazy_import("pyttsx3").init()
         
         # 设置TTS属性
         self.tts_engine.setProperty('rate', 150)  # 语速
         self.tts_engine.setProperty('volume', 1.0)  # 音量
         
+        # 朗读每个单词前检查是否需要中断
+        self._should_stop = None
+        self.tts_engine.connect('started-word', self._on_word)
+    
+    def split_text(self, text):
+        """将文本切分为适合逐段朗读的句子，过短的句子与后文合并"""
+        segments = []
+        for line in text.splitlines():
+            for sentence in split_sentences(line.strip()):
+                sentence = sentence.strip()
+                if not sentence:
+                    continue
+                if segments and len(segments[-1]) + len(sentence) < self.MAX_SEGMENT_LENGTH // 4:
+                    segments[-1] += " " + sentence
+                else:
+                    segments.append(sentence)
+        return segments
+    
+    def read_text(self, text, should_stop=None):
+        """朗读文本，期间 should_stop() 返回 True 时在下一个单词处中断"""
+        if not text.strip():
+            raise ValueError("没有可朗读的文本")
+        
         # 朗读文本
-        self.tts_engine.say(text)
+        self._should_stop = should_stop
+        try:
+            self.tts_engine.say(text)
+            self.tts_engine.runAndWait()
+        finally:
+            self._should_stop = None
+    
+    def _on_word(self, name, location, length):
+        """引擎线程中的单词回调，需要中断时停止引擎"""
+        if self._should_stop is not None and self._should_stop():
+            self.tts_engine.stop()
+    
+    @property
+    def voice(self):
+        """当前音色"""
+        return self.tts_engine.getProperty('voice')
+    
+    @property
+    def rate(self):
+        """当前语速"""
+        return self.tts_engine.getProperty('rate')
+    
+    @staticmethod
+    def can_play_files():
+        """是否支持直接播放缓存的音频文件"""
+        return winsound is not None
+    
+    def synthesize(self, text, path):
+        """将文本合成为WAV文件"""
+        self.tts_engine.save_to_file(text, path)
         self.tts_engine.runAndWait()
+    
+    def play_file(self, path, should_stop):
+        """播放WAV文件，期间 should_stop() 返回 True 时中断"""
+        with wave.open(path, "rb") as wav:
+            duration = wav.getnframes() / float(wav.getframerate() or 1)
+        
+        winsound.PlaySound(path, winsound.SND_FILENAME | winsound.SND_ASYNC)
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            if should_stop():
+                winsound.PlaySound(None, 0)
+                return
+            time.sleep(0.05)
 
 
 # ========================================
 # 3. 业务控制层 (Controller Layer)
 # ========================================
 
-class TranslationController(QThread):
-    """翻译控制器，负责异步执行翻译任务"""
+class TranslationController(QObject):
+    """翻译控制器，负责在异步引擎中执行翻译任务并通过信号通知界面"""
     
     # 定义信号
     translation_complete = pyqtSignal(dict)
     translation_error = pyqtSignal(str)
+    translation_partial = pyqtSignal(str)
+    vocabulary_partial = pyqtSignal(str)
+    finished = pyqtSignal()
     
-    def __init__(self, translation_service, input_text, target_language):
+    def __init__(self, translation_service, input_text, target_language, use_cache=True,
+                 request_id=0):
         """初始化翻译控制器"""
         super().__init__()
         self.translation_service = translation_service
         self.input_text = input_text
         self.target_language = target_language
+        self.use_cache = use_cache
+        self.request_id = request_id
+        self.cancel_token = CancelToken()
+        self.future = None
         self.is_running = True
     
-    def run(self):
+    def start(self):
+        """提交翻译任务到异步引擎"""
+        self.future = AsyncEngine.instance().submit(self.run())
+    
+    def isRunning(self):
+        """任务是否仍在执行"""
+        return self.future is not None and not self.future.done()
+    
+    async def execute(self):
+        """执行翻译，返回结果"""
+        # 执行翻译，流式输出时逐步发送已翻译的文本
+        return await self.translation_service.translate_async(
+            self.input_text,
+            self.target_language,
+            on_partial=self.emit_partial,
+            on_vocabulary=self.emit_vocabulary,
+            use_cache=self.use_cache,
+            cancel_token=self.cancel_token
+        )
+    
+    async def run(self):
         """执行翻译任务"""
         try:
             if not self.is_running:
                 return
             
-            # 执行翻译
-            result = self.translation_service.translate(self.input_text, self.target_language)
+            result = await self.execute()
             
             if not self.is_running:
                 return
@@ -364,38 +3992,693 @@ class TranslationController(QThread):
             # 发送完成信号
             self.translation_complete.emit(result)
             
+        except (TranslationCancelled, asyncio.CancelledError):
+            pass
         except Exception as e:
             if self.is_running:
                 self.translation_error.emit(str(e))
+        finally:
+            self.finished.emit()
+    
+    def emit_partial(self, text):
+        """发送部分翻译结果"""
+        if self.is_running:
+            self.translation_partial.emit(text)
+    
+    def emit_vocabulary(self, analysis):
+        """发送部分词汇分析结果"""
+        if self.is_running:
+            self.vocabulary_partial.emit(analysis)
     
     def stop(self):
-        """停止翻译任务"""
+        """停止翻译任务，中断正在进行的请求并立即返回
+        
+        任务会在后台自行结束，其结果会被丢弃。
+        """
         self.is_running = False
-        self.wait()
+        self.cancel_token.cancel()
+        if self.future is not None:
+            self.future.cancel()
+
+
+class DocumentTranslationController(TranslationController):
+    """长文档翻译控制器，负责在异步引擎中执行分块翻译任务并报告进度"""
+    
+    # 定义信号
+    chunk_progress = pyqtSignal(int, int)
+    
+    def __init__(self, document_service, input_text, target_language, request_id=0):
+        """初始化长文档翻译控制器"""
+        super().__init__(document_service.translation_service, input_text, target_language,
+                         request_id=request_id)
+        self.document_service = document_service
+    
+    async def execute(self):
+        """执行分块翻译，返回结果"""
+        return await self.document_service.translate_async(
+            self.input_text,
+            self.target_language,
+            on_progress=self.emit_progress,
+            on_partial=self.emit_partial,
+            cancel_token=self.cancel_token
+        )
+    
+    def emit_progress(self, done, total):
+        """发送分块进度"""
+        if self.is_running:
+            self.chunk_progress.emit(done, total)
+
+
+class IncrementalTranslationController(TranslationController):
+    """增量翻译控制器，负责在异步引擎中只重新翻译改动过的句子"""
+    
+    def __init__(self, incremental_service, input_text, target_language, plan, request_id=0):
+        """初始化增量翻译控制器"""
+        super().__init__(incremental_service.translation_service, input_text, target_language,
+                         request_id=request_id)
+        self.incremental_service = incremental_service
+        self.plan = plan
+    
+    async def execute(self):
+        """执行增量翻译，返回结果"""
+        return await self.incremental_service.translate_async(
+            self.input_text,
+            self.target_language,
+            self.plan,
+            on_partial=self.emit_partial,
+            cancel_token=self.cancel_token
+        )
+
+
+class MultiTranslationController(TranslationController):
+    """多语言翻译控制器，负责在异步引擎中执行多目标语言翻译任务"""
+    
+    # 定义信号
+    language_complete = pyqtSignal(str, dict)
+    
+    def __init__(self, multi_service, input_text, target_languages, request_id=0):
+        """初始化多语言翻译控制器"""
+        super().__init__(multi_service.translation_service, input_text, target_languages[0],
+                         request_id=request_id)
+        self.multi_service = multi_service
+        self.target_languages = target_languages
+    
+    async def execute(self):
+        """执行多语言翻译，返回汇总结果"""
+        return await self.multi_service.translate_async(
+            self.input_text,
+            self.target_languages,
+            on_result=self.emit_language,
+            cancel_token=self.cancel_token
+        )
+    
+    def emit_language(self, language, result):
+        """发送单个语言的翻译结果"""
+        if self.is_running:
+            self.language_complete.emit(language, result)
+
+
+class FlomoSyncController(QObject):
+    """Flomo同步控制器，负责将后台同步队列的状态转发为界面信号"""
+    
+    # 定义信号 (待同步数量, 状态消息)
+    status_changed = pyqtSignal(int, str)
+    
+    def __init__(self, flomo_service):
+        """初始化Flomo同步控制器并启动后台同步"""
+        super().__init__()
+        self.queue = FlomoSyncQueue(flomo_service, on_status=self.status_changed.emit)
+        self.queue.start()
+    
+    def enqueue(self, input_text, translation_text, analysis_text):
+        """加入同步队列，立即返回"""
+        return self.queue.enqueue(input_text, translation_text, analysis_text)
+    
+    def stop(self):
+        """停止后台同步"""
+        self.queue.stop()
+
+
+class TTSController(QThread):
+    """TTS控制器，在专用线程中持有TTS引擎并按队列逐段朗读
+    
+    朗读任务优先于预合成任务；已缓存的片段直接播放音频文件，未缓存的片段直接朗读，
+    并在空闲时预合成以便下次立即播放。
+    """
+    
+    # 定义信号
+    playback_started = pyqtSignal()
+    playback_progress = pyqtSignal(int, int)
+    playback_finished = pyqtSignal()
+    playback_error = pyqtSignal(str)
+    
+    # 队列优先级
+    PRIORITY_SHUTDOWN = 0
+    PRIORITY_SPEAK = 1
+    PRIORITY_PRERENDER = 2
+    
+    def __init__(self, audio_cache=None):
+        """初始化TTS控制器"""
+        super().__init__()
+        self.audio_cache = audio_cache
+        self.jobs = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.tts_service = None
+        self.generation = 0
+        self.is_speaking = False
+    
+    def _put(self, priority, item):
+        """加入任务队列，同优先级按加入顺序执行"""
+        self.jobs.put((priority, next(self.sequence), item))
+    
+    def speak(self, text):
+        """加入朗读队列，立即返回"""
+        if not text.strip():
+            raise ValueError("没有可朗读的文本")
+        self._put(self.PRIORITY_SPEAK, ("speak", self.generation, text))
+    
+    def prerender(self, texts):
+        """在空闲时预合成文本的音频"""
+        if self.audio_cache is None or not TTSService.can_play_files():
+            return
+        for text in texts:
+            if text.strip():
+                self._put(self.PRIORITY_PRERENDER, ("prerender", None, text.strip()))
+    
+    def stop_playback(self):
+        """停止当前朗读并丢弃排队中的朗读任务
+        
+        只更新朗读代数，由朗读线程在下一个单词（或播放音频的下一次检查）时自行停止，
+        不在界面线程中操作TTS引擎。
+        """
+        self.generation += 1
+    
+    def shutdown(self):
+        """停止朗读并结束线程"""
+        self.stop_playback()
+        self._put(self.PRIORITY_SHUTDOWN, None)
+        self.wait(2000)
+    
+    def _cached_audio(self, text):
+        """返回文本已缓存的音频文件"""
+        if self.audio_cache is None or not TTSService.can_play_files():
+            return None
+        return self.audio_cache.get(text, self.tts_service.voice, self.tts_service.rate)
+    
+    def _render(self, text):
+        """合成文本音频并加入缓存"""
+        if self.audio_cache.get(text, self.tts_service.voice, self.tts_service.rate):
+            return
+        self.audio_cache.put(text, self.tts_service.voice, self.tts_service.rate,
+                             lambda path: self.tts_service.synthesize(text, path))
+    
+    def _speak(self, generation, text):
+        """逐段朗读文本"""
+        self.is_speaking = True
+        self.playback_started.emit()
+        missed = []
+        try:
+            segments = self.tts_service.split_text(text)
+            for index, segment in enumerate(segments, 1):
+                if generation != self.generation:
+                    break
+                
+                path = self._cached_audio(segment)
+                if path:
+                    self.tts_service.play_file(path, lambda: generation != self.generation)
+                else:
+                    self.tts_service.read_text(segment, lambda: generation != self.generation)
+                    missed.append(segment)
+                self.playback_progress.emit(index, len(segments))
+        except Exception as e:
+            self.playback_error.emit(str(e))
+        finally:
+            self.is_speaking = False
+            self.playback_finished.emit()
+        
+        # 未缓存的片段在空闲时补充合成
+        self.prerender(missed)
+    
+    def run(self):
+        """朗读线程主循环"""
+        try:
+            self.tts_service = TTSService()
+        except Exception as e:
+            self.playback_error.emit(f"初始化TTS引擎失败: {str(e)}")
+            return
+        
+        while True:
+            _, _, item = self.jobs.get()
+            if item is None:
+                return
+            
+            kind, generation, text = item
+            if kind == "speak":
+                if generation == self.generation:
+                    self._speak(generation, text)
+            else:
+                try:
+                    self._render(text)
+                except Exception as e:
+                    print(f"预合成音频失败: {str(e)}")
 
 
-class HotkeyController:
-    """热键控制器，负责全局热键的设置和管理"""
+class HotkeyController(QObject):
+    """热键控制器，负责全局热键的设置和管理
     
-    def __init__(self, callback):
+    keyboard 在自己的线程中回调，通过 activated 信号转到主线程处理。
+    """
+    
+    # 定义信号
+    activated = pyqtSignal()
+    capture_activated = pyqtSignal()
+    
+    def __init__(self, callback, capture_callback=None):
         """初始化热键控制器"""
-        self.callback = callback
+        super().__init__()
+        self.activated.connect(callback)
+        if capture_callback is not None:
+            self.capture_activated.connect(capture_callback)
         self.current_hotkey = None
+        self.capture_hotkey = None
     
-    def setup_hotkey(self, hotkey):
-        """设置全局热键"""
+    def _on_capture(self):
+        """划词翻译热键：先复制当前选中的文本，再通知主线程读取剪贴板"""
+        keyboard = lazy_import("keyboard")
         try:
+            keyboard.send("ctrl+c")
+        except Exception as e:
+            print(f"复制选中文本失败: {str(e)}")
+        self.capture_activated.emit()
+    
+    def setup_hotkey(self, hotkey, capture_hotkey=""):
+        """设置全局热键，capture_hotkey 非空时同时设置划词翻译热键"""
+        try:
+            keyboard = lazy_import("keyboard")
+            
             # 清除旧的热键
             try:
-                keyboard.clear_all_hotkeys()
-            except AttributeError:
-                pass
-            
-            # 设置新的热键
-            keyboard.add_hotkey(hotkey, self.callback)
-            self.current_hotkey = hotkey
+                keyboard.clear_all_hotkeys()
+            except AttributeError:
+                pass
+            
+            # 设置新的热键
+            keyboard.add_hotkey(hotkey, self.activated.emit)
+            self.current_hotkey = hotkey
+            
+            # 松开按键后再复制，避免按住的修饰键与 ctrl+c 组合
+            self.capture_hotkey = None
+            if capture_hotkey:
+                keyboard.add_hotkey(capture_hotkey, self._on_capture, trigger_on_release=True)
+                self.capture_hotkey = capture_hotkey
+        except Exception as e:
+            print(f"设置快捷键失败: {str(e)}")
+
+
+class SingleInstanceController(QObject):
+    """单实例控制器，通过本地套接字把再次启动时的参数转发给已运行的实例"""
+    
+    # 定义信号
+    message_received = pyqtSignal(list)
+    
+    def __init__(self, server_name=SINGLE_INSTANCE_NAME):
+        """初始化单实例控制器"""
+        super().__init__()
+        self.server_name = server_name
+        self.server = None
+    
+    @staticmethod
+    def _connect(server_name, timeout_ms):
+        """连接已运行的实例，没有运行中的实例时返回 None"""
+        connection = lazy_import("PyQt6.QtNetwork").QLocalSocket()
+        connection.connectToServer(server_name)
+        if not connection.waitForConnected(timeout_ms):
+            return None
+        return connection
+    
+    @classmethod
+    def is_running(cls, server_name=SINGLE_INSTANCE_NAME, timeout_ms=500):
+        """是否已有运行中的实例，不发送任何参数"""
+        connection = cls._connect(server_name, timeout_ms)
+        if connection is None:
+            return False
+        connection.disconnectFromServer()
+        return True
+    
+    @classmethod
+    def forward(cls, args, server_name=SINGLE_INSTANCE_NAME, timeout_ms=500):
+        """将参数发送给已运行的实例，没有运行中的实例时返回 False"""
+        connection = cls._connect(server_name, timeout_ms)
+        if connection is None:
+            return False
+        
+        connection.write(json.dumps(args, ensure_ascii=False).encode("utf-8") + b"\n")
+        sent = connection.waitForBytesWritten(timeout_ms)
+        connection.disconnectFromServer()
+        return sent
+    
+    def listen(self):
+        """开始监听后续启动的实例"""
+        QLocalServer = lazy_import("PyQt6.QtNetwork").QLocalServer
+        self.server = QLocalServer(self)
+        if not self.server.listen(self.server_name):
+            # 上次异常退出时残留的套接字文件
+            QLocalServer.removeServer(self.server_name)
+            if not self.server.listen(self.server_name):
+                print(f"单实例监听失败: {self.server.errorString()}")
+                return False
+        
+        self.server.newConnection.connect(self._on_new_connection)
+        return True
+    
+    def _on_new_connection(self):
+        """接受新的连接"""
+        while self.server.hasPendingConnections():
+            connection = self.server.nextPendingConnection()
+            connection.readyRead.connect(lambda connection=connection: self._read(connection))
+            connection.disconnected.connect(connection.deleteLater)
+            # 连接建立前已到达的数据不会再触发 readyRead
+            self._read(connection)
+    
+    def _read(self, connection):
+        """读取按行发送的JSON参数列表"""
+        while connection.canReadLine():
+            line = bytes(connection.readLine()).decode("utf-8", errors="replace")
+            try:
+                args = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(args, list):
+                self.message_received.emit([str(arg) for arg in args])
+
+
+class InvalidRequestError(ValueError):
+    """翻译服务器收到的请求参数无效"""
+
+
+class TranslationServer:
+    """本地翻译服务器，只监听本机地址，供其他工具复用已配置的翻译服务
+    
+    POST /translate         {"text": 原文, "target_language": 目标语言} -> 翻译结果JSON
+    POST /translate/stream  同上，以 Server-Sent Events 逐步返回译文
+    GET  /metrics           Prometheus 文本格式的运行指标
+    
+    相同的并发请求只调用一次上游接口；同时调用上游的请求数不超过 max_concurrency。
+    """
+    
+    LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+    # 延迟分位数统计的样本数
+    LATENCY_WINDOW = 1000
+    
+    def __init__(self, translation_service, host="127.0.0.1", port=8765, max_concurrency=4,
+                 queue_timeout=30):
+        """初始化并绑定端口"""
+        if host not in self.LOCAL_HOSTS:
+            raise ValueError("翻译服务器只允许监听本机地址")
+        
+        self.translation_service = translation_service
+        self.slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self.queue_timeout = queue_timeout
+        self.metrics_lock = threading.Lock()
+        self.counters = {"requests": 0, "upstream": 0, "cached": 0, "errors": 0, "rejected": 0,
+                         "glossary_violations": 0}
+        self.in_flight = 0
+        self.latencies = collections.deque(maxlen=self.LATENCY_WINDOW)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        
+        self.httpd = lazy_import("http.server").ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.httpd.translation_server = self
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _handler_class():
+        """请求处理类，首次启动服务器时才导入 http.server"""
+        BaseHTTPRequestHandler = lazy_import("http.server").BaseHTTPRequestHandler
+        return type("TranslationRequestHandler", (TranslationRequestHandler, BaseHTTPRequestHandler), {})
+    
+    @property
+    def url(self):
+        """服务器地址"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def serve_forever(self):
+        """处理请求直到 shutdown()"""
+        self.httpd.serve_forever()
+    
+    def shutdown(self):
+        """停止服务器"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def _count(self, name, value=1):
+        """累加计数器"""
+        with self.metrics_lock:
+            self.counters[name] += value
+    
+    def translate(self, payload, on_partial=None, on_vocabulary=None):
+        """处理一次翻译请求，返回翻译结果
+        
+        参数错误抛出 InvalidRequestError；等待并发名额超时抛出 TimeoutError。
+        """
+        if not isinstance(payload, dict) or not isinstance(payload.get("text"), str):
+            raise InvalidRequestError("请求体必须是包含 text 字段的JSON对象")
+        text = payload["text"].strip()
+        if not text:
+            raise InvalidRequestError("text 不能为空")
+        target_language = str(payload.get("target_language") or "英语")
+        use_cache = bool(payload.get("use_cache", True))
+        
+        self._count("requests")
+        start_time = time.perf_counter()
+        
+        # 相同的请求正在进行时直接加入，不占用并发名额
+        key = self.translation_service._cache_key(text, target_language)
+        holds_slot = not self.translation_service.single_flight.pending(key)
+        if holds_slot and not self.slots.acquire(timeout=self.queue_timeout):
+            self._count("rejected")
+            raise TimeoutError("服务器繁忙，请稍后重试")
+        with self.metrics_lock:
+            self.in_flight += 1
+        try:
+            # 相同的并发请求由 TranslationService 合并为一次API调用
+            result = self.translation_service.translate(
+                text, target_language, on_partial=on_partial, on_vocabulary=on_vocabulary,
+                use_cache=use_cache
+            )
+        except Exception:
+            self._count("errors")
+            raise
+        finally:
+            with self.metrics_lock:
+                self.in_flight -= 1
+            if holds_slot:
+                self.slots.release()
+        
+        metrics = result["metrics"]
+        if not metrics.get("coalesced"):
+            self._count("cached" if metrics.get("cached") else "upstream")
+            if metrics.get("glossary_violations"):
+                self._count("glossary_violations")
+        
+        latency = time.perf_counter() - start_time
+        with self.metrics_lock:
+            self.latencies.append(latency)
+            self.latency_sum += latency
+            self.latency_count += 1
+        return dict(result, coalesced=bool(metrics.get("coalesced")))
+    
+    def render_metrics(self):
+        """以 Prometheus 文本格式输出运行指标"""
+        with self.metrics_lock:
+            counters = dict(self.counters)
+            in_flight = self.in_flight
+            latencies = list(self.latencies)
+            latency_sum, latency_count = self.latency_sum, self.latency_count
+        cache = self.translation_service.cache.stats()
+        validation = TranslationAPI.validation_stats()
+        
+        lines = [
+            "# TYPE translator_requests_total counter",
+            f"translator_requests_total {counters['requests']}",
+            "# TYPE translator_upstream_requests_total counter",
+            f"translator_upstream_requests_total {counters['upstream']}",
+            "# TYPE translator_cached_responses_total counter",
+            f"translator_cached_responses_total {counters['cached']}",
+            "# TYPE translator_coalesced_requests_total counter",
+            f"translator_coalesced_requests_total {self.translation_service.single_flight.coalesced}",
+            "# TYPE translator_errors_total counter",
+            f"translator_errors_total {counters['errors']}",
+            "# TYPE translator_rejected_requests_total counter",
+            f"translator_rejected_requests_total {counters['rejected']}",
+            "# TYPE translator_in_flight gauge",
+            f"translator_in_flight {in_flight}",
+            "# TYPE translator_cache_entries gauge",
+            f"translator_cache_entries {cache['entries']}",
+            "# TYPE translator_cache_hit_rate gauge",
+            f"translator_cache_hit_rate {cache['hit_rate']:.4f}",
+            "# TYPE translator_invalid_responses_total counter",
+            f"translator_invalid_responses_total {validation['invalid']}",
+            "# TYPE translator_repaired_responses_total counter",
+            f"translator_repaired_responses_total {validation['locally_repaired']}",
+            "# TYPE translator_repair_retries_total counter",
+            f"translator_repair_retries_total {validation['retries']}",
+            "# TYPE translator_repair_retry_tokens_total counter",
+            f'translator_repair_retry_tokens_total{{type="prompt"}} {validation["retry_prompt_tokens"]}',
+            f'translator_repair_retry_tokens_total{{type="completion"}} {validation["retry_completion_tokens"]}',
+            "# TYPE translator_validation_failures_total counter",
+            f"translator_validation_failures_total {validation['failures']}",
+            "# TYPE translator_response_format_unsupported_total counter",
+            f"translator_response_format_unsupported_total {validation['response_format_unsupported']}",
+            "# TYPE translator_glossary_violations_total counter",
+            f"translator_glossary_violations_total {counters['glossary_violations']}",
+            "# TYPE translator_request_latency_seconds summary",
+        ]
+        for quantile in (0.5, 0.95, 0.99):
+            lines.append(f'translator_request_latency_seconds{{quantile="{quantile}"}} '
+                         f"{percentile(latencies, quantile):.4f}")
+        lines.append(f"translator_request_latency_seconds_sum {latency_sum:.4f}")
+        lines.append(f"translator_request_latency_seconds_count {latency_count}")
+        return "\n".join(lines) + "\n"
+
+
+class TranslationRequestHandler:
+    """本地翻译服务器的请求处理，与 BaseHTTPRequestHandler 组合使用（见 TranslationServer._handler_class）
+    
+    只监听本机地址并不能阻止浏览器中的网页向本机发送请求，因此：POST 必须是
+    application/json（浏览器的免预检请求无法使用该类型）；Host 必须是本机地址和监听端口
+    （防止 DNS 重绑定读取响应）；带 Origin 头的请求（来自网页）一律拒绝。
+    """
+    
+    protocol_version = "HTTP/1.1"
+    LOOPBACK_NAMES = ("localhost", "127.0.0.1", "::1")
+    
+    def log_message(self, format, *args):
+        """不输出访问日志"""
+        pass
+    
+    def _send(self, status, body, content_type):
+        """发送完整响应"""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_json(self, status, payload):
+        """发送JSON响应"""
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8")
+    
+    @staticmethod
+    def _error_status(error):
+        """异常对应的HTTP状态码：请求参数错误为 400，缺少配置为 500，繁忙为 503，上游错误为 502"""
+        if isinstance(error, InvalidRequestError):
+            return 400
+        if isinstance(error, ConfigurationError):
+            return 500
+        if isinstance(error, TimeoutError):
+            return 503
+        return 502
+    
+    def _host_allowed(self):
+        """Host 头是否为本机地址和监听端口"""
+        host = self.headers.get("Host", "")
+        parts = urlsplit(f"//{host}")
+        try:
+            port = parts.port or 80
+        except ValueError:
+            return False
+        return parts.hostname in self.LOOPBACK_NAMES and port == self.server.server_address[1]
+    
+    def _reject(self, require_json=False):
+        """检查请求来源和类型，不允许时发送错误响应并返回 True"""
+        if self.headers.get("Origin") is not None:
+            status, message = 403, "不接受来自网页的请求"
+        elif not self._host_allowed():
+            status, message = 403, "Host 必须是本机地址"
+        elif require_json and (self.headers.get("Content-Type", "").split(";")[0]
+                               .strip().lower() != "application/json"):
+            status, message = 415, "Content-Type 必须是 application/json"
+        else:
+            return False
+        
+        # 未读取请求体，发送响应后关闭连接
+        self.close_connection = True
+        self._send_json(status, {"error": message})
+        return True
+    
+    def do_GET(self):
+        """GET /metrics"""
+        if self._reject():
+            return
+        if urlsplit(self.path).path == "/metrics":
+            body = self.server.translation_server.render_metrics().encode("utf-8")
+            self._send(200, body, "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._send_json(404, {"error": "not found"})
+    
+    def do_POST(self):
+        """POST /translate 和 /translate/stream"""
+        path = urlsplit(self.path).path
+        if path not in ("/translate", "/translate/stream"):
+            self._send_json(404, {"error": "not found"})
+            return
+        if self._reject(require_json=True):
+            return
+        
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "请求体不是有效的JSON"})
+            return
+        
+        if path == "/translate/stream":
+            self._stream(payload)
+            return
+        
+        try:
+            result = self.server.translation_server.translate(payload)
+        except Exception as e:
+            self._send_json(self._error_status(e), {"error": str(e)})
+            return
+        self._send_json(200, result)
+    
+    def _stream(self, payload):
+        """以 Server-Sent Events 返回译文片段、词汇分析和最终结果"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        connected = True
+        
+        def send_event(event, data):
+            nonlocal connected
+            if not connected:
+                return
+            message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            try:
+                self.wfile.write(message.encode("utf-8"))
+                self.wfile.flush()
+            except OSError:
+                # 客户端已断开，翻译继续完成以便写入缓存和返回给合并的请求
+                connected = False
+        
+        try:
+            result = self.server.translation_server.translate(
+                payload,
+                on_partial=lambda text: send_event("partial", {"translation": text}),
+                on_vocabulary=lambda analysis: send_event("vocabulary", {"analysis": analysis})
+            )
         except Exception as e:
-            print(f"设置快捷键失败: {str(e)}")
+            send_event("error", {"error": str(e), "status": self._error_status(e)})
+            return
+        send_event("result", result)
 
 
 # ========================================
@@ -408,7 +4691,7 @@ class SettingsDialog(QDialog):
     def __init__(self, config_manager):
         super().__init__()
         self.setWindowTitle("设置")
-        self.setFixedSize(400, 350)
+        self.setFixedSize(400, 510)
         self.config_manager = config_manager
         
         # 创建布局
@@ -431,6 +4714,11 @@ class SettingsDialog(QDialog):
         self.hotkey_edit.setText("ctrl+alt+t")
         self.form_layout.addRow("全局快捷键:", self.hotkey_edit)
         
+        # Capture Hotkey
+        self.capture_hotkey_edit = QLineEdit()
+        self.capture_hotkey_edit.setPlaceholderText("例如 ctrl+alt+c，留空不启用")
+        self.form_layout.addRow("划词翻译快捷键:", self.capture_hotkey_edit)
+        
         # API Endpoint
         self.api_endpoint_edit = QLineEdit()
         self.api_endpoint_edit.setText("https://api.example.com/v1/chat/completions")
@@ -447,6 +4735,31 @@ class SettingsDialog(QDialog):
         self.skip_ssl_check.setChecked(False)
         self.form_layout.addRow("SSL校验:", self.skip_ssl_check)
         
+        # Stream Mode
+        self.stream_mode = QPushButton("流式输出")
+        self.stream_mode.setCheckable(True)
+        self.stream_mode.setChecked(True)
+        self.form_layout.addRow("输出方式:", self.stream_mode)
+        
+        # Vocabulary Mode
+        self.vocabulary_mode_combo = QComboBox()
+        for label, mode in (("自动（按原文长度）", "auto"), ("完整", "full"),
+                            ("简要", "brief"), ("只翻译（最快）", "none")):
+            self.vocabulary_mode_combo.addItem(label, mode)
+        self.form_layout.addRow("词汇分析:", self.vocabulary_mode_combo)
+        
+        # Response Format
+        self.response_format_combo = QComboBox()
+        for label, mode in (("关闭", "off"), ("JSON模式", "json_object"), ("JSON Schema", "json_schema")):
+            self.response_format_combo.addItem(label, mode)
+        self.form_layout.addRow("结构化输出:", self.response_format_combo)
+        
+        # Auto Translate
+        self.auto_translate = QPushButton("停止输入后自动翻译")
+        self.auto_translate.setCheckable(True)
+        self.auto_translate.setChecked(False)
+        self.form_layout.addRow("自动翻译:", self.auto_translate)
+        
         # 添加表单到布局
         self.layout.addLayout(self.form_layout)
         
@@ -473,9 +4786,16 @@ class SettingsDialog(QDialog):
                 self.api_key_edit.setText(config.get("api_key", ""))
                 self.flomo_key_edit.setText(config.get("flomo_key", ""))
                 self.hotkey_edit.setText(config.get("hotkey", "ctrl+alt+t"))
+                self.capture_hotkey_edit.setText(config.get("capture_hotkey", ""))
                 self.api_endpoint_edit.setText(config.get("api_endpoint", "https://api.example.com/v1/chat/completions"))
                 self.model_edit.setText(config.get("model", "gpt-3.5-turbo"))
                 self.skip_ssl_check.setChecked(config.get("skip_ssl_check", False))
+                self.stream_mode.setChecked(config.get("stream_mode", True))
+                self.auto_translate.setChecked(config.get("auto_translate", False))
+                index = self.vocabulary_mode_combo.findData(config.get("vocabulary_mode", "auto"))
+                self.vocabulary_mode_combo.setCurrentIndex(max(index, 0))
+                index = self.response_format_combo.findData(config.get("response_format", "off"))
+                self.response_format_combo.setCurrentIndex(max(index, 0))
         except Exception as e:
             QMessageBox.warning(self, "错误", f"加载设置失败: {str(e)}")
     
@@ -488,14 +4808,21 @@ class SettingsDialog(QDialog):
                 QMessageBox.warning(self, "输入错误", "Flomo Key Part 只能包含字母和数字")
                 return
             
-            config = {
+            # 保留对话框中未展示的高级配置项
+            config = self.config_manager.load_config()
+            config.update({
                 "api_key": self.api_key_edit.text(),
                 "flomo_key": flomo_key,
                 "hotkey": self.hotkey_edit.text(),
+                "capture_hotkey": self.capture_hotkey_edit.text().strip(),
                 "api_endpoint": self.api_endpoint_edit.text(),
                 "model": self.model_edit.text(),
-                "skip_ssl_check": self.skip_ssl_check.isChecked()
-            }
+                "skip_ssl_check": self.skip_ssl_check.isChecked(),
+                "stream_mode": self.stream_mode.isChecked(),
+                "auto_translate": self.auto_translate.isChecked(),
+                "vocabulary_mode": self.vocabulary_mode_combo.currentData(),
+                "response_format": self.response_format_combo.currentData()
+            })
             
             self.config_manager.save_config(config)
             self.accept()
@@ -503,6 +4830,206 @@ class SettingsDialog(QDialog):
             QMessageBox.warning(self, "错误", f"保存设置失败: {str(e)}")
 
 
+class HistoryDialog(QDialog):
+    """翻译历史对话框，搜索历史记录并重新打开其结果
+    
+    列表按页读取，滚动到底部时再读取下一页。
+    """
+    
+    PAGE_SIZE = 50
+    
+    def __init__(self, history):
+        super().__init__()
+        self.setWindowTitle("翻译历史")
+        self.resize(560, 480)
+        self.history = history
+        self.selected_id = None
+        self.last_id = None
+        self.exhausted = False
+        
+        self.layout = QVBoxLayout(self)
+        
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("搜索原文或译文...")
+        self.layout.addWidget(self.search_edit)
+        
+        # 停止输入后再搜索
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.refresh)
+        self.search_edit.textChanged.connect(lambda: self.search_timer.start(200))
+        
+        self.result_list = QListWidget()
+        self.result_list.itemDoubleClicked.connect(self.open_selected)
+        self.result_list.verticalScrollBar().valueChanged.connect(self.on_scrolled)
+        self.layout.addWidget(self.result_list)
+        
+        self.button_layout = QHBoxLayout()
+        self.summary_label = QLabel()
+        self.button_layout.addWidget(self.summary_label)
+        self.delete_button = QPushButton("删除")
+        self.delete_button.clicked.connect(self.delete_selected)
+        self.button_layout.addWidget(self.delete_button)
+        self.open_button = QPushButton("打开")
+        self.open_button.clicked.connect(self.open_selected)
+        self.button_layout.addWidget(self.open_button)
+        self.close_button = QPushButton("关闭")
+        self.close_button.clicked.connect(self.reject)
+        self.button_layout.addWidget(self.close_button)
+        self.layout.addLayout(self.button_layout)
+        
+        self.refresh()
+    
+    def refresh(self):
+        """按搜索内容重新读取第一页"""
+        self.result_list.clear()
+        self.last_id = None
+        self.exhausted = False
+        self.load_more()
+        self.summary_label.setText(f"共 {self.history.count(self.search_edit.text())} 条")
+    
+    def load_more(self):
+        """读取下一页"""
+        if self.exhausted:
+            return
+        
+        rows = self.history.page(self.search_edit.text(), self.last_id, self.PAGE_SIZE)
+        self.exhausted = len(rows) < self.PAGE_SIZE
+        for row in rows:
+            created = time.strftime("%m-%d %H:%M", time.localtime(row["created"]))
+            source = " ".join(row["input_preview"].split())
+            translation = " ".join(row["translation_preview"].split())
+            item = QListWidgetItem(f"{created}  [{row['target_language']}]  {source}\n    {translation}")
+            item.setData(Qt.ItemDataRole.UserRole, row["id"])
+            self.result_list.addItem(item)
+            self.last_id = row["id"]
+    
+    def on_scrolled(self, value):
+        """滚动到底部时读取下一页"""
+        if value >= self.result_list.verticalScrollBar().maximum():
+            self.load_more()
+    
+    def open_selected(self, *args):
+        """打开选中的记录"""
+        item = self.result_list.currentItem()
+        if item is None:
+            return
+        self.selected_id = item.data(Qt.ItemDataRole.UserRole)
+        self.accept()
+    
+    def delete_selected(self):
+        """删除选中的记录"""
+        item = self.result_list.currentItem()
+        if item is None:
+            return
+        self.history.delete(item.data(Qt.ItemDataRole.UserRole))
+        self.result_list.takeItem(self.result_list.row(item))
+        self.summary_label.setText(f"共 {self.history.count(self.search_edit.text())} 条")
+
+
+class VocabularyDialog(QDialog):
+    """生词本对话框，搜索收集的单词并标记已掌握的单词"""
+    
+    # 列表最多显示的条目数
+    RESULT_LIMIT = 200
+    
+    def __init__(self, translation_service, tts_controller=None):
+        super().__init__()
+        self.setWindowTitle("生词本")
+        self.resize(520, 480)
+        self.translation_service = translation_service
+        self.store = translation_service.vocabulary_store
+        self.tts_controller = tts_controller
+        
+        self.layout = QVBoxLayout(self)
+        
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("搜索单词、释义或例句...")
+        self.search_edit.textChanged.connect(self.refresh)
+        self.layout.addWidget(self.search_edit)
+        
+        self.result_list = QListWidget()
+        self.result_list.currentItemChanged.connect(self.show_entry)
+        self.layout.addWidget(self.result_list)
+        
+        self.detail_text = QTextBrowser()
+        self.detail_text.setOpenLinks(False)
+        self.detail_text.anchorClicked.connect(self.on_word_clicked)
+        self.layout.addWidget(self.detail_text)
+        
+        self.button_layout = QHBoxLayout()
+        self.summary_label = QLabel()
+        self.button_layout.addWidget(self.summary_label)
+        self.known_button = QPushButton("标记为已掌握")
+        self.known_button.setEnabled(False)
+        self.known_button.clicked.connect(self.toggle_known)
+        self.button_layout.addWidget(self.known_button)
+        self.close_button = QPushButton("关闭")
+        self.close_button.clicked.connect(self.accept)
+        self.button_layout.addWidget(self.close_button)
+        self.layout.addLayout(self.button_layout)
+        
+        self.refresh()
+    
+    def refresh(self):
+        """按搜索内容刷新列表"""
+        self.result_list.clear()
+        for entry in self.store.search(self.search_edit.text(), self.RESULT_LIMIT):
+            label = entry["word"]
+            if entry["phonetic"]:
+                label += f"  /{entry['phonetic']}/"
+            label += f"  ×{entry['count']}"
+            if entry["known"]:
+                label += "  ✓"
+            item = QListWidgetItem(label)
+            item.setData(Qt.ItemDataRole.UserRole, entry["word"])
+            self.result_list.addItem(item)
+        
+        stats = self.store.stats()
+        self.summary_label.setText(f"共 {stats['entries']} 个单词，已掌握 {stats['known']} 个")
+        if self.result_list.count():
+            self.result_list.setCurrentRow(0)
+        else:
+            self.detail_text.clear()
+            self.known_button.setEnabled(False)
+    
+    def current_entry(self):
+        """当前选中的条目"""
+        item = self.result_list.currentItem()
+        if item is None:
+            return None
+        return self.store.get(item.data(Qt.ItemDataRole.UserRole))
+    
+    def show_entry(self, *args):
+        """显示选中单词的释义和例句"""
+        entry = self.current_entry()
+        if entry is None:
+            return
+        
+        detail = self.translation_service.format_vocabulary([entry], link_words=True)
+        detail += f"出现 {entry['count']} 次，最近一次 {time.strftime('%Y-%m-%d', time.localtime(entry['last_seen']))}"
+        self.detail_text.setMarkdown(detail)
+        self.known_button.setText("取消已掌握" if entry["known"] else "标记为已掌握")
+        self.known_button.setEnabled(True)
+    
+    def toggle_known(self):
+        """切换选中单词的已掌握状态"""
+        entry = self.current_entry()
+        if entry is None:
+            return
+        
+        row = self.result_list.currentRow()
+        self.store.set_known(entry["word"], not entry["known"])
+        self.refresh()
+        self.result_list.setCurrentRow(min(row, self.result_list.count() - 1))
+    
+    def on_word_clicked(self, url):
+        """点击单词时朗读"""
+        if url.scheme() == "tts" and self.tts_controller is not None:
+            self.tts_controller.stop_playback()
+            self.tts_controller.speak(unquote(url.path()))
+
+
 class LoongAITranslator(QMainWindow):
     """主窗口类"""
     
@@ -511,42 +5038,127 @@ class LoongAITranslator(QMainWindow):
         self.setWindowTitle(APP_NAME)
         self.setMinimumSize(900, 600)
         
-        # 初始化服务层
-        self.config_manager = ConfigManager()
-        self.translation_service = TranslationService(self.config_manager)
-        self.flomo_service = FlomoService(self.config_manager)
-        self.tts_service = TTSService()
-        
-        # 初始化控制层
-        self.hotkey_controller = HotkeyController(self.toggle_window)
-        
-        # 加载配置
-        self.config = self.config_manager.load_config()
-        
         # 设置主题
         self.setup_theme()
         
         # 设置UI
         self.setup_ui()
         
-        # 设置全局快捷键
-        self.setup_hotkey(self.config.get("hotkey", "ctrl+alt+t"))
-        
         # 初始化语言列表
         self.init_languages()
         
-        # 初始化翻译线程
-        self.translation_thread = None
+        # 初始化翻译任务
+        self.translation_task = None
+        self.translation_request_id = 0
+        # 已取消但尚未结束的任务，结束前保持引用
+        self.stale_tasks = set()
         
         # 初始化等待时间计时器
         self.wait_timer = QTimer()
         self.wait_timer.timeout.connect(self.update_wait_time)
         self.wait_seconds = 0
         self.is_translating = False
+        
+        # 停止输入一段时间后自动翻译，只翻译最后一次输入的文本
+        self.auto_translate_timer = QTimer()
+        self.auto_translate_timer.setSingleShot(True)
+        self.auto_translate_timer.timeout.connect(self.auto_translate)
+        self.input_text.textChanged.connect(self.on_input_changed)
+        self.last_requested_text = None
+        # 当前单语言翻译的目标语言，完成后记录逐句结果供增量翻译使用
+        self.last_target_language = None
+        
+        # 常驻托盘模式
+        self.tray_icon = None
+        self.last_warm_up = 0
+        # 服务就绪前收到的待翻译文本
+        self.pending_text = None
+        
+        # 服务在窗口首次绘制后再初始化，解密配置、创建TTS引擎等不再拖慢窗口显示
+        self.services_started = False
+        self.services_ready = False
+        self.set_services_enabled(False)
+    
+    def paintEvent(self, event):
+        """首次绘制后开始初始化服务"""
+        super().paintEvent(event)
+        if not self.services_started:
+            self.services_started = True
+            STARTUP_PROFILER.mark("窗口显示")
+            QTimer.singleShot(0, self.init_services)
+    
+    def set_services_enabled(self, enabled):
+        """启用或禁用依赖服务的按钮"""
+        for button in (self.translate_button, self.read_button, self.save_to_flomo_button,
+                       self.history_button, self.vocabulary_button, self.settings_button):
+            button.setEnabled(enabled)
+        if not enabled:
+            self.statusBar().showMessage("正在初始化...")
+    
+    def init_services(self):
+        """初始化服务层和控制层"""
+        self.services_started = True
+        if self.services_ready:
+            return
+        
+        # 初始化服务层
+        with STARTUP_PROFILER.phase("加载配置"):
+            self.config_manager = ConfigManager()
+            # 加载配置
+            self.config = self.config_manager.load_config()
+        
+        with STARTUP_PROFILER.phase("初始化服务"):
+            self.init_service_layer()
+        
+        with STARTUP_PROFILER.phase("初始化控制器"):
+            self.init_controller_layer()
+        
+        self.services_ready = True
+        self.set_services_enabled(True)
+        self.statusBar().clearMessage()
+        STARTUP_PROFILER.mark("服务就绪")
+        
+        self.warm_up_connections()
+        if self.pending_text:
+            text, self.pending_text = self.pending_text, None
+            self.translate_text(text)
+    
+    def init_service_layer(self):
+        """创建各功能服务"""
+        self.translation_service = TranslationService(self.config_manager)
+        self.document_service = DocumentTranslationService(self.translation_service)
+        self.incremental_service = IncrementalTranslationService(self.translation_service)
+        self.history = TranslationHistory(max_entries=int(self.config.get("history_max_entries", 20000)))
+        self.multi_service = MultiTranslationService(self.translation_service, self.document_service)
+        self.flomo_service = FlomoService(self.config_manager)
+        self.audio_cache = AudioCache(max_bytes=int(self.config.get("tts_cache_max_mb", 50)) * 1024 * 1024)
+        
+        # 在后台构建翻译记忆库索引和术语表自动机
+        engine = AsyncEngine.instance()
+        engine.submit(engine.run_blocking(self.translation_service.memory.load))
+        engine.submit(engine.run_blocking(self.translation_service.glossary.load))
+    
+    def init_controller_layer(self):
+        """创建各控制器并连接信号"""
+        self.tts_controller = TTSController(self.audio_cache)
+        self.tts_controller.playback_started.connect(self.on_playback_started)
+        self.tts_controller.playback_progress.connect(self.on_playback_progress)
+        self.tts_controller.playback_finished.connect(self.on_playback_finished)
+        self.tts_controller.playback_error.connect(self.on_playback_error)
+        self.tts_controller.start()
+        QApplication.instance().aboutToQuit.connect(self.tts_controller.shutdown)
+        QApplication.instance().aboutToQuit.connect(self.translation_service.vocabulary_store.flush)
+        
+        self.hotkey_controller = HotkeyController(self.toggle_window, self.on_capture_hotkey)
+        self.flomo_sync = FlomoSyncController(self.flomo_service)
+        self.flomo_sync.status_changed.connect(self.on_flomo_status)
+        
+        # 设置全局快捷键
+        self.setup_hotkey(self.config.get("hotkey", "ctrl+alt+t"), self.config.get("capture_hotkey", ""))
     
     def setup_theme(self):
         """设置应用主题"""
-        is_dark = darkdetect.isDark()
+        is_dark = lazy_import("darkdetect").isDark()
         
         # 创建调色板
         palette = QPalette()
@@ -614,15 +5226,31 @@ class LoongAITranslator(QMainWindow):
         right_layout = QVBoxLayout(right_widget)
         
         # 语言选择
+        language_layout = QHBoxLayout()
         self.language_combo = QComboBox()
-        right_layout.addWidget(self.language_combo)
+        language_layout.addWidget(self.language_combo, 1)
+        
+        # 额外目标语言，选中后同时翻译为多个语言
+        self.extra_languages_button = QToolButton()
+        self.extra_languages_button.setText("多语言")
+        self.extra_languages_button.setPopupMode(QToolButton.ToolButtonPopupMode.InstantPopup)
+        self.extra_languages_menu = QMenu(self.extra_languages_button)
+        self.extra_languages_button.setMenu(self.extra_languages_menu)
+        language_layout.addWidget(self.extra_languages_button)
+        
+        right_layout.addLayout(language_layout)
         
         self.output_text = QTextEdit()
         self.output_text.setReadOnly(True)
         self.output_text.setPlaceholderText("翻译结果将显示在这里...")
         # 启用Markdown格式
         self.output_text.setAcceptRichText(True)
-        right_layout.addWidget(self.output_text)
+        
+        # 每个目标语言一个标签页，第一个为主语言
+        self.output_tabs = QTabWidget()
+        self.output_tabs.addTab(self.output_text, "译文")
+        self.extra_outputs = {}
+        right_layout.addWidget(self.output_tabs)
         
         self.read_button = QPushButton("🔊 朗读翻译")
         self.read_button.clicked.connect(self.read_translation)
@@ -645,14 +5273,24 @@ class LoongAITranslator(QMainWindow):
         self.save_to_flomo_button.clicked.connect(self.save_to_flomo)
         analysis_header_layout.addWidget(self.save_to_flomo_button)
         
+        self.history_button = QPushButton("🕘 历史")
+        self.history_button.clicked.connect(self.open_history)
+        analysis_header_layout.addWidget(self.history_button)
+        
+        self.vocabulary_button = QPushButton("📒 生词本")
+        self.vocabulary_button.clicked.connect(self.open_vocabulary)
+        analysis_header_layout.addWidget(self.vocabulary_button)
+        
         self.settings_button = QPushButton("⚙️ 设置")
         self.settings_button.clicked.connect(self.open_settings)
         analysis_header_layout.addWidget(self.settings_button)
         
         bottom_layout.addLayout(analysis_header_layout)
         
-        self.analysis_text = QTextEdit()
-        self.analysis_text.setReadOnly(True)
+        # 单词显示为链接，点击即朗读
+        self.analysis_text = QTextBrowser()
+        self.analysis_text.setOpenLinks(False)
+        self.analysis_text.anchorClicked.connect(self.on_word_clicked)
         self.analysis_text.setPlaceholderText("重点词组将显示在这里...")
         # 启用Markdown格式
         self.analysis_text.setAcceptRichText(True)
@@ -673,19 +5311,147 @@ class LoongAITranslator(QMainWindow):
         self.language_combo.addItems(languages)
         # 默认选择英语
         self.language_combo.setCurrentText("英语")
+        
+        for language in languages:
+            action = self.extra_languages_menu.addAction(language)
+            action.setCheckable(True)
+    
+    def selected_target_languages(self):
+        """返回所选目标语言列表，主语言在前"""
+        primary = self.language_combo.currentText()
+        extras = [action.text() for action in self.extra_languages_menu.actions()
+                  if action.isChecked() and action.text() != primary]
+        return [primary] + extras
     
-    def setup_hotkey(self, hotkey):
+    def reset_output_tabs(self, target_languages):
+        """按目标语言重建译文标签页"""
+        while self.output_tabs.count() > 1:
+            widget = self.output_tabs.widget(1)
+            self.output_tabs.removeTab(1)
+            widget.deleteLater()
+        self.extra_outputs = {}
+        
+        self.output_tabs.setTabText(0, target_languages[0])
+        for language in target_languages[1:]:
+            output = QTextEdit()
+            output.setReadOnly(True)
+            output.setAcceptRichText(True)
+            output.setMarkdown("等待中...")
+            self.output_tabs.addTab(output, language)
+            self.extra_outputs[language] = output
+        self.output_tabs.setCurrentIndex(0)
+    
+    def setup_hotkey(self, hotkey, capture_hotkey=""):
         """设置全局快捷键"""
-        self.hotkey_controller.setup_hotkey(hotkey)
+        self.hotkey_controller.setup_hotkey(hotkey, capture_hotkey)
+    
+    def on_capture_hotkey(self):
+        """划词翻译热键：等待复制完成后翻译选中的文本"""
+        QTimer.singleShot(CAPTURE_DELAY_MS, self.translate_clipboard)
+    
+    def translate_clipboard(self):
+        """翻译剪贴板中的文本，支持主选区的平台优先使用选中的文本"""
+        clipboard = QApplication.clipboard()
+        text = ""
+        if clipboard.supportsSelection():
+            text = clipboard.text(clipboard.Mode.Selection).strip()
+        if not text:
+            text = clipboard.text().strip()
+        
+        self.summon()
+        if text:
+            self.translate_text(text)
+    
+    def on_input_changed(self):
+        """输入变化时重新开始自动翻译计时"""
+        if not self.services_ready or not self.config.get("auto_translate", False):
+            return
+        self.auto_translate_timer.start(int(self.config.get("auto_translate_delay_ms", 800)))
+    
+    def auto_translate(self):
+        """停止输入后自动翻译，文本未变化时不重复请求"""
+        input_text = self.input_text.toPlainText().strip()
+        if not input_text or input_text == self.last_requested_text:
+            return
+        # 开始新的翻译时会取消仍在进行的旧请求
+        self.start_translation()
     
     def toggle_window(self):
         """切换窗口显示/隐藏"""
         if self.isVisible():
             self.hide()
         else:
-            self.show()
-            self.activateWindow()
-            self.input_text.setFocus()
+            self.summon()
+    
+    def summon(self):
+        """显示并激活窗口"""
+        self.show()
+        self.raise_()
+        self.activateWindow()
+        self.input_text.setFocus()
+        self.warm_up_connections()
+    
+    def setup_tray(self):
+        """常驻托盘模式：关闭窗口时只隐藏，通过托盘图标或快捷键唤出"""
+        icon = self.windowIcon()
+        if icon.isNull():
+            icon = self.style().standardIcon(QStyle.StandardPixmap.SP_ComputerIcon)
+        
+        menu = QMenu(self)
+        menu.addAction("显示/隐藏", self.toggle_window)
+        menu.addSeparator()
+        menu.addAction("退出", QApplication.instance().quit)
+        
+        self.tray_icon = QSystemTrayIcon(icon, self)
+        self.tray_icon.setToolTip(APP_NAME)
+        self.tray_icon.setContextMenu(menu)
+        self.tray_icon.activated.connect(self.on_tray_activated)
+        self.tray_icon.show()
+        QApplication.instance().setQuitOnLastWindowClosed(False)
+    
+    def prewarm(self):
+        """在后台预先完成窗口和服务的初始化，唤出时无需等待"""
+        # 创建原生窗口并完成布局
+        self.winId()
+        self.ensurePolished()
+        self.centralWidget().layout().activate()
+        self.init_services()
+    
+    def warm_up_connections(self):
+        """在后台预热到翻译API的连接，短时间内不重复预热"""
+        if not self.services_ready or time.monotonic() - self.last_warm_up < WARM_UP_INTERVAL:
+            return
+        self.last_warm_up = time.monotonic()
+        engine = AsyncEngine.instance()
+        engine.submit(engine.run_blocking(self.translation_service.warm_up))
+    
+    def on_tray_activated(self, reason):
+        """单击托盘图标切换窗口"""
+        if reason == QSystemTrayIcon.ActivationReason.Trigger:
+            self.toggle_window()
+    
+    def closeEvent(self, event):
+        """常驻模式下关闭窗口只隐藏"""
+        if self.tray_icon is not None:
+            event.ignore()
+            self.hide()
+        else:
+            super().closeEvent(event)
+    
+    def handle_instance_args(self, args):
+        """处理再次启动时转发来的参数：唤出窗口，有文本时直接翻译"""
+        options = parse_startup_args([sys.argv[0]] + args)
+        self.summon()
+        if options["text"]:
+            self.translate_text(options["text"])
+    
+    def translate_text(self, text):
+        """填入文本并开始翻译，服务未就绪时在就绪后翻译"""
+        if not self.services_ready:
+            self.pending_text = text
+            return
+        self.input_text.setPlainText(text)
+        self.start_translation()
     
     def toggle_translation(self):
         """切换翻译/停止状态"""
@@ -703,11 +5469,28 @@ class LoongAITranslator(QMainWindow):
             QMessageBox.warning(self, "警告", "请输入要翻译的文本")
             return
         
-        target_language = self.language_combo.currentText()
+        target_languages = self.selected_target_languages()
+        target_language = target_languages[0]
+        self.last_requested_text = input_text
+        self.last_target_language = target_language if len(target_languages) == 1 else None
+        self.auto_translate_timer.stop()
+        
+        # 如果已有翻译任务在运行，先停止并恢复界面状态（命中缓存时不会再启动新任务）
+        self.stop_translation()
+        self.reset_output_tabs(target_languages)
         
-        # 如果已有翻译线程在运行，先停止
-        if self.translation_thread and self.translation_thread.isRunning():
-            self.translation_thread.stop()
+        # 命中缓存时直接显示结果，无需启动翻译任务
+        incremental_plan = None
+        if len(target_languages) == 1:
+            cached = self.translation_service.lookup_cache(input_text, target_language)
+            # 记忆库索引在后台构建完成前不查询，避免阻塞界面
+            if cached is None and self.translation_service.memory.loaded:
+                cached = self.translation_service.lookup_memory(input_text, target_language)
+            if cached is not None:
+                self.on_translation_complete(cached)
+                return
+            # 与上次翻译相比只改动了少量句子时，只重新翻译这些句子
+            incremental_plan = self.incremental_service.plan(input_text, target_language)
         
         # 保存原始占位符文本
         original_placeholder = self.output_text.placeholderText()
@@ -723,21 +5506,68 @@ class LoongAITranslator(QMainWindow):
         # 启动等待时间计时器
         self.wait_timer.start(1000)  # 每秒更新一次
         
-        # 创建并启动翻译线程
-        self.translation_thread = TranslationController(
-            self.translation_service, 
-            input_text, 
-            target_language
-        )
-        self.translation_thread.translation_complete.connect(self.on_translation_complete)
-        self.translation_thread.translation_error.connect(self.on_translation_error)
-        self.translation_thread.finished.connect(self.on_translation_finished)
-        self.translation_thread.start()
+        # 创建并启动翻译任务，多语言并发翻译，长文档分块并发翻译
+        self.translation_request_id += 1
+        if len(target_languages) > 1:
+            self.translation_task = MultiTranslationController(
+                self.multi_service,
+                input_text,
+                target_languages,
+                request_id=self.translation_request_id
+            )
+            self.translation_task.language_complete.connect(self.on_language_complete)
+        elif incremental_plan is not None:
+            self.translation_task = IncrementalTranslationController(
+                self.incremental_service,
+                input_text,
+                target_language,
+                incremental_plan,
+                request_id=self.translation_request_id
+            )
+        elif self.document_service.needs_chunking(input_text):
+            self.translation_task = DocumentTranslationController(
+                self.document_service,
+                input_text,
+                target_language,
+                request_id=self.translation_request_id
+            )
+            self.translation_task.chunk_progress.connect(self.on_chunk_progress)
+        else:
+            self.translation_task = TranslationController(
+                self.translation_service, 
+                input_text, 
+                target_language,
+                use_cache=False,
+                request_id=self.translation_request_id
+            )
+        if isinstance(self.translation_task, MultiTranslationController):
+            self.translation_task.translation_complete.connect(self.on_fanout_complete)
+        else:
+            self.translation_task.translation_complete.connect(self.on_translation_complete)
+        self.translation_task.translation_error.connect(self.on_translation_error)
+        self.translation_task.translation_partial.connect(self.on_translation_partial)
+        self.translation_task.vocabulary_partial.connect(self.on_vocabulary_partial)
+        self.translation_task.finished.connect(self.on_translation_finished)
+        self.translation_task.start()
+    
+    def cancel_translation_task(self):
+        """取消当前翻译任务（不等待其结束）"""
+        task = self.translation_task
+        if task and task.isRunning():
+            task.stop()
+            self.stale_tasks.add(task)
+        self.translation_task = None
+        self.translation_request_id += 1
+    
+    def is_stale_signal(self, sender=None):
+        """判断当前信号是否来自已被取消或取代的翻译任务"""
+        sender = sender or self.sender()
+        return (isinstance(sender, TranslationController)
+                and sender.request_id != self.translation_request_id)
     
     def stop_translation(self):
         """停止翻译"""
-        if self.translation_thread and self.translation_thread.isRunning():
-            self.translation_thread.stop()
+        self.cancel_translation_task()
         
         # 停止等待时间计时器
         self.wait_timer.stop()
@@ -749,20 +5579,149 @@ class LoongAITranslator(QMainWindow):
         self.translate_button.setText("翻译")
         self.is_translating = False
     
+    def on_translation_partial(self, text):
+        """流式翻译部分结果处理"""
+        if self.is_stale_signal():
+            return
+        
+        # 收到首段内容后停止等待计时
+        if self.wait_timer.isActive():
+            self.wait_timer.stop()
+            self.statusBar().showMessage("正在接收翻译结果...")
+        
+        self.output_text.setMarkdown(text)
+    
+    def on_chunk_progress(self, done, total):
+        """长文档分块进度处理"""
+        if self.is_stale_signal():
+            return
+        
+        self.wait_timer.stop()
+        self.statusBar().showMessage(f"正在翻译长文档：已完成 {done}/{total} 段")
+    
+    def on_vocabulary_partial(self, analysis):
+        """流式词汇分析部分结果处理"""
+        if self.is_stale_signal():
+            return
+        
+        self.analysis_text.setMarkdown(analysis)
+    
     def on_translation_complete(self, result):
         """翻译完成处理"""
+        if self.is_stale_signal():
+            return
+        
         # 显示翻译结果（使用Markdown格式）
         self.output_text.setMarkdown(result.get("translation", ""))
         
         # 显示分析结果（使用Markdown格式）
-        self.analysis_text.setMarkdown(result.get("analysis", ""))
+        self.show_analysis(result)
+        
+        if self.last_target_language and self.last_requested_text:
+            self.incremental_service.remember(self.last_requested_text, self.last_target_language,
+                                              result)
+            self.record_history(self.last_target_language, result)
+        
+        # 显示耗时指标
+        metrics = result.get("metrics", {})
+        if "changed_segments" in metrics:
+            self.statusBar().showMessage(
+                f"增量翻译：沿用 {metrics['reused_segments']} 句，重新翻译 {metrics['changed_segments']} 句，"
+                f"耗时 {metrics['total_time']:.2f}秒，"
+                f"输入 {metrics.get('prompt_tokens', 0)} / 输出 {metrics.get('completion_tokens', 0)} tokens"
+            )
+        elif metrics.get("chunks"):
+            self.statusBar().showMessage(
+                f"长文档共 {metrics['chunks']} 段，总耗时 {metrics['total_time']:.2f}秒"
+            )
+        elif metrics.get("history"):
+            created = time.strftime("%Y-%m-%d %H:%M", time.localtime(metrics["created"]))
+            self.statusBar().showMessage(f"来自翻译历史（{created}，{metrics['model'] or '未知模型'}）")
+        elif metrics.get("memory") == "template":
+            self.statusBar().showMessage("来自翻译记忆库（与已有翻译只有数字不同）")
+        elif metrics.get("cached"):
+            stats = self.translation_service.cache.stats()
+            self.statusBar().showMessage(
+                f"来自本地缓存（命中 {stats['hits']} 次，未命中 {stats['misses']} 次）"
+            )
+        elif metrics:
+            reference = ""
+            if metrics.get("memory_similarity"):
+                reference = f"，参考了相似度 {metrics['memory_similarity']:.0%} 的已有翻译"
+            self.statusBar().showMessage(
+                f"首字耗时 {metrics['time_to_first_token']:.2f}秒，总耗时 {metrics['total_time']:.2f}秒，"
+                f"输入 {metrics.get('prompt_tokens', 0)} / 输出 {metrics.get('completion_tokens', 0)} tokens"
+                f"（预估 {metrics.get('estimated_prompt_tokens', 0)} / "
+                f"{metrics.get('estimated_completion_tokens', 0)}）{reference}"
+            )
+        
+        # 附加术语表检查结果
+        if metrics.get("glossary_terms"):
+            violations = metrics.get("glossary_violations", [])
+            note = (f"；术语 {metrics['glossary_terms']} 条，未按术语表翻译：{'、'.join(violations)}"
+                    if violations else f"；术语 {metrics['glossary_terms']} 条均已按术语表翻译")
+            self.statusBar().showMessage(self.statusBar().currentMessage() + note)
+    
+    def show_analysis(self, result):
+        """显示词汇分析，并在后台预合成每个单词的朗读音频"""
+        vocabulary = result.get("vocabulary")
+        if vocabulary is None:
+            self.analysis_text.setMarkdown(result.get("analysis", ""))
+            return
+        
+        self.analysis_text.setMarkdown(
+            self.translation_service.format_vocabulary(vocabulary, link_words=True)
+        )
+        self.tts_controller.prerender(item.get("word", "") for item in vocabulary)
+    
+    def on_word_clicked(self, url):
+        """点击词汇时朗读该单词"""
+        if url.scheme() == "tts":
+            word = unquote(url.path())
+            self.tts_controller.stop_playback()
+            self.tts_controller.speak(word)
+    
+    def on_language_complete(self, language, result):
+        """多语言翻译中单个语言完成处理"""
+        if self.is_stale_signal():
+            return
+        
+        if language == self.output_tabs.tabText(0):
+            self.wait_timer.stop()
+            self.output_text.setMarkdown(result.get("translation", ""))
+            self.show_analysis(result)
+        elif language in self.extra_outputs:
+            self.extra_outputs[language].setMarkdown(result.get("translation", ""))
+        self.record_history(language, result)
+    
+    def on_fanout_complete(self, summary):
+        """多语言翻译全部完成处理"""
+        if self.is_stale_signal():
+            return
+        
+        metrics = summary.get("metrics", {})
+        strategy = "合并请求" if metrics.get("strategy") == "combined" else "并发请求"
+        self.statusBar().showMessage(
+            f"{metrics.get('languages', 0)} 种语言（{strategy}）总耗时 {metrics.get('total_time', 0):.2f}秒，"
+            f"输入 {metrics.get('prompt_tokens', 0)} tokens，输出 {metrics.get('completion_tokens', 0)} tokens"
+        )
     
     def on_translation_error(self, error_message):
         """翻译错误处理"""
+        if self.is_stale_signal():
+            return
+        
         QMessageBox.warning(self, "错误", error_message)
     
     def on_translation_finished(self):
-        """翻译线程结束处理"""
+        """翻译任务结束处理"""
+        sender = self.sender()
+        if sender in self.stale_tasks:
+            # 槽函数返回、信号处理完成后再释放已取消的控制器
+            QTimer.singleShot(0, lambda: self.stale_tasks.discard(sender))
+        if self.is_stale_signal(sender):
+            return
+        
         # 停止等待时间计时器
         self.wait_timer.stop()
         
@@ -776,17 +5735,37 @@ class LoongAITranslator(QMainWindow):
         self.output_text.setMarkdown(f"等待中... {self.wait_seconds}秒")
     
     def read_translation(self):
-        """朗读翻译结果"""
-        text = self.output_text.toPlainText().strip()
+        """朗读当前标签页的翻译结果，正在朗读时停止"""
+        if self.tts_controller.is_speaking:
+            self.tts_controller.stop_playback()
+            return
+        
+        text = self.output_tabs.currentWidget().toPlainText().strip()
         if not text:
             QMessageBox.warning(self, "警告", "没有可朗读的翻译结果")
             return
         
         try:
-            self.tts_service.read_text(text)
+            self.tts_controller.speak(text)
         except Exception as e:
             QMessageBox.warning(self, "错误", f"朗读失败: {str(e)}")
     
+    def on_playback_started(self):
+        """朗读开始处理"""
+        self.read_button.setText("⏹ 停止朗读")
+    
+    def on_playback_progress(self, index, total):
+        """朗读进度处理"""
+        self.statusBar().showMessage(f"正在朗读 {index}/{total}")
+    
+    def on_playback_finished(self):
+        """朗读结束处理"""
+        self.read_button.setText("🔊 朗读翻译")
+    
+    def on_playback_error(self, error_message):
+        """朗读错误处理"""
+        self.statusBar().showMessage(f"朗读失败: {error_message}")
+    
     def save_to_flomo(self):
         """保存到Flomo"""
         input_text = self.input_text.toPlainText().strip()
@@ -797,11 +5776,54 @@ class LoongAITranslator(QMainWindow):
             QMessageBox.warning(self, "警告", "请先进行翻译")
             return
         
-        try:
-            self.flomo_service.save_to_flomo(input_text, translation_text, analysis_text)
-            QMessageBox.information(self, "成功", "已保存到Flomo")
-        except Exception as e:
-            QMessageBox.warning(self, "错误", f"保存到Flomo失败: {str(e)}")
+        # 加入后台同步队列，同步结果显示在状态栏
+        if not self.flomo_sync.enqueue(input_text, translation_text, analysis_text):
+            self.statusBar().showMessage("相同的笔记已在Flomo同步队列中")
+    
+    def on_flomo_status(self, pending, message):
+        """Flomo同步状态处理"""
+        if pending:
+            message += f"（待同步 {pending} 条）"
+        self.statusBar().showMessage(message)
+    
+    def open_history(self):
+        """打开翻译历史，选中的记录直接显示，不重新请求"""
+        dialog = HistoryDialog(self.history)
+        if not dialog.exec() or dialog.selected_id is None:
+            return
+        
+        record = self.history.get(dialog.selected_id)
+        if record is None:
+            return
+        
+        # 取消进行中的翻译，填入原文时不触发自动翻译
+        self.stop_translation()
+        self.last_requested_text = record["input_text"]
+        self.last_target_language = record["target_language"]
+        self.input_text.setPlainText(record["input_text"])
+        self.auto_translate_timer.stop()
+        index = self.language_combo.findText(record["target_language"])
+        if index >= 0:
+            self.language_combo.setCurrentIndex(index)
+        self.reset_output_tabs([record["target_language"]])
+        
+        self.on_translation_complete(self.translation_service._build_result(
+            record, {"history": True, "created": record["created"], "model": record["model"]}
+        ))
+    
+    def record_history(self, target_language, result):
+        """将翻译结果写入翻译历史"""
+        metrics = result.get("metrics", {})
+        if metrics.get("history") or not self.last_requested_text or not result.get("translation"):
+            return
+        self.history.add(self.last_requested_text, target_language, result["translation"],
+                         result.get("vocabulary", []), metrics.get("total_time"),
+                         self.config.get("model", "gpt-3.5-turbo"))
+    
+    def open_vocabulary(self):
+        """打开生词本"""
+        dialog = VocabularyDialog(self.translation_service, self.tts_controller)
+        dialog.exec()
     
     def open_settings(self):
         """打开设置对话框"""
@@ -811,30 +5833,573 @@ class LoongAITranslator(QMainWindow):
             self.config = self.config_manager.load_config()
             
             # 更新全局快捷键
-            self.setup_hotkey(self.config.get("hotkey", "ctrl+alt+t"))
+            self.setup_hotkey(self.config.get("hotkey", "ctrl+alt+t"), self.config.get("capture_hotkey", ""))
+
+
+def run_translate_command(argv):
+    """命令行批量翻译，不创建界面
+    
+    python main.py translate [输入文件] --to 英语 --format jsonl --output 结果.jsonl -j 8
+    输出文件已存在时跳过其中已成功翻译的记录，中断后重新运行即可继续。
+    """
+    parser = argparse.ArgumentParser(prog="main.py translate",
+                                     description="批量翻译文件或标准输入，结果以JSONL输出")
+    parser.add_argument("input", nargs="?", default="-", help="输入文件，默认读取标准输入")
+    parser.add_argument("-t", "--to", dest="target_language", default="英语", help="目标语言，默认英语")
+    parser.add_argument("-f", "--format", dest="input_format", choices=("lines", "jsonl"),
+                        default="lines", help="输入格式：每行一条文本，或每行一个JSON对象")
+    parser.add_argument("-o", "--output", default="-", help="输出的JSONL文件，默认写到标准输出")
+    parser.add_argument("-j", "--concurrency", type=int, default=4, help="并发请求数，默认 4")
+    parser.add_argument("--no-resume", action="store_true", help="不跳过输出文件中已完成的记录")
+    parser.add_argument("--vocabulary", choices=PromptBuilder.VOCABULARY_MODES,
+                        help="词汇分析模式，none 为只翻译；默认使用设置中的配置")
+    args = parser.parse_args(argv)
+    
+    # 并发请求数超过默认线程数时扩大共享线程池
+    AsyncEngine.instance(max_workers=max(8, args.concurrency))
+    translation_service = TranslationService(ConfigManager())
+    translation_service.vocabulary_mode = args.vocabulary
+    batch_service = BatchTranslationService(translation_service)
+    
+    done = set()
+    output_mode = "w"
+    if args.output != "-" and os.path.exists(args.output) and not args.no_resume:
+        with open(args.output, "r+b") as f:
+            # 去掉中断时写了一半的最后一行
+            content = f.read()
+            f.truncate(content.rfind(b"\n") + 1)
+        with open(args.output, "r", encoding="utf-8") as f:
+            done = BatchTranslationService.completed_ids(f)
+        output_mode = "a"
+    
+    input_file = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    output_file = sys.stdout if args.output == "-" else open(args.output, output_mode, encoding="utf-8")
+    records = (record for record in BatchTranslationService.read_records(input_file, args.input_format)
+               if str(record["id"]) not in done)
+    
+    def write_result(output):
+        output_file.write(json.dumps(output, ensure_ascii=False) + "\n")
+        output_file.flush()
+    
+    cancel_token = CancelToken()
+    future = AsyncEngine.instance().submit(batch_service.translate_async(
+        records, args.target_language, args.concurrency, write_result, cancel_token
+    ))
+    try:
+        stats = future.result()
+    except KeyboardInterrupt:
+        cancel_token.cancel()
+        future.cancel()
+        print("已中断，重新运行相同命令可从中断处继续", file=sys.stderr)
+        return 130
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+        translation_service.vocabulary_store.flush()
+        HTTPSessionPool.close_all()
+        AsyncEngine.shutdown()
+    
+    if done:
+        print(f"跳过已完成的记录 {len(done)} 条", file=sys.stderr)
+    print(f"完成 {stats['succeeded']} 条，失败 {stats['failed']} 条，缓存命中 {stats['cached']} 条，"
+          f"耗时 {stats['elapsed']:.2f} 秒", file=sys.stderr)
+    print(f"吞吐量 {stats['records_per_second']:.2f} 条/秒，{stats['tokens_per_second']:.1f} tokens/秒，"
+          f"延迟 p50 {stats['latency_p50']:.2f} 秒，p95 {stats['latency_p95']:.2f} 秒", file=sys.stderr)
+    validation = TranslationAPI.validation_stats()
+    if validation["invalid"] or validation["locally_repaired"]:
+        print(f"无效输出 {validation['invalid']} 次（{validation['invalid_rate']:.1%}），"
+              f"本地修正 {validation['locally_repaired']} 次，修复重试 {validation['retries']} 次"
+              f"（{validation['retry_prompt_tokens'] + validation['retry_completion_tokens']} tokens），"
+              f"最终失败 {validation['failures']} 次", file=sys.stderr)
+    return 0 if stats["failed"] == 0 else 1
+
+
+def run_serve_command(argv):
+    """启动本地翻译服务器，不创建界面
+    
+    python main.py serve --port 8765 --max-concurrency 4
+    """
+    config = ConfigManager().load_config()
+    parser = argparse.ArgumentParser(prog="main.py serve", description="启动本地翻译服务器（仅本机访问）")
+    parser.add_argument("--host", default="127.0.0.1", choices=TranslationServer.LOCAL_HOSTS,
+                        help="监听地址，只允许本机地址")
+    parser.add_argument("--port", type=int, default=int(config.get("server_port", 8765)),
+                        help="监听端口，默认 8765")
+    parser.add_argument("--max-concurrency", type=int,
+                        default=int(config.get("server_max_concurrency", 4)),
+                        help="同时调用上游接口的最大请求数，默认 4")
+    args = parser.parse_args(argv)
+    
+    translation_service = TranslationService(ConfigManager())
+    server = TranslationServer(translation_service, args.host, args.port, args.max_concurrency)
+    print(f"翻译服务器已启动: {server.url}（Ctrl+C 停止）", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        translation_service.vocabulary_store.flush()
+        HTTPSessionPool.close_all()
+        AsyncEngine.shutdown()
+    return 0
+
+
+def benchmark_memory(sizes, queries, seed=0):
+    """翻译记忆库基准测试：按规模生成模板化语料，测量索引构建和查找耗时"""
+    rng = random.Random(seed)
+    syllables = ("ka", "lo", "mi", "ren", "sto", "va", "qu", "bel", "tor", "ne", "dra", "fi", "on", "sul")
+    words = sorted({"".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(5000)})
+    
+    def sentence():
+        number, day = rng.randint(1, 99999), rng.randint(1, 28)
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(6, 14)))
+        return f"{text} #{number} on {day} May.", f"译文 {number} {day}"
+    
+    def variant(text):
+        # 一半只改数字，一半替换一个词
+        if rng.random() < 0.5:
+            return TranslationMemory.NUMBER_PATTERN.sub(lambda m: str(rng.randint(1, 99999)), text)
+        tokens = text.split()
+        tokens[rng.randrange(len(tokens) - 3)] = rng.choice(words)
+        return " ".join(tokens)
+    
+    results = []
+    for size in sizes:
+        records = [(source, "中文", translation, []) for source, translation in
+                   (sentence() for _ in range(size))]
+        memory = TranslationMemory(":memory:", max_entries=size)
+        memory.add_many(records)
+        
+        # 重新由数据库构建索引，单独计时
+        memory.entries, memory.exact, memory.buckets, memory.loaded = {}, {}, {}, False
+        start = time.perf_counter()
+        memory.load()
+        build_time = time.perf_counter() - start
+        
+        samples = [variant(rng.choice(records)[0]) for _ in range(queries // 2)]
+        samples += [f"Completely unrelated text number {i} about weather and travel plans."
+                    for i in range(queries - len(samples))]
+        latencies = []
+        counts = collections.Counter()
+        for text in samples:
+            start = time.perf_counter()
+            match = memory.lookup(text, "中文")
+            latencies.append(time.perf_counter() - start)
+            counts["miss" if match is None else "template" if match["template"] else "fuzzy"] += 1
+        
+        results.append({
+            "entries": memory.stats()["entries"],
+            "build_seconds": build_time,
+            "build_per_entry_us": build_time / size * 1e6,
+            "lookup_p50_ms": percentile(latencies, 0.5) * 1000,
+            "lookup_p95_ms": percentile(latencies, 0.95) * 1000,
+            "lookup_p99_ms": percentile(latencies, 0.99) * 1000,
+            "template": counts["template"],
+            "fuzzy": counts["fuzzy"],
+            "miss": counts["miss"]
+        })
+    return results
+
+
+def benchmark_glossary(sizes, chars, seed=0):
+    """术语表基准测试：按规模生成术语表和长文本，测量自动机构建和扫描耗时
+    
+    同时测量逐个术语做子串查找的耗时作为对照。
+    """
+    rng = random.Random(seed)
+    syllables = ("ka", "lo", "mi", "ren", "sto", "va", "qu", "bel", "tor", "ne", "dra", "fi", "on", "sul")
+    hanzi = "数据模型网络训练参数梯度向量矩阵优化损失函数样本特征标签推理部署"
+    
+    def word():
+        return "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+    
+    results = []
+    for size in sizes:
+        rows = {}
+        while len(rows) < size:
+            if rng.random() < 0.2:
+                term = "".join(rng.choice(hanzi) for _ in range(rng.randint(2, 5)))
+            else:
+                term = " ".join(word() for _ in range(rng.randint(1, 3)))
+            rows[term] = [term, f"术语{len(rows)}"]
+        terms = list(rows)
+        
+        # 普通单词中按约 5% 的比例混入术语
+        parts = []
+        length = 0
+        while length < chars:
+            part = rng.choice(terms) if rng.random() < 0.05 else word()
+            parts.append(part)
+            length += len(part) + 1
+        text = " ".join(parts)
+        
+        glossary = Glossary(path="")
+        start = time.perf_counter()
+        glossary.build(rows.values())
+        build_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        entries = glossary.match(text, ["中文"])
+        scan_time = time.perf_counter() - start
+        
+        normalized = glossary.normalize(text)
+        start = time.perf_counter()
+        naive = [key for key in glossary.keys if key in normalized]
+        naive_time = time.perf_counter() - start
+        
+        results.append({
+            "terms": size,
+            "chars": len(text),
+            "states": glossary.stats()["states"],
+            "build_ms": build_time * 1000,
+            "scan_ms": scan_time * 1000,
+            "scan_mb_per_second": len(text.encode("utf-8")) / scan_time / 1e6,
+            "matched": len(entries),
+            "naive_ms": naive_time * 1000,
+            "naive_matched": len(naive)
+        })
+    return results
+
+
+def benchmark_http(requests_count, handshake_ms=0.0):
+    """HTTP连接池基准测试：向本地的假API发送翻译请求，比较复用共享会话与每次新建会话
+    
+    handshake_ms 模拟每个新连接的握手耗时（如远程端点的TLS握手），本机回环连接几乎没有此开销。
+    """
+    server_module = lazy_import("http.server")
+    content = json.dumps({"translation": "你好", "vocabulary": []}, ensure_ascii=False)
+    body = json.dumps({"choices": [{"message": {"content": content}}],
+                       "usage": {"prompt_tokens": 10, "completion_tokens": 5}}).encode("utf-8")
+    connections = [0]
+    
+    class FakeAPIHandler(server_module.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # 响应头和响应体分两次写入，不关闭 Nagle 算法时长连接上每次请求会多等待一次延迟确认
+        disable_nagle_algorithm = True
+        
+        def setup(self):
+            super().setup()
+            connections[0] += 1
+            if handshake_ms:
+                time.sleep(handshake_ms / 1000)
+        
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    httpd = server_module.ThreadingHTTPServer(("127.0.0.1", 0), FakeAPIHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    config = {"api_key": "bench", "rate_limit_per_minute": 0,
+              "api_endpoint": f"http://127.0.0.1:{httpd.server_address[1]}/v1/chat/completions"}
+    api = TranslationAPI(config)
+    
+    results = []
+    try:
+        for mode, reuse in (("每次新建会话", False), ("共享会话", True)):
+            HTTPSessionPool.close_all()
+            connections[0] = 0
+            latencies = []
+            for _ in range(requests_count):
+                if not reuse:
+                    HTTPSessionPool.close_all()
+                start = time.perf_counter()
+                api.translate("Hello", "中文")
+                latencies.append(time.perf_counter() - start)
+            results.append({
+                "mode": mode,
+                "requests": requests_count,
+                "connections": connections[0],
+                "mean_ms": sum(latencies) / len(latencies) * 1000,
+                "p50_ms": percentile(latencies, 0.5) * 1000,
+                "p95_ms": percentile(latencies, 0.95) * 1000
+            })
+    finally:
+        HTTPSessionPool.close_all()
+        httpd.shutdown()
+        httpd.server_close()
+    return results
+
+
+def benchmark_multi(languages, chars, rounds=3, latency_ms=300.0, token_ms=5.0, seed=0):
+    """多语言翻译基准测试：对本地的假API比较并发（每个语言一个请求）与合并提示词两种策略
+    
+    假API按提示词生成相应长度的译文和词汇分析，耗时为 latency_ms 加上每个输出token token_ms，
+    token 用量按与 estimate_tokens 相同的方法计算，因此两种策略的用量和发送前的估算可以直接比较。
+    """
+    server_module = lazy_import("http.server")
+    tempfile = lazy_import("tempfile")
+    rng = random.Random(seed)
+    syllables = ("ka", "lo", "mi", "ren", "sto", "va", "qu", "bel", "tor", "ne", "dra", "fi", "on", "sul")
+    words = []
+    while len(" ".join(words)) < chars:
+        words.append("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    input_text = " ".join(words) + "."
+    requests_count = [0]
+    
+    def completion(prompt):
+        """按提示词要求的语言和词汇规格生成模型输出"""
+        header = prompt.split("\n", 1)[0]
+        targets = re.search(r"翻译成(.+?)，", header).group(1).split("、")
+        translation = "译" * (int(estimate_tokens(input_text) * 1.3) + 10)
+        if "分别翻译成" in header:
+            result = {"translations": {language: translation for language in targets}}
+        else:
+            result = {"translation": translation}
+        plan = re.search(r"至多(\d+)个单词或词组，每个至多(\d+)个释义", prompt)
+        if plan:
+            meaning = {"definition": "释义" * 4}
+            if "并附例句" in prompt:
+                meaning["example"] = "An example sentence for this word."
+            result["vocabulary"] = [{"word": words[index], "phonetic": "/ˈwɜːd/",
+                                     "meanings": [meaning] * int(plan.group(2))}
+                                    for index in range(min(int(plan.group(1)), len(words)))]
+        return json.dumps(result, ensure_ascii=False)
+    
+    class FakeAPIHandler(server_module.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        
+        def do_POST(self):
+            requests_count[0] += 1
+            data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            prompt = data["messages"][0]["content"]
+            content = completion(prompt)
+            usage = {"prompt_tokens": estimate_tokens(prompt), "completion_tokens": estimate_tokens(content)}
+            time.sleep((latency_ms + usage["completion_tokens"] * token_ms) / 1000)
+            body = json.dumps({"choices": [{"message": {"content": content}}], "usage": usage}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    httpd = server_module.ThreadingHTTPServer(("127.0.0.1", 0), FakeAPIHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        # 独立的配置文件；关闭缓存、记忆库、生词本和术语表，不读写用户数据
+        config_manager = ConfigManager()
+        config_manager.config_file = os.path.join(directory, CONFIG_FILE)
+        config = {"api_key": "bench", "rate_limit_per_minute": 0, "cache_enabled": False,
+                  "memory_enabled": False, "vocabulary_store_enabled": False, "glossary_enabled": False,
+                  "api_endpoint": f"http://127.0.0.1:{httpd.server_address[1]}/v1/chat/completions"}
+        config_manager.save_config(config)
+        translation_service = TranslationService(config_manager)
+        multi_service = MultiTranslationService(translation_service,
+                                                DocumentTranslationService(translation_service))
+        try:
+            for strategy in ("concurrent", "combined"):
+                config_manager.save_config(dict(config, fanout_strategy=strategy))
+                requests_count[0] = 0
+                totals, firsts, metrics = [], [], []
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    first = []
+                    
+                    def on_result(language, result):
+                        if not first:
+                            first.append(time.perf_counter() - start)
+                    
+                    result = multi_service.translate(input_text, languages, on_result=on_result)
+                    totals.append(result["metrics"]["total_time"])
+                    firsts.append(first[0])
+                    metrics.append(result["metrics"])
+                results.append({
+                    "strategy": strategy,
+                    "languages": len(languages),
+                    "requests": requests_count[0] / rounds,
+                    "first_ms": sum(firsts) / rounds * 1000,
+                    "total_ms": sum(totals) / rounds * 1000,
+                    "prompt_tokens": sum(m["prompt_tokens"] for m in metrics) / rounds,
+                    "completion_tokens": sum(m["completion_tokens"] for m in metrics) / rounds,
+                    "estimated_prompt_tokens": sum(m["estimated_prompt_tokens"] for m in metrics) / rounds,
+                    "estimated_completion_tokens": sum(m["estimated_completion_tokens"]
+                                                       for m in metrics) / rounds
+                })
+        finally:
+            HTTPSessionPool.close_all()
+            httpd.shutdown()
+            httpd.server_close()
+    return results
+
+
+def run_bench_command(argv):
+    """运行基准测试，不创建界面
+    
+    python main.py bench memory --sizes 10000 100000
+    python main.py bench glossary --sizes 1000 10000 --chars 100000
+    python main.py bench http --requests 200 --handshake-ms 20
+    python main.py bench multi --languages 英语 日语 法语 --chars 400
+    """
+    parser = argparse.ArgumentParser(prog="main.py bench", description="基准测试")
+    subparsers = parser.add_subparsers(dest="target", required=True)
+    memory_parser = subparsers.add_parser("memory", help="翻译记忆库的索引构建和查找")
+    memory_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+                               help="记忆库条目数，默认 10000 100000")
+    memory_parser.add_argument("--queries", type=int, default=1000, help="查找次数，默认 1000")
+    glossary_parser = subparsers.add_parser("glossary", help="术语表的自动机构建和原文扫描")
+    glossary_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                                 help="术语条目数，默认 1000 10000")
+    glossary_parser.add_argument("--chars", type=int, default=100000,
+                                 help="扫描的原文字符数，默认 100000")
+    http_parser = subparsers.add_parser("http", help="连接池对本地假API的请求延迟")
+    http_parser.add_argument("--requests", type=int, default=200, help="每种方式的请求数，默认 200")
+    http_parser.add_argument("--handshake-ms", type=float, default=0.0,
+                             help="模拟每个新连接的握手耗时（毫秒），默认 0")
+    multi_parser = subparsers.add_parser("multi", help="多语言翻译的并发与合并提示词策略")
+    multi_parser.add_argument("--languages", nargs="+", default=["英语", "日语", "法语"],
+                              help="目标语言，默认 英语 日语 法语")
+    multi_parser.add_argument("--chars", type=int, default=400, help="原文字符数，默认 400")
+    multi_parser.add_argument("--rounds", type=int, default=3, help="每种策略的翻译次数，默认 3")
+    multi_parser.add_argument("--latency-ms", type=float, default=300.0,
+                              help="假API每个请求的固定耗时（毫秒），默认 300")
+    multi_parser.add_argument("--token-ms", type=float, default=5.0,
+                              help="假API每个输出token的耗时（毫秒），默认 5")
+    args = parser.parse_args(argv)
+    
+    if args.target == "memory":
+        for row in benchmark_memory(args.sizes, args.queries):
+            print(f"{row['entries']} 条：构建索引 {row['build_seconds']:.2f} 秒（每条 {row['build_per_entry_us']:.1f} 微秒），"
+                  f"查找 p50 {row['lookup_p50_ms']:.3f} 毫秒，p95 {row['lookup_p95_ms']:.3f} 毫秒，"
+                  f"p99 {row['lookup_p99_ms']:.3f} 毫秒；套用 {row['template']} 次，"
+                  f"相似 {row['fuzzy']} 次，未命中 {row['miss']} 次")
+    elif args.target == "glossary":
+        for row in benchmark_glossary(args.sizes, args.chars):
+            print(f"{row['terms']} 条术语（{row['states']} 个状态）：构建 {row['build_ms']:.1f} 毫秒；"
+                  f"扫描 {row['chars']} 字符 {row['scan_ms']:.1f} 毫秒（{row['scan_mb_per_second']:.1f} MB/秒），"
+                  f"匹配 {row['matched']} 条；逐个术语子串查找 {row['naive_ms']:.1f} 毫秒")
+    elif args.target == "http":
+        for row in benchmark_http(args.requests, args.handshake_ms):
+            print(f"{row['mode']}：{row['requests']} 次请求建立 {row['connections']} 个连接，"
+                  f"平均 {row['mean_ms']:.2f} 毫秒，p50 {row['p50_ms']:.2f} 毫秒，p95 {row['p95_ms']:.2f} 毫秒")
+    elif args.target == "multi":
+        for row in benchmark_multi(args.languages, args.chars, args.rounds, args.latency_ms,
+                                   args.token_ms):
+            print(f"{row['strategy']}：{row['languages']} 个语言 {row['requests']:.0f} 次请求，"
+                  f"首个语言 {row['first_ms']:.0f} 毫秒，全部完成 {row['total_ms']:.0f} 毫秒；"
+                  f"输入 {row['prompt_tokens']:.0f} / 输出 {row['completion_tokens']:.0f} token"
+                  f"（估算 {row['estimated_prompt_tokens']:.0f} / {row['estimated_completion_tokens']:.0f}）")
+    return 0
+
+
+def parse_startup_args(argv):
+    """解析启动参数
+    
+    --tray                 常驻托盘模式，启动时不显示窗口
+    --profile-startup      服务就绪后输出启动耗时报告
+    --startup-budget MS    启动基准测试：窗口显示耗时超过 MS 毫秒时以非零状态退出
+    其余参数作为待翻译文本
+    """
+    options = {"tray": False, "profile": False, "budget_ms": None, "text": ""}
+    words = []
+    args = iter(argv[1:])
+    for arg in args:
+        if arg == "--tray":
+            options["tray"] = True
+        elif arg == "--profile-startup":
+            options["profile"] = True
+        elif arg == "--startup-budget":
+            options["budget_ms"] = float(next(args, "0"))
+        else:
+            words.append(arg)
+    options["text"] = " ".join(words).strip()
+    return options
+
+
+def finish_startup(app, options):
+    """服务就绪后输出启动耗时报告，基准测试模式下检查窗口显示耗时并退出"""
+    print(STARTUP_PROFILER.report(), file=sys.stderr)
+    
+    if options["budget_ms"] is not None:
+        shown_ms = STARTUP_PROFILER.elapsed_ms("窗口显示")
+        if shown_ms is None:
+            # 托盘模式下窗口不显示，以服务就绪时间为准
+            shown_ms = STARTUP_PROFILER.elapsed_ms("服务就绪")
+        passed = shown_ms <= options["budget_ms"]
+        print(f"窗口显示耗时 {shown_ms:.1f} ms，预算 {options['budget_ms']:.0f} ms："
+              f"{'通过' if passed else '超出预算'}", file=sys.stderr)
+        app.exit(0 if passed else 1)
 
 
 if __name__ == "__main__":
-    # 修复中文显示问题
-    import matplotlib
-    matplotlib.use('Agg')
+    # 命令行批量翻译，不启动界面
+    if len(sys.argv) > 1 and sys.argv[1] == "translate":
+        sys.exit(run_translate_command(sys.argv[2:]))
+    # 本地翻译服务器
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        sys.exit(run_serve_command(sys.argv[2:]))
+    # 基准测试
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        sys.exit(run_bench_command(sys.argv[2:]))
     
     # 忽略libpng警告
     import warnings
     warnings.filterwarnings("ignore", category=UserWarning, module="PIL")
     
     # 忽略requests的SSL警告
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    warnings.filterwarnings("ignore", message="Unverified HTTPS request")
     
+    startup_options = parse_startup_args(sys.argv)
     app = QApplication(sys.argv)
     
+    # 启动基准测试必须测量本进程，已有实例在运行时不转发参数，以非零状态退出
+    if startup_options["budget_ms"] is not None and SingleInstanceController.is_running():
+        print("已有实例在运行，无法进行启动基准测试，请先退出该实例", file=sys.stderr)
+        sys.exit(2)
+    
+    # 已有实例在运行时把参数交给它处理
+    if SingleInstanceController.forward(sys.argv[1:]):
+        sys.exit(0)
+    
+    app.aboutToQuit.connect(AsyncEngine.shutdown)
+    app.aboutToQuit.connect(HTTPSessionPool.close_all)
+    
     # 设置应用字体
     font = QFont()
     font.setFamily("Microsoft YaHei")
     app.setFont(font)
     
-    window = LoongAITranslator()
-    window.show()
+    with STARTUP_PROFILER.phase("创建主窗口"):
+        window = LoongAITranslator()
+    
+    single_instance = SingleInstanceController()
+    single_instance.message_received.connect(window.handle_instance_args)
+    single_instance.listen()
+    
+    if startup_options["tray"]:
+        # 窗口不显示，事件循环启动后立即在后台完成初始化
+        window.setup_tray()
+        QTimer.singleShot(0, window.prewarm)
+    else:
+        window.show()
+    if startup_options["text"]:
+        window.handle_instance_args(sys.argv[1:])
+    
+    if startup_options["profile"] or startup_options["budget_ms"] is not None:
+        # 等待服务就绪（首次绘制之后）再输出报告
+        def check_startup():
+            if window.services_ready:
+                finish_startup(app, startup_options)
+            else:
+                QTimer.singleShot(10, check_startup)
+        QTimer.singleShot(0, check_startup)
     
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""取消翻译时立即中断请求，并丢弃已取消任务的结果"""
+
+import http.server
+import json
+import threading
+import time
+
+import pytest
+from PyQt6.QtCore import QCoreApplication
+
+import main
+
+# 服务端故意拖延的时间，远大于取消应当花费的时间
+STALL = 3.0
+
+
+class StallingHandler(http.server.BaseHTTPRequestHandler):
+    """在发送响应头之前或在流式输出中途停顿的假API，按分块传输发送SSE"""
+
+    protocol_version = "HTTP/1.1"
+    phase = "headers"
+
+    def log_message(self, *args):
+        pass
+
+    def send_event(self, content):
+        data = json.dumps({"choices": [{"delta": {"content": content}}]})
+        body = f"data: {data}\n\n".encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(body), body))
+        self.wfile.flush()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.phase == "headers":
+            time.sleep(STALL)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.send_event('{"translation": "你好')
+            time.sleep(STALL)
+            self.send_event('", "vocabulary": []}')
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            # 客户端取消后已断开连接
+            self.close_connection = True
+
+
+@pytest.fixture(params=["headers", "stream"])
+def endpoint(request):
+    handler = type("Handler", (StallingHandler,), {"phase": request.param})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions", request.param
+    server.shutdown()
+    server.server_close()
+    main.HTTPSessionPool.close_all()
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch, endpoint):
+    monkeypatch.chdir(tmp_path)
+    config_manager = main.ConfigManager()
+    config = config_manager.load_config()
+    config.update(api_key="test", api_endpoint=endpoint[0], stream_mode=True,
+                  rate_limit_per_minute=0)
+    config_manager.save_config(config)
+    return main.TranslationService(config_manager)
+
+
+def cancel_when(token, ready, delay=0.3):
+    """ready() 为真后再等待 delay 秒取消，返回取消所用的时间"""
+    elapsed = []
+
+    def run():
+        while not ready():
+            time.sleep(0.01)
+        time.sleep(delay)
+        start = time.perf_counter()
+        token.cancel()
+        elapsed.append(time.perf_counter() - start)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, elapsed
+
+
+def test_cancel_token_interrupts_request(service, endpoint):
+    token = main.CancelToken()
+    partials = []
+    # 等待响应头时直接计时取消；流式输出时等收到第一段内容后再取消
+    ready = (lambda: True) if endpoint[1] == "headers" else (lambda: partials)
+    thread, elapsed = cancel_when(token, ready)
+
+    start = time.perf_counter()
+    with pytest.raises(main.TranslationCancelled):
+        service.translate("Hello", "中文", on_partial=partials.append, use_cache=False,
+                          cancel_token=token)
+    returned = time.perf_counter() - start
+    thread.join()
+
+    assert elapsed[0] < 0.05
+    assert returned < STALL / 2
+    if endpoint[1] == "stream":
+        assert partials
+
+
+def process_events_until(app, condition, timeout):
+    """处理Qt事件直到 condition() 为真或超时，控制器的信号从后台线程排队送达"""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    app.processEvents()
+    return condition()
+
+
+def test_controller_stop_returns_immediately_and_drops_result(service, endpoint):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    controller = main.TranslationController(service, "Hello", "中文", use_cache=False)
+    results, errors, partials = [], [], []
+    controller.translation_complete.connect(results.append)
+    controller.translation_error.connect(errors.append)
+    controller.translation_partial.connect(partials.append)
+    controller.start()
+
+    if endpoint[1] == "stream":
+        assert process_events_until(app, lambda: partials, STALL)
+    else:
+        process_events_until(app, lambda: False, 0.3)
+
+    start = time.perf_counter()
+    controller.stop()
+    assert time.perf_counter() - start < 0.05
+
+    # 任务很快结束，且之后不再送达结果或错误
+    assert process_events_until(app, lambda: not controller.isRunning(), STALL / 2)
+    process_events_until(app, lambda: False, 0.2)
+    assert results == [] and errors == []
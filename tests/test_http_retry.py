@@ -0,0 +1,67 @@
+"""POST 请求只在服务端带 Retry-After 的 429/503 时重发"""
+
+import http.server
+import threading
+
+import pytest
+
+import main
+
+
+class FailOnceHandler(http.server.BaseHTTPRequestHandler):
+    """第一次请求返回指定状态码，之后返回 200，并记录收到的请求数"""
+
+    protocol_version = "HTTP/1.1"
+    status = 502
+    retry_after = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests += 1
+        status = self.status if self.server.requests == 1 else 200
+        self.send_response(status)
+        if status != 200 and self.retry_after is not None:
+            self.send_header("Retry-After", self.retry_after)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@pytest.fixture
+def post():
+    servers = []
+
+    def post(status, retry_after=None):
+        handler = type("Handler", (FailOnceHandler,), {"status": status, "retry_after": retry_after})
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.requests = 0
+        servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+        session = main.HTTPSessionPool.get_session(url, config={"http_backoff_factor": 0})
+        response = session.post(url, json={}, timeout=5)
+        response.close()
+        return response.status_code, server.requests
+
+    yield post
+    main.HTTPSessionPool.close_all()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("status", [500, 502, 504])
+def test_gateway_errors_are_not_resent(post, status):
+    assert post(status, retry_after="0") == (status, 1)
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retry_after_is_honoured(post, status):
+    assert post(status, retry_after="0") == (200, 2)
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_no_retry_without_retry_after(post, status):
+    assert post(status) == (status, 1)
@@ -0,0 +1,53 @@
+"""本地翻译服务器拒绝来自网页的请求"""
+
+import http.client
+import json
+import threading
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    service = main.TranslationService(main.ConfigManager())
+    server = main.TranslationServer(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def post(server, headers, body=b'{"text": "Hello"}'):
+    port = server.httpd.server_address[1]
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    headers = dict({"Host": f"127.0.0.1:{port}"}, **headers)
+    conn.request("POST", "/translate", body=body, headers=headers)
+    response = conn.getresponse()
+    status, payload = response.status, json.loads(response.read())
+    conn.close()
+    return status, payload
+
+
+def test_rejects_non_json_content_type(server):
+    assert post(server, {"Content-Type": "text/plain"})[0] == 415
+
+
+def test_rejects_requests_with_origin(server):
+    headers = {"Content-Type": "application/json", "Origin": "https://example.com"}
+    assert post(server, headers)[0] == 403
+
+
+def test_rejects_foreign_host(server):
+    headers = {"Content-Type": "application/json", "Host": "attacker.example:80"}
+    assert post(server, headers)[0] == 403
+
+
+def test_invalid_payload_is_400_and_missing_api_key_is_500(server):
+    headers = {"Content-Type": "application/json"}
+    assert post(server, headers, b'{"text": ""}')[0] == 400
+    status, payload = post(server, headers)
+    assert status == 500
+    assert "API Key" in payload["error"]
@@ -0,0 +1,86 @@
+"""流式请求要求服务端返回实际用量，端点不支持 stream_options 时按估算"""
+
+import http.server
+import json
+import threading
+
+import pytest
+
+import main
+
+CONTENT = '{"translation": "你好", "vocabulary": []}'
+USAGE = {"prompt_tokens": 321, "completion_tokens": 54, "total_tokens": 375}
+
+
+class StreamHandler(http.server.BaseHTTPRequestHandler):
+    """SSE 假API：请求带 stream_options.include_usage 时在最后一个数据块返回用量"""
+
+    supports_stream_options = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self.server.requests.append(data)
+        if "stream_options" in data and not self.supports_stream_options:
+            body = json.dumps({"error": {"message": "Unrecognized request argument supplied: stream_options"}})
+            self.send_response(400)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode())
+            return
+
+        chunks = [{"choices": [{"delta": {"content": CONTENT}}], "usage": None}]
+        if data.get("stream_options", {}).get("include_usage"):
+            chunks.append({"choices": [], "usage": USAGE})
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+@pytest.fixture
+def endpoint():
+    servers = []
+
+    def endpoint(supports_stream_options):
+        handler = type("Handler", (StreamHandler,), {"supports_stream_options": supports_stream_options})
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.requests = []
+        servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+        api = main.TranslationAPI({"api_key": "test", "api_endpoint": url, "rate_limit_per_minute": 0})
+        return api, server.requests
+
+    yield endpoint
+    main.HTTPSessionPool.close_all()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stream_reports_actual_usage(endpoint):
+    api, requests = endpoint(True)
+    result = api.translate_stream("Hello", "中文")
+    assert requests[0]["stream_options"] == {"include_usage": True}
+    assert result["translation"] == "你好"
+    assert result["usage"]["prompt_tokens"] == USAGE["prompt_tokens"]
+    assert result["usage"]["completion_tokens"] == USAGE["completion_tokens"]
+    assert not result["usage"].get("estimated")
+
+
+def test_stream_falls_back_to_estimate_when_stream_options_rejected(endpoint):
+    api, requests = endpoint(False)
+    result = api.translate_stream("Hello", "中文")
+    assert "stream_options" in requests[0] and "stream_options" not in requests[1]
+    assert result["translation"] == "你好"
+    assert result["usage"]["estimated"]
+
+    # 之后对同一端点不再发送 stream_options
+    api.translate_stream("Hello", "中文")
+    assert len(requests) == 3
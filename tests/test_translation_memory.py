@@ -0,0 +1,34 @@
+"""翻译记忆库的套用规则"""
+
+import main
+
+
+def make_memory():
+    memory = main.TranslationMemory(":memory:")
+    memory.add("It is raining.", "中文", "下雨了。")
+    memory.add("Order 42 shipped on 3 May.", "中文", "订单 42 已于 5 月 3 日发货。")
+    return memory
+
+
+def test_punctuation_and_case_variants_are_not_templates():
+    memory = make_memory()
+    for text in ("It is raining?", "IT IS RAINING!", "it is raining."):
+        match = memory.lookup(text, "中文", threshold=0.7)
+        assert match is not None
+        assert not match["template"]
+
+
+def test_identical_text_without_numbers_is_not_a_template():
+    match = make_memory().lookup("It is raining.", "中文", threshold=1.0)
+    assert match is not None and not match["template"]
+
+
+def test_number_only_difference_is_a_template():
+    match = make_memory().lookup("Order 57 shipped on 3 May.", "中文", threshold=1.0)
+    assert match["template"]
+    assert match["translation"] == "订单 57 已于 5 月 3 日发货。"
+
+
+def test_number_variant_with_different_punctuation_is_not_a_template():
+    match = make_memory().lookup("Order 57 shipped on 3 May?", "中文", threshold=0.7)
+    assert match is not None and not match["template"]